@@ -0,0 +1,230 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from fastapi import FastAPI, File, HTTPException, UploadFile
+
+ML_DIR = Path(os.getenv("ML_DIR", Path(__file__).resolve().parents[1] / "ml"))
+sys.path.insert(0, str(ML_DIR))
+
+import cascade  # noqa: E402
+import preprocess  # noqa: E402
+from dataset_store import normalizar  # noqa: E402
+from model_registry import RegistroModelos  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = Path(os.getenv("MODELS_DIR", ML_DIR / "models"))
+MODEL_VERSION = os.getenv("MODEL_VERSION")
+HOT_SWAP_INTERVAL_S = float(os.getenv("HOT_SWAP_INTERVAL_S", "30"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "32"))
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS", "10"))
+SEGMENTACAO = os.getenv("SEGMENTACAO", "referencia")
+CASCATA_CONFIG = os.getenv("CASCATA_CONFIG")  # cascade.json do estágio 1; sem ele, todo lote vai ao modelo completo
+JANELA_LATENCIA = 10_000
+
+
+class Metricas:
+    """Contadores do serviço: histograma de tamanho de lote e janela de latências."""
+
+    def __init__(self) -> None:
+        self.tamanhos_lote: Counter = Counter()
+        self.latencias = deque(maxlen=JANELA_LATENCIA)
+        self.requisicoes = 0
+        self.erros = 0
+
+    def resumo(self, profundidade_fila: int) -> Dict[str, Any]:
+        latencias = np.array(self.latencias) * 1000.0
+        return {
+            "requisicoes": self.requisicoes,
+            "erros": self.erros,
+            "profundidade_fila": profundidade_fila,
+            "histograma_tamanho_lote": {str(k): v for k, v in sorted(self.tamanhos_lote.items())},
+            "latencia_ms": {
+                "p50": float(np.percentile(latencias, 50)) if len(latencias) else None,
+                "p99": float(np.percentile(latencias, 99)) if len(latencias) else None,
+            },
+        }
+
+
+class MicroBatcher:
+    """
+    Agrupa requisições concorrentes em lotes de até `max_batch` imagens,
+    esperando no máximo `max_wait_ms` após a primeira imagem do lote.
+    A predição roda em uma thread dedicada para não bloquear o event loop.
+    `prever` retorna (probabilidades, contexto); cada requisição recebe sua
+    linha de probabilidades junto com o contexto do lote (ex.: as classes).
+    """
+
+    def __init__(self, prever: Callable[[np.ndarray], Tuple[np.ndarray, Any]], max_batch: int,
+                 max_wait_ms: float, metricas: Metricas) -> None:
+        self.prever = prever
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.metricas = metricas
+        self.fila: asyncio.Queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predict")
+        self._tarefa: Optional[asyncio.Task] = None
+        self._lote_atual: list = []
+
+    def iniciar(self) -> None:
+        self._tarefa = asyncio.create_task(self._executar())
+
+    async def parar(self) -> None:
+        """Encerra o loop e falha as requisições ainda na fila ou no lote em andamento."""
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+        pendentes = list(self._lote_atual)
+        while not self.fila.empty():
+            pendentes.append(self.fila.get_nowait())
+        for _, futuro in pendentes:
+            if not futuro.done():
+                futuro.set_exception(RuntimeError("Serviço encerrando: requisição não processada"))
+        self._executor.shutdown(wait=False)
+
+    async def submeter(self, imagem: np.ndarray) -> Tuple[np.ndarray, Any]:
+        futuro = asyncio.get_running_loop().create_future()
+        await self.fila.put((imagem, futuro))
+        return await futuro
+
+    async def _coletar_lote(self) -> list:
+        # O lote fica visível ao parar() desde o primeiro item, mesmo incompleto.
+        lote = self._lote_atual = [await self.fila.get()]
+        loop = asyncio.get_running_loop()
+        prazo = loop.time() + self.max_wait
+        while len(lote) < self.max_batch:
+            restante = prazo - loop.time()
+            if restante <= 0:
+                break
+            try:
+                lote.append(await asyncio.wait_for(self.fila.get(), restante))
+            except asyncio.TimeoutError:
+                break
+        return lote
+
+    async def _executar(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = await self._coletar_lote()
+            self.metricas.tamanhos_lote[len(lote)] += 1
+            try:
+                entrada = normalizar(np.stack([imagem for imagem, _ in lote]))
+                probs, contexto = await loop.run_in_executor(self._executor, self.prever, entrada)
+            except Exception as e:
+                logger.error(f"Falha na predição do lote: {e}", exc_info=True)
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                continue
+            for (_, futuro), p in zip(lote, probs):
+                if not futuro.done():
+                    futuro.set_result((p, contexto))
+
+
+estado: Dict[str, Any] = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    registro = RegistroModelos(MODELS_DIR)
+    # Carrega e aquece o modelo (fixado ou o mais recente) antes de aceitar requisições.
+    modelo = registro.fixar(MODEL_VERSION) if MODEL_VERSION else registro.atual()
+    if not MODEL_VERSION and HOT_SWAP_INTERVAL_S > 0:
+        registro.iniciar_observador(HOT_SWAP_INTERVAL_S)
+
+    if modelo.classes is None:
+        raise RuntimeError(f"Modelo {modelo.versao} sem label_classes.json: as classes das saídas são desconhecidas")
+
+    cascata = cascade.Cascata.carregar(CASCATA_CONFIG) if CASCATA_CONFIG else None
+    if cascata is not None and cascata.classes and list(cascata.classes) != list(modelo.classes):
+        raise RuntimeError(f"Classes do estágio 1 ({cascata.classes}) diferem das do modelo ({modelo.classes})")
+
+    def prever(lote: np.ndarray) -> Tuple[np.ndarray, List[str]]:
+        # O modelo é lido uma vez por lote; um hot-swap só afeta os lotes seguintes.
+        atual = registro.atual()
+        if atual.classes is None:
+            # Um hot-swap pode trazer um artefato sem label_classes.json.
+            raise RuntimeError(f"Modelo {atual.versao} sem label_classes.json: as classes das saídas são desconhecidas")
+        if cascata is not None:
+            return cascata.prever(lote, atual.prever), atual.classes
+        return atual.prever(lote), atual.classes
+
+    metricas = Metricas()
+    batcher = MicroBatcher(prever, MAX_BATCH_SIZE, MAX_WAIT_MS, metricas)
+    batcher.iniciar()
+    estado.update(registro=registro, metricas=metricas, batcher=batcher, cascata=cascata)
+    logger.info(f"Modelo carregado: {modelo.versao} | max_batch={MAX_BATCH_SIZE} | max_wait_ms={MAX_WAIT_MS}")
+    if cascata is not None:
+        logger.info(f"Cascata ativa: {CASCATA_CONFIG} | limiar={cascata.limiar} | temperatura={cascata.temperatura}")
+    yield
+    await batcher.parar()
+    registro.parar()
+    estado.clear()
+
+
+app = FastAPI(title="IrisAI Inference Service", lifespan=lifespan)
+
+
+def _preprocessar_bytes(dados: bytes) -> np.ndarray:
+    imagem = cv2.imdecode(np.frombuffer(dados, np.uint8), cv2.IMREAD_COLOR)
+    if imagem is None:
+        raise ValueError("Arquivo não é uma imagem válida")
+    return preprocess.preprocessar_array(imagem, SEGMENTACAO)[0]
+
+
+@app.post("/predict")
+async def predict(file: UploadFile = File(...)) -> Dict[str, Any]:
+    metricas: Metricas = estado["metricas"]
+    inicio = time.perf_counter()
+    metricas.requisicoes += 1
+    dados = await file.read()
+    try:
+        imagem = await asyncio.get_running_loop().run_in_executor(None, _preprocessar_bytes, dados)
+    except ValueError as e:
+        metricas.erros += 1
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        probs, classes = await estado["batcher"].submeter(imagem)
+    except Exception as e:
+        metricas.erros += 1
+        raise HTTPException(status_code=500, detail=f"Falha na predição: {e}")
+    metricas.latencias.append(time.perf_counter() - inicio)
+
+    indice = int(np.argmax(probs))
+    return {
+        "classe": classes[indice],
+        "confianca": float(probs[indice]),
+        "probabilidades": {c: float(p) for c, p in zip(classes, probs)},
+    }
+
+
+@app.get("/health")
+async def health() -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "modelo": estado["registro"].atual().versao,
+        "profundidade_fila": estado["batcher"].fila.qsize(),
+    }
+
+
+@app.get("/metrics")
+async def metrics() -> Dict[str, Any]:
+    resumo = estado["metricas"].resumo(estado["batcher"].fila.qsize())
+    if estado.get("cascata") is not None:
+        resumo["cascata"] = estado["cascata"].resumo()
+    return resumo
@@ -0,0 +1,390 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+
+# Só CPU e sem logs do TensorFlow: a suíte precisa rodar igual em qualquer máquina Linux sem GPU.
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+import cv2
+import numpy as np
+
+import preprocess
+import dataset_store
+
+ML_DIR = Path(__file__).resolve().parent
+RESULTADOS_PATH = "data/benchmarks/resultados.json"
+VERSAO_RESULTADOS = 1
+RESOLUCOES_PADRAO = ("320x240", "640x480", "1280x960")
+CLASSES = ("inflamacao", "normal")
+GRUPOS = ("etapas", "dataset", "predicao", "inicializacao")
+MODULOS_PESADOS = ("tensorflow", "mlflow", "matplotlib", "sklearn")
+MODULOS_LEVES = ("cli", "preprocess", "dataset_store", "instrumentation", "mlflow_tracking", "model_registry",
+                 "export_tflite", "train", "distributed", "hyperparameter_search", "serving_export",
+                 "cascade", "distillation")
+LIMITE_INICIALIZACAO_S = 2.0
+IMAGENS_POR_RESOLUCAO = 8
+IMAGENS_DATASET = 64
+REPETICOES_PADRAO = 5
+TOLERANCIA_PADRAO = 0.25
+SEED = 42
+
+
+# ------------------------------------------------------------ dados sintéticos
+def imagem_sintetica(largura, altura, rng):
+    """
+    Imagem BGR com aparência de íris: fundo claro (esclera), disco texturizado
+    com fibras radiais, pupila escura e alguns reflexos especulares saturados.
+    O raio da íris fica na faixa do HOUGH_PARAMS para imagens de 640x480.
+    """
+    imagem = np.full((altura, largura, 3), rng.integers(170, 210), dtype=np.uint8)
+    imagem = cv2.add(imagem, rng.integers(0, 20, imagem.shape, dtype=np.uint8))
+
+    lado = min(largura, altura)
+    r_iris = int(lado * rng.uniform(0.17, 0.23))
+    r_pupila = int(r_iris * rng.uniform(0.3, 0.45))
+    cx = int(largura / 2 + rng.uniform(-0.1, 0.1) * lado)
+    cy = int(altura / 2 + rng.uniform(-0.1, 0.1) * lado)
+
+    cor = tuple(int(c) for c in rng.integers(30, 140, 3))
+    cv2.circle(imagem, (cx, cy), r_iris, cor, -1)
+    for angulo in rng.uniform(0, 2 * np.pi, 180):
+        tom = tuple(int(np.clip(c + rng.integers(-40, 40), 0, 255)) for c in cor)
+        fim = (int(cx + r_iris * np.cos(angulo)), int(cy + r_iris * np.sin(angulo)))
+        cv2.line(imagem, (cx, cy), fim, tom, max(1, lado // 240))
+    cv2.circle(imagem, (cx, cy), r_iris, (20, 20, 20), max(2, lado // 160))
+    cv2.circle(imagem, (cx, cy), r_pupila, (10, 10, 10), -1)
+
+    for _ in range(rng.integers(1, 4)):
+        dx, dy = rng.integers(-r_pupila, r_pupila + 1, 2)
+        cv2.circle(imagem, (cx + int(dx), cy + int(dy)), max(2, lado // 60), (255, 255, 255), -1)
+    return cv2.GaussianBlur(imagem, (3, 3), 0)
+
+
+def parse_resolucao(texto):
+    largura, altura = texto.lower().split("x")
+    return int(largura), int(altura)
+
+
+def gerar_raw(destino, n_imagens, resolucao, seed=SEED):
+    """Grava n_imagens JPEG sintéticas em destino/<classe>/, no layout de data/raw."""
+    rng = np.random.default_rng(seed)
+    for i in range(n_imagens):
+        classe = CLASSES[i % len(CLASSES)]
+        pasta = os.path.join(destino, classe)
+        os.makedirs(pasta, exist_ok=True)
+        cv2.imwrite(os.path.join(pasta, f"sintetica_{i:05d}.jpg"), imagem_sintetica(*resolucao, rng))
+
+
+# --------------------------------------------------------------------- medição
+def medir(funcao, repeticoes=REPETICOES_PADRAO, aquecimento=1, itens=1):
+    """
+    Executa `funcao` `aquecimento` vezes sem medir e depois `repeticoes` vezes.
+    Os tempos são divididos por `itens` (ex.: segundos por imagem).
+    """
+    for _ in range(aquecimento):
+        funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) / itens)
+    tempos = np.array(tempos)
+    return {
+        "mediana_s": float(np.median(tempos)),
+        "media_s": float(tempos.mean()),
+        "min_s": float(tempos.min()),
+        "p95_s": float(np.percentile(tempos, 95)),
+        "repeticoes": repeticoes,
+        "itens": itens,
+    }
+
+
+@contextmanager
+def _em_diretorio(caminho):
+    # Os caminhos de preprocess.py são relativos ao diretório corrente (data/raw, data/processed).
+    anterior = os.getcwd()
+    os.chdir(caminho)
+    try:
+        yield
+    finally:
+        os.chdir(anterior)
+
+
+# ------------------------------------------------------------------ benchmarks
+def bench_etapas(resolucoes, repeticoes, seed=SEED):
+    """Tempo por imagem de cada etapa do pré-processamento, por resolução."""
+    resultados = {}
+    rng = np.random.default_rng(seed)
+    for texto in resolucoes:
+        resolucao = parse_resolucao(texto)
+        imagens = [imagem_sintetica(*resolucao, rng) for _ in range(IMAGENS_POR_RESOLUCAO)]
+        n = len(imagens)
+        circulos = [preprocess.localizar_iris(img) for img in imagens]
+        segmentadas = [preprocess.aplicar_segmentacao(img, c) for img, c in zip(imagens, circulos)]
+        mascaras = [preprocess.mascara_reflexos(img) for img in segmentadas]
+
+        etapas = {
+            "localizar_iris_referencia": lambda: [preprocess.localizar_iris(img) for img in imagens],
+            "localizar_iris_rapido": lambda: [preprocess.localizar_iris(img, "rapido") for img in imagens],
+            "aplicar_segmentacao": lambda: [preprocess.aplicar_segmentacao(img, c) for img, c in zip(imagens, circulos)],
+            "mascara_reflexos": lambda: [preprocess.mascara_reflexos(img) for img in segmentadas],
+            "remover_reflexos": lambda: [preprocess.remover_reflexos(img, m) for img, m in zip(segmentadas, mascaras)],
+            "resize": lambda: [cv2.resize(img, preprocess.IMG_SIZE) for img in segmentadas],
+            "preprocessar_array_referencia": lambda: [preprocess.preprocessar_array(img) for img in imagens],
+            "preprocessar_array_rapido": lambda: [preprocess.preprocessar_array(img, "rapido") for img in imagens],
+        }
+        for nome, funcao in etapas.items():
+            resultados[f"etapas/{nome}/{texto}"] = medir(funcao, repeticoes, itens=n)
+    return resultados
+
+
+def bench_dataset(base, n_imagens, resolucao, repeticoes, seed=SEED):
+    """Construção completa do dataset (serial, paralelo e .npz) e leitura dos formatos gerados."""
+    resultados = {}
+    repeticoes = max(1, min(repeticoes, 3))  # cada repetição reprocessa o dataset inteiro
+    with _em_diretorio(base):
+        gerar_raw(preprocess.RAW_DIR, n_imagens, parse_resolucao(resolucao), seed)
+        construcoes = {
+            "serial": dict(modo="serial"),
+            "paralelo": dict(modo="paralelo"),
+            "npz": dict(modo="serial", formato="npz"),
+        }
+        for nome, kwargs in construcoes.items():
+            def construir():
+                with redirect_stdout(io.StringIO()):
+                    preprocess.carregar_dataset(cache_geometria=False, **kwargs)
+            resultados[f"dataset/build_{nome}/{resolucao}"] = medir(construir, repeticoes, aquecimento=0,
+                                                                    itens=n_imagens)
+
+        shards = os.path.abspath(preprocess.SHARDS_DIR)
+        npz = os.path.abspath(preprocess.NPZ_PATH)
+
+    def iterar_shards():
+        X, _ = dataset_store.abrir_split(shards, "train")
+        for _ in X.iterar_lotes(32):
+            pass
+
+    leituras = {
+        "load_shards": lambda: dataset_store.carregar_splits(shards),
+        "load_npz": lambda: dataset_store.carregar_splits(npz),
+        "iterar_lotes_shards": iterar_shards,
+    }
+    for nome, funcao in leituras.items():
+        resultados[f"dataset/{nome}"] = medir(funcao, repeticoes * 2, itens=n_imagens)
+    return resultados, npz
+
+
+def _modelo_minimo(destino):
+    """Modelo pequeno com a mesma entrada e saída do classificador, salvo como .keras."""
+    import tensorflow as tf
+
+    inp = tf.keras.layers.Input(shape=preprocess.IMG_SIZE[::-1] + (3,))
+    x = tf.keras.layers.Conv2D(8, 3, strides=2, activation="relu")(inp)
+    x = tf.keras.layers.Conv2D(16, 3, strides=2, activation="relu")(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    out = tf.keras.layers.Dense(len(CLASSES), activation="softmax")(x)
+    modelo = tf.keras.Model(inp, out)
+
+    destino.mkdir(parents=True, exist_ok=True)
+    caminho = destino / "model.keras"
+    modelo.save(str(caminho))
+    (destino / "label_classes.json").write_text(json.dumps(list(CLASSES)), encoding="utf-8")
+    return caminho
+
+
+def bench_predicao(base, npz, repeticoes, lotes=(1, 8, 32)):
+    """Predição em lote com um modelo mínimo e a avaliação completa de evaluate.evaluate_model."""
+    sys.path.insert(0, str(ML_DIR / "datasets"))
+    import evaluate
+
+    resultados = {}
+    caminho = _modelo_minimo(Path(base) / "modelo")
+    prever = evaluate.load_predictor(caminho)
+    X, _ = dataset_store.abrir_split(npz, "test")
+    X = np.asarray(X, dtype=np.float32)
+    for tamanho in lotes:
+        lote = np.resize(X, (tamanho,) + X.shape[1:])
+        resultados[f"predicao/lote_{tamanho}"] = medir(lambda: prever(lote), repeticoes * 4, aquecimento=2,
+                                                       itens=tamanho)
+
+    evaluate.ARTIFACTS_DIR = Path(base) / "artifacts"
+    uri = os.environ.pop("MLFLOW_TRACKING_URI", None)
+    try:
+        def avaliar():
+            with redirect_stdout(io.StringIO()):
+                evaluate.evaluate_model(caminho, Path(npz))
+        resultados["predicao/evaluate_model"] = medir(avaliar, max(1, repeticoes // 2), itens=len(X))
+    finally:
+        if uri is not None:
+            os.environ["MLFLOW_TRACKING_URI"] = uri
+    return resultados
+
+
+def _python(*argumentos):
+    env = dict(os.environ, PYTHONPATH=str(ML_DIR))
+    return subprocess.run([sys.executable, *argumentos], cwd=ML_DIR, env=env, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+
+
+def bench_inicializacao(repeticoes):
+    """
+    Tempo de parede de `cli.py --help` e de `cli.py <comando> --help` em
+    processos novos, e os módulos pesados que cada módulo leve puxa ao ser
+    importado (deveria ser nenhum). Retorna (resultados, vazamentos).
+    """
+    import cli
+
+    resultados = {}
+    for comando in [None, *cli.COMANDOS]:
+        argumentos = ["cli.py", "--help"] if comando is None else ["cli.py", comando, "--help"]
+        nome = f"inicializacao/{comando or 'cli'}_help"
+        resultados[nome] = medir(lambda: _python(*argumentos), repeticoes)
+
+    codigo = "import sys, json, {0}; print(json.dumps([m for m in {1!r} if m in sys.modules]))"
+    vazamentos = {}
+    for modulo in MODULOS_LEVES:
+        carregados = json.loads(_python("-c", codigo.format(modulo, MODULOS_PESADOS)))
+        if carregados:
+            vazamentos[modulo] = carregados
+    return resultados, vazamentos
+
+
+# ----------------------------------------------------------------- resultados
+def ambiente():
+    versoes = {"python": platform.python_version(), "numpy": np.__version__, "opencv": cv2.__version__}
+    if "tensorflow" in sys.modules:
+        versoes["tensorflow"] = sys.modules["tensorflow"].__version__
+    return {"plataforma": platform.platform(), "cpus": os.cpu_count(), "versoes": versoes}
+
+
+def comparar(resultados, baseline, tolerancia=TOLERANCIA_PADRAO):
+    """
+    Compara a mediana de cada benchmark com a do baseline. Razão acima de
+    1 + tolerância é regressão, abaixo de 1 - tolerância é melhoria.
+    """
+    comparacao = {}
+    for nome, atual in resultados.items():
+        anterior = baseline.get("resultados", {}).get(nome)
+        if anterior is None or anterior["mediana_s"] <= 0:
+            continue
+        razao = atual["mediana_s"] / anterior["mediana_s"]
+        status = "estavel"
+        if razao > 1 + tolerancia:
+            status = "regressao"
+        elif razao < 1 - tolerancia:
+            status = "melhoria"
+        comparacao[nome] = {"baseline_s": anterior["mediana_s"], "atual_s": atual["mediana_s"],
+                            "razao": round(razao, 3), "status": status}
+    return comparacao
+
+
+def salvar_json(dados, caminho):
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(dados, f, indent=2, ensure_ascii=False)
+
+
+def executar(args):
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix="neurovision_bench_") as base:
+        if "etapas" in args.grupos:
+            resultados.update(bench_etapas(args.resolucoes, args.repeticoes))
+        npz = None
+        if "dataset" in args.grupos or "predicao" in args.grupos:
+            parciais, npz = bench_dataset(base, args.imagens, args.resolucao_dataset, args.repeticoes)
+            if "dataset" in args.grupos:
+                resultados.update(parciais)
+        if "predicao" in args.grupos:
+            resultados.update(bench_predicao(base, npz, args.repeticoes))
+    vazamentos = {}
+    if "inicializacao" in args.grupos:
+        parciais, vazamentos = bench_inicializacao(args.repeticoes)
+        resultados.update(parciais)
+
+    saida = {
+        "versao": VERSAO_RESULTADOS,
+        "timestamp": int(time.time()),
+        "ambiente": ambiente(),
+        "config": {
+            "grupos": list(args.grupos),
+            "resolucoes": list(args.resolucoes),
+            "imagens_dataset": args.imagens,
+            "resolucao_dataset": args.resolucao_dataset,
+            "repeticoes": args.repeticoes,
+            "limite_inicializacao_s": args.limite_inicializacao,
+        },
+        "resultados": resultados,
+    }
+    if "inicializacao" in args.grupos:
+        saida["inicializacao"] = {
+            "vazamentos_importacao": vazamentos,
+            "acima_do_limite": [n for n, r in resultados.items()
+                                if n.startswith("inicializacao/") and r["mediana_s"] > args.limite_inicializacao],
+        }
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            saida["comparacao"] = comparar(resultados, json.load(f), args.tolerancia)
+    return saida
+
+
+def imprimir(saida):
+    comparacao = saida.get("comparacao", {})
+    for nome, r in saida["resultados"].items():
+        linha = f"{nome:<55} {r['mediana_s'] * 1000:>10.2f} ms"
+        if nome in comparacao:
+            c = comparacao[nome]
+            linha += f"  x{c['razao']:.2f} ({c['status']})"
+        print(linha)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks do pré-processamento, do dataset, da predição e da inicialização da CLI.")
+    parser.add_argument("--grupos", nargs="+", choices=GRUPOS, default=list(GRUPOS),
+                        help="Grupos de benchmarks a executar")
+    parser.add_argument("--resolucoes", nargs="+", default=list(RESOLUCOES_PADRAO),
+                        help="Resoluções (LxA) das imagens sintéticas usadas nas etapas")
+    parser.add_argument("--resolucao-dataset", dest="resolucao_dataset", default="640x480",
+                        help="Resolução das imagens do dataset sintético")
+    parser.add_argument("--imagens", type=int, default=IMAGENS_DATASET,
+                        help="Número de imagens do dataset sintético")
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES_PADRAO)
+    parser.add_argument("--saida", default=RESULTADOS_PATH, help="Arquivo JSON de resultados")
+    parser.add_argument("--baseline", help="JSON de resultados anterior usado como referência")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO,
+                        help="Variação relativa da mediana aceita antes de marcar regressão")
+    parser.add_argument("--limite-inicializacao", dest="limite_inicializacao", type=float,
+                        default=LIMITE_INICIALIZACAO_S,
+                        help="Mediana máxima, em segundos, do `--help` de cada comando da CLI")
+    parser.add_argument("--falhar-em-regressao", dest="falhar_em_regressao", action="store_true",
+                        help="Sair com código 1 se algum benchmark regredir em relação ao baseline "
+                             "ou se a inicialização da CLI violar o limite ou importar módulos pesados")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    saida = executar(args)
+    salvar_json(saida, args.saida)
+    imprimir(saida)
+    print(f"Resultados salvos em {args.saida}")
+
+    regressoes = [n for n, c in saida.get("comparacao", {}).items() if c["status"] == "regressao"]
+    if regressoes:
+        print(f"[AVISO] {len(regressoes)} benchmark(s) regrediram: {', '.join(regressoes)}")
+    inicializacao = saida.get("inicializacao", {})
+    for modulo, carregados in inicializacao.get("vazamentos_importacao", {}).items():
+        print(f"[AVISO] `import {modulo}` carrega {', '.join(carregados)}")
+    for nome in inicializacao.get("acima_do_limite", []):
+        print(f"[AVISO] {nome} acima de {args.limite_inicializacao:.1f}s")
+    falhou = regressoes or inicializacao.get("vazamentos_importacao") or inicializacao.get("acima_do_limite")
+    if falhou and args.falhar_em_regressao:
+        sys.exit(1)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""
+Inferência em cascata: um classificador pequeno responde sozinho quando a
+confiança calibrada passa do limiar, e só as imagens restantes vão para o
+modelo completo (MobileNetV3Large + cabeça).
+
+O estágio 1 é uma CNN de poucas camadas sobre a imagem reduzida a 96x96
+(o redimensionamento fica dentro do modelo, então a entrada é a mesma do
+modelo completo). A confiança é calibrada por temperature scaling no split
+de validação. Treino:
+
+    python ml/cascade.py --epochs 20 --dataset data/processed/dataset_shards
+
+Gera models/cascata_<timestamp>/ com o SavedModel `estagio1` e o
+cascade.json (temperatura, classes e limiar). O limiar é escolhido depois,
+com `python ml/datasets/evaluate.py --cascade <cascade.json>`.
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+import dataset_store
+import instrumentation
+import mlflow_tracking
+
+ROOT = Path(__file__).resolve().parents[1]
+MODELS_DIR = ROOT / "models"
+IMG_SHAPE = (224, 224, 3)
+RESOLUCAO_ESTAGIO1 = 96
+FILTROS = (16, 32, 64, 96)
+LEARNING_RATE = 1e-3
+DEFAULT_EPOCHS = 30
+BATCH_SIZE = 32
+LIMIAR_PADRAO = 0.9
+TEMPERATURAS = np.logspace(-1, 1, 201)  # grade de busca da temperatura (0.1 a 10)
+RANDOM_SEED = 42
+
+
+def construir_estagio1(num_classes, input_shape=IMG_SHAPE, resolucao=RESOLUCAO_ESTAGIO1, filtros=FILTROS,
+                       learning_rate=LEARNING_RATE):
+    """CNN pequena: Resizing para `resolucao`, blocos conv-BN-ReLU com stride 2 e pooling global."""
+    from tensorflow import keras
+    from tensorflow.keras import layers, models
+
+    inp = layers.Input(shape=input_shape, name="input_layer")
+    x = layers.Resizing(resolucao, resolucao, name="reduzir")(inp)
+    for i, f in enumerate(filtros):
+        x = layers.Conv2D(f, 3, strides=2, padding="same", use_bias=False, name=f"conv_{i}")(x)
+        x = layers.BatchNormalization(name=f"bn_{i}")(x)
+        x = layers.ReLU(name=f"relu_{i}")(x)
+    x = layers.GlobalAveragePooling2D(name="pool")(x)
+    x = layers.Dropout(0.3, name="dropout")(x)
+    out = layers.Dense(num_classes, activation="softmax", name="output_layer")(x)
+
+    model = models.Model(inputs=inp, outputs=out, name="iris_cascata_estagio1")
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    return model
+
+
+def aplicar_temperatura(probs, temperatura):
+    """Reescala probabilidades softmax por 1/T (log-probabilidades fazem o papel dos logits)."""
+    logits = np.log(np.clip(probs, 1e-12, 1.0)) / temperatura
+    logits -= logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _nll(probs, y):
+    return float(-np.mean(np.log(np.clip(probs[np.arange(len(y)), y], 1e-12, 1.0))))
+
+
+def erro_calibracao(probs, y, faixas=15):
+    """ECE: diferença média entre confiança e acurácia, ponderada por faixa de confiança."""
+    confianca = probs.max(axis=1)
+    acertos = probs.argmax(axis=1) == y
+    faixa = np.minimum((confianca * faixas).astype(int), faixas - 1)
+    return float(sum(abs(acertos[faixa == b].mean() - confianca[faixa == b].mean()) * np.mean(faixa == b)
+                     for b in range(faixas) if np.any(faixa == b)))
+
+
+def calibrar_temperatura(probs, y, temperaturas=TEMPERATURAS):
+    """Temperatura que minimiza a NLL em (probs, y), por busca em grade."""
+    perdas = [_nll(aplicar_temperatura(probs, t), y) for t in temperaturas]
+    return float(temperaturas[int(np.argmin(perdas))])
+
+
+class Cascata:
+    """
+    Preditor em dois estágios. `prever(lote, prever_completo)` roda o estágio 1
+    no lote inteiro e manda ao modelo completo só as imagens com confiança
+    calibrada até o limiar; o modelo completo é passado a cada chamada para
+    acompanhar o hot-swap do serviço. Conta as imagens respondidas por estágio.
+    """
+
+    def __init__(self, prever_estagio1, temperatura=1.0, limiar=LIMIAR_PADRAO, classes=None):
+        self.prever_estagio1 = prever_estagio1
+        self.temperatura = temperatura
+        self.limiar = limiar
+        self.classes = classes
+        self.respondidas = 0
+        self.escaladas = 0
+
+    @classmethod
+    def carregar(cls, config_path, limiar=None):
+        from model_registry import carregar_artefato
+
+        config_path = Path(config_path)
+        config = json.loads(config_path.read_text(encoding="utf-8"))
+        if limiar is None:
+            limiar = config.get("limiar", LIMIAR_PADRAO)
+        prever = carregar_artefato(config_path.parent / config["estagio1"])
+        return cls(prever, config["temperatura"], limiar, config.get("classes"))
+
+    def confianca(self, lote):
+        """Probabilidades calibradas do estágio 1."""
+        return aplicar_temperatura(np.asarray(self.prever_estagio1(lote)), self.temperatura)
+
+    def prever(self, lote, prever_completo):
+        probs = self.confianca(lote)
+        escalar = probs.max(axis=1) <= self.limiar
+        if np.any(escalar):
+            probs[escalar] = np.asarray(prever_completo(lote[escalar]))
+        self.escaladas += int(escalar.sum())
+        self.respondidas += int((~escalar).sum())
+        return probs
+
+    def resumo(self):
+        total = self.respondidas + self.escaladas
+        return {"limiar": self.limiar, "temperatura": self.temperatura, "respondidas_estagio1": self.respondidas,
+                "escaladas": self.escaladas, "taxa_escalonamento": self.escaladas / total if total else None}
+
+
+def salvar_config(config_path, **valores):
+    """Atualiza o cascade.json (ex.: o limiar escolhido pelo evaluate)."""
+    config_path = Path(config_path)
+    config = json.loads(config_path.read_text(encoding="utf-8")) if config_path.exists() else {}
+    config.update(valores)
+    config_path.write_text(json.dumps(config, indent=2, ensure_ascii=False), encoding="utf-8")
+    return config
+
+
+def prever_em_lotes(model, X, batch_size):
+    lotes = (X.lote(i, i + batch_size) if isinstance(X, dataset_store.SplitShards) else X[i:i + batch_size]
+             for i in range(0, len(X), batch_size))
+    return np.concatenate([model.predict_on_batch(lote) for lote in lotes])
+
+
+def treinar(args):
+    import tensorflow as tf
+    from tensorflow.keras import callbacks
+
+    import tf_dataset
+    from train import codificar_labels, origem_dataset_padrao
+
+    tf.random.set_seed(RANDOM_SEED)
+    origem = Path(args.dataset) if args.dataset else origem_dataset_padrao()
+    with instrumentation.etapa("cascade.carregar_dados"):
+        (X_train, y_train), (X_val, y_val), (X_test, y_test) = [
+            dataset_store.abrir_split(origem, split) for split in dataset_store.SPLITS
+        ]
+    y_train_enc, y_val_enc, y_test_enc, num_classes, label_encoder = codificar_labels(y_train, y_val, y_test)
+    epochs = args.epochs or DEFAULT_EPOCHS
+    batch_size = args.batch_size or BATCH_SIZE
+
+    model = construir_estagio1(num_classes, resolucao=args.resolucao, learning_rate=args.learning_rate)
+    ds_train = tf_dataset.construir_dataset(X_train, y_train_enc, batch_size,
+                                            shuffle_buffer=tf_dataset.SHUFFLE_BUFFER_PADRAO, seed=RANDOM_SEED)
+    ds_val = tf_dataset.construir_dataset(X_val, y_val_enc, batch_size)
+
+    timestamp = int(time.time())
+    with mlflow_tracking.mlflow_run(run_name=f"cascata_estagio1_{timestamp}",
+                                    experiment_name=args.experiment_name) as run:
+        registro = mlflow_tracking.LoggerAssincrono(run.info.run_id)
+        registro.log_params({"epochs": epochs, "batch_size": batch_size, "resolucao": args.resolucao,
+                             "filtros": list(FILTROS), "learning_rate": args.learning_rate,
+                             "parametros_estagio1": model.count_params()})
+        with instrumentation.etapa("cascade.fit"):
+            historico = model.fit(ds_train, validation_data=ds_val, epochs=epochs, verbose=2, callbacks=[
+                callbacks.EarlyStopping(monitor="val_loss", patience=6, restore_best_weights=True),
+                callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=3),
+            ])
+        for nome, valores in historico.history.items():
+            for epoca, valor in enumerate(valores):
+                registro.log_metric(nome, float(valor), step=epoca)
+
+        with instrumentation.etapa("cascade.calibrar"):
+            probs_val = prever_em_lotes(model, X_val, batch_size)
+            temperatura = calibrar_temperatura(probs_val, y_val_enc)
+            probs_test = aplicar_temperatura(prever_em_lotes(model, X_test, batch_size), temperatura)
+        registro.log_metrics({
+            "temperatura": temperatura,
+            "val_ece_antes": erro_calibracao(probs_val, y_val_enc),
+            "val_ece_depois": erro_calibracao(aplicar_temperatura(probs_val, temperatura), y_val_enc),
+            "test_accuracy_estagio1": float(np.mean(probs_test.argmax(axis=1) == y_test_enc)),
+        })
+
+        destino = MODELS_DIR / f"cascata_{timestamp}"
+        destino.mkdir(parents=True, exist_ok=True)
+        with instrumentation.etapa("cascade.salvar"):
+            model.export(str(destino / "estagio1"))
+        config_path = destino / "cascade.json"
+        salvar_config(config_path, estagio1="estagio1", temperatura=temperatura, limiar=LIMIAR_PADRAO,
+                      resolucao=args.resolucao, classes=label_encoder.classes_.tolist(), dataset=str(origem))
+        registro.log_artifact(str(config_path))
+        registro.log_artifacts(str(destino / "estagio1"), artifact_path="estagio1")
+        registro.fechar()
+
+    print(f"✅ Estágio 1 salvo em {destino} (temperatura {temperatura:.3f}, {model.count_params()} parâmetros)")
+    print(f"Escolha o limiar com: python ml/datasets/evaluate.py --cascade {config_path}")
+    return {"config": str(config_path), "temperatura": temperatura, "run_id": run.info.run_id}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Treinar o estágio 1 (CNN pequena) da inferência em cascata.")
+    parser.add_argument("--epochs", type=int, help="Número de épocas de treinamento")
+    parser.add_argument("--batch-size", dest="batch_size", type=int, help="Tamanho do batch")
+    parser.add_argument("--dataset", type=str, help="Shards ou .npz processado (padrão: o de data/processed)")
+    parser.add_argument("--resolucao", type=int, default=RESOLUCAO_ESTAGIO1,
+                        help="Lado da imagem reduzida que entra na CNN do estágio 1")
+    parser.add_argument("--learning-rate", dest="learning_rate", type=float, default=LEARNING_RATE)
+    parser.add_argument("--experiment-name", type=str, default="iris_diagnostic_cascata",
+                        help="Experimento MLflow do treino do estágio 1")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        resultado = treinar(args)
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    except Exception as e:
+        print(f"[ERRO] Falha no treino do estágio 1: {e}")
+        sys.exit(1)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Ponto de entrada único do pipeline de ML:
+
+    python ml/cli.py <comando> [opções do comando]
+
+Cada subcomando executa o script correspondente como __main__, com os
+argumentos repassados sem alteração. Nada pesado é importado aqui: o
+TensorFlow, o MLflow etc. só carregam dentro do comando que precisa deles,
+então `--help` e os comandos leves iniciam rápido.
+"""
+import sys
+import runpy
+import argparse
+from pathlib import Path
+
+ML_DIR = Path(__file__).resolve().parent
+
+COMANDOS = {
+    "preprocess": ("preprocess.py", "Pré-processar as imagens e gerar o dataset"),
+    "split": ("scripts/split_dataset.py", "Dividir as imagens brutas em train/val/test"),
+    "metadata": ("scripts/generate_metadata.py", "Gerar os metadados das imagens brutas"),
+    "convert": ("scripts/convert_to_numpy.py", "Converter as imagens em arrays numpy"),
+    "train": ("train.py", "Treinar o modelo e logar no MLflow"),
+    "distributed": ("distributed.py", "Lançar o treino distribuído com N workers nesta máquina"),
+    "cascade": ("cascade.py", "Treinar o estágio 1 da inferência em cascata"),
+    "search": ("hyperparameter_search.py", "Buscar hiperparâmetros em paralelo com poda ASHA"),
+    "evaluate": ("datasets/evaluate.py", "Avaliar modelos, variantes TFLite ou uma varredura"),
+    "export": ("export_tflite.py", "Exportar o SavedModel em variantes TFLite"),
+    "serving": ("serving_export.py", "Verificar a paridade das assinaturas de serving com o pré-processamento"),
+    "benchmark": ("benchmark.py", "Rodar o benchmark offline do pipeline"),
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="ml", description="Pipeline de ML do NeuroVision.")
+    subparsers = parser.add_subparsers(dest="comando", metavar="<comando>", required=True)
+    for nome, (_, ajuda) in COMANDOS.items():
+        # Sem help próprio: `ml <comando> --help` chega ao parser do script.
+        subparsers.add_parser(nome, help=ajuda, add_help=False)
+    return parser.parse_known_args(argv)
+
+
+def executar(comando, argumentos):
+    script = ML_DIR / COMANDOS[comando][0]
+    sys.argv = [str(script)] + list(argumentos)
+    for caminho in (str(ML_DIR), str(script.parent)):
+        if caminho not in sys.path:
+            sys.path.insert(0, caminho)
+    runpy.run_path(str(script), run_name="__main__")
+
+
+def main(argv=None):
+    args, resto = parse_args(argv)
+    executar(args.comando, resto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import os
+import json
+
+import numpy as np
+
+FORMATO = "shards_uint8"
+VERSAO_FORMATO = 1
+INDEX_FILE = "index.json"
+LABELS_FILE = "labels.npy"
+SPLITS_FILE = "splits.npy"
+ARQUIVOS_FILE = "arquivos.json"
+SHARD_TAMANHO_PADRAO = 1024
+SPLITS = ("train", "val", "test")
+
+
+def normalizar(lote):
+    """Converte um lote uint8 em float32 no intervalo [0, 1]."""
+    return np.divide(lote, 255.0, dtype=np.float32)
+
+
+def _limpar_destino(destino):
+    os.makedirs(destino, exist_ok=True)
+    for nome in os.listdir(destino):
+        if nome in (INDEX_FILE, ARQUIVOS_FILE) or (nome.startswith("shard_") and nome.endswith(".u8")):
+            os.remove(os.path.join(destino, nome))
+
+
+def _gravar_indice(destino, labels, splits, img_shape, shard_tamanho, shards):
+    """Grava labels.npy, splits.npy e, por último, o index.json de um dataset de shards."""
+    splits = np.asarray(splits)
+    if len(splits) != len(labels):
+        raise ValueError("Quantidade de splits difere da quantidade de imagens gravadas")
+
+    classes = sorted(set(labels))
+    codigos = {c: i for i, c in enumerate(classes)}
+    np.save(os.path.join(destino, LABELS_FILE), np.array([codigos[c] for c in labels], dtype=np.int16))
+    np.save(os.path.join(destino, SPLITS_FILE), np.array([SPLITS.index(s) for s in splits], dtype=np.int8))
+
+    index = {
+        "formato": FORMATO,
+        "versao": VERSAO_FORMATO,
+        "dtype": "uint8",
+        "img_shape": list(img_shape),
+        "shard_tamanho": shard_tamanho,
+        "total": len(labels),
+        "shards": shards,
+        "classes": classes,
+        "splits": {s: int(np.sum(splits == s)) for s in SPLITS},
+    }
+    with open(os.path.join(destino, INDEX_FILE), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    return index
+
+
+class EscritorShards:
+    """
+    Grava imagens uint8 de tamanho fixo em shards binários à medida que chegam.
+    O index.json só é escrito em `finalizar`, então um diretório sem índice
+    nunca é tratado como dataset completo.
+    """
+
+    def __init__(self, destino, img_shape, shard_tamanho=SHARD_TAMANHO_PADRAO):
+        self.destino = str(destino)
+        self.img_shape = tuple(int(d) for d in img_shape)
+        self.shard_tamanho = shard_tamanho
+        self.shards = []
+        self.labels = []
+        self._arquivo = None
+        self._no_shard = 0
+
+        _limpar_destino(self.destino)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _abrir_shard(self):
+        nome = f"shard_{len(self.shards):05d}.u8"
+        self._arquivo = open(os.path.join(self.destino, nome), "wb")
+        self.shards.append(nome)
+        self._no_shard = 0
+
+    def adicionar(self, imagem, classe):
+        if imagem.shape != self.img_shape or imagem.dtype != np.uint8:
+            raise ValueError(f"Imagem com formato inesperado: {imagem.shape} {imagem.dtype}")
+        if self._arquivo is None or self._no_shard == self.shard_tamanho:
+            self._fechar_shard()
+            self._abrir_shard()
+        self._arquivo.write(np.ascontiguousarray(imagem).tobytes())
+        self._no_shard += 1
+        self.labels.append(classe)
+
+    def _fechar_shard(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def finalizar(self, splits):
+        """
+        Fecha o shard corrente e grava labels, splits e o índice.
+        `splits` é um array com o nome do split ("train"/"val"/"test") de cada imagem.
+        """
+        self._fechar_shard()
+        return _gravar_indice(self.destino, self.labels, splits, self.img_shape, self.shard_tamanho, self.shards)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._fechar_shard()
+        return False
+
+
+class EscritorContiguo:
+    """
+    Grava `total` imagens uint8 de tamanho fixo em um único shard pré-alocado
+    (np.memmap), cada uma na posição indicada pelo chamador, então várias
+    threads podem preencher o arquivo ao mesmo tempo. Em `finalizar`, as
+    posições que ficaram vazias (falhas) são removidas compactando o arquivo,
+    e o resultado é lido pelo DatasetShards como qualquer dataset de shards.
+    """
+
+    def __init__(self, destino, img_shape, total):
+        if total <= 0:
+            raise ValueError("EscritorContiguo precisa de pelo menos uma imagem")
+        self.destino = str(destino)
+        self.img_shape = tuple(int(d) for d in img_shape)
+        self.nome = "shard_00000.u8"
+        _limpar_destino(self.destino)
+        self._dados = np.memmap(os.path.join(self.destino, self.nome), dtype=np.uint8, mode="w+",
+                                shape=(total,) + self.img_shape)
+        self._labels = [None] * total
+        self._arquivos = [None] * total
+
+    def gravar(self, posicao, imagem, classe, arquivo=None):
+        if imagem.shape != self.img_shape or imagem.dtype != np.uint8:
+            raise ValueError(f"Imagem com formato inesperado: {imagem.shape} {imagem.dtype}")
+        self._dados[posicao] = imagem
+        self._labels[posicao] = classe
+        self._arquivos[posicao] = arquivo
+
+    def posicoes_gravadas(self):
+        return [i for i, classe in enumerate(self._labels) if classe is not None]
+
+    def finalizar(self, splits):
+        """
+        Compacta o shard, trunca o arquivo e grava labels, splits, o índice e o
+        arquivos.json (arquivo, classe, split e offset em bytes de cada imagem).
+        `splits` segue a ordem de `posicoes_gravadas()`.
+        """
+        gravadas = self.posicoes_gravadas()
+        if not gravadas:
+            raise ValueError("Nenhuma imagem foi gravada")
+        for destino, origem in enumerate(gravadas):
+            if destino != origem:
+                self._dados[destino] = self._dados[origem]
+        self._dados.flush()
+        del self._dados
+        tamanho_imagem = int(np.prod(self.img_shape))
+        os.truncate(os.path.join(self.destino, self.nome), len(gravadas) * tamanho_imagem)
+
+        labels = [self._labels[i] for i in gravadas]
+        arquivos = [
+            {"arquivo": self._arquivos[i], "classe": classe, "split": str(split), "offset": n * tamanho_imagem}
+            for n, (i, classe, split) in enumerate(zip(gravadas, labels, splits))
+        ]
+        index = _gravar_indice(self.destino, labels, splits, self.img_shape, len(gravadas), [self.nome])
+        with open(os.path.join(self.destino, ARQUIVOS_FILE), "w", encoding="utf-8") as f:
+            json.dump(arquivos, f, ensure_ascii=False)
+        return index
+
+
+class DatasetShards:
+    """Acesso somente leitura, via np.memmap, a um dataset gravado por EscritorShards."""
+
+    def __init__(self, origem):
+        self.origem = str(origem)
+        with open(os.path.join(self.origem, INDEX_FILE), encoding="utf-8") as f:
+            self.index = json.load(f)
+        if self.index.get("formato") != FORMATO:
+            raise ValueError(f"Formato de dataset desconhecido em {self.origem}")
+
+        self.img_shape = tuple(self.index["img_shape"])
+        self.shard_tamanho = self.index["shard_tamanho"]
+        self.classes = np.array(self.index["classes"])
+        self.labels = np.load(os.path.join(self.origem, LABELS_FILE), mmap_mode="r")
+        self.splits = np.load(os.path.join(self.origem, SPLITS_FILE), mmap_mode="r")
+
+        total = self.index["total"]
+        self._shards = []
+        for i, nome in enumerate(self.index["shards"]):
+            n = min(self.shard_tamanho, total - i * self.shard_tamanho)
+            self._shards.append(np.memmap(os.path.join(self.origem, nome), dtype=np.uint8,
+                                          mode="r", shape=(n,) + self.img_shape))
+
+    def __len__(self):
+        return self.index["total"]
+
+    def arquivos(self):
+        """Entradas do arquivos.json (gravado pelo EscritorContiguo), ou None."""
+        caminho = os.path.join(self.origem, ARQUIVOS_FILE)
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+
+    def fatia(self, inicio, fim):
+        """Imagens uint8 [inicio, fim) como visão do memmap, sem cópia, se couberem em um shard."""
+        shard_id = inicio // self.shard_tamanho
+        if (fim - 1) // self.shard_tamanho != shard_id:
+            return self.ler(np.arange(inicio, fim))
+        base = shard_id * self.shard_tamanho
+        return self._shards[shard_id][inicio - base:fim - base]
+
+    def indices(self, split):
+        return np.flatnonzero(self.splits == SPLITS.index(split))
+
+    def ler(self, indices):
+        """Lê as imagens uint8 dos índices globais informados, na ordem dada."""
+        indices = np.asarray(indices, dtype=np.int64)
+        saida = np.empty((len(indices),) + self.img_shape, dtype=np.uint8)
+        shard_ids = indices // self.shard_tamanho
+        for shard_id in np.unique(shard_ids):
+            pos = np.flatnonzero(shard_ids == shard_id)
+            saida[pos] = self._shards[shard_id][indices[pos] - shard_id * self.shard_tamanho]
+        return saida
+
+    def split(self, nome):
+        return SplitShards(self, self.indices(nome))
+
+
+class SplitShards:
+    """Visão de um split; a normalização acontece só quando um lote é lido."""
+
+    def __init__(self, dataset, indices):
+        self.dataset = dataset
+        self.indices = indices
+        self.shape = (len(indices),) + dataset.img_shape
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def labels(self):
+        return self.dataset.classes[self.dataset.labels[self.indices]]
+
+    def lote(self, inicio, fim, normalizado=True):
+        imagens = self.dataset.ler(self.indices[inicio:fim])
+        return normalizar(imagens) if normalizado else imagens
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            inicio, fim, passo = item.indices(len(self))
+            if passo != 1:
+                return normalizar(self.dataset.ler(self.indices[item]))
+            return self.lote(inicio, fim)
+        return self.lote(item, item + 1)[0]
+
+    def iterar_lotes(self, batch_size, normalizado=True):
+        for inicio in range(0, len(self), batch_size):
+            yield self.lote(inicio, inicio + batch_size, normalizado)
+
+    def carregar(self, normalizado=True):
+        return self.lote(0, len(self), normalizado)
+
+
+def eh_dataset_shards(origem):
+    return os.path.isfile(os.path.join(str(origem), INDEX_FILE))
+
+
+def abrir_split(origem, split):
+    """
+    Abre apenas um split, seja de um diretório de shards ou do .npz legado.
+    Retorna (X, y): X é uma SplitShards (lazy) ou um ndarray float32.
+    """
+    if eh_dataset_shards(origem):
+        dados = DatasetShards(origem).split(split)
+        return dados, dados.labels
+
+    if not os.path.exists(str(origem)):
+        raise FileNotFoundError(f"Arquivo de dataset não encontrado: {origem}")
+    with np.load(str(origem), allow_pickle=True) as data:
+        return data[f"X_{split}"], data[f"y_{split}"]
+
+
+def iterar_lotes(X, batch_size):
+    """
+    Lotes float32 normalizados de X, seja uma SplitShards (lida sob demanda)
+    ou um array em memória (uint8 é normalizado, float fica como está).
+    """
+    if isinstance(X, SplitShards):
+        yield from X.iterar_lotes(batch_size)
+        return
+    for inicio in range(0, len(X), batch_size):
+        lote = np.asarray(X[inicio:inicio + batch_size])
+        yield normalizar(lote) if lote.dtype == np.uint8 else lote
+
+
+def carregar_splits(origem):
+    """Carrega train/val/test em memória como float32 normalizado."""
+    resultado = []
+    for split in SPLITS:
+        X, y = abrir_split(origem, split)
+        if isinstance(X, SplitShards):
+            X = X.carregar()
+        resultado.append((X, y))
+    return tuple(resultado)
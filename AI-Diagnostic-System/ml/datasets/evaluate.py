@@ -0,0 +1,866 @@
+import os
+import sys
+import json
+import time
+import queue
+import fnmatch
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+ML_DIR = Path(__file__).resolve().parents[1]
+ARTIFACTS_DIR = ML_DIR / "artifacts"
+ROC_BINS = 4096
+SWEEP_MEMORY_FACTOR = 2.0  # memória estimada de um modelo carregado, em múltiplos do tamanho em disco
+
+ModelPath = Union[Path, str]
+Predictor = Callable[[np.ndarray], np.ndarray]
+
+sys.path.insert(0, str(ML_DIR))
+import dataset_store  # noqa: E402
+import instrumentation  # noqa: E402
+from model_registry import RegistroModelos, carregar_artefato  # noqa: E402
+from train import MODELS_DIR, origem_dataset_padrao  # noqa: E402
+
+
+def find_latest_model(models_dir: Optional[Path] = None) -> Path:
+    """
+    Artefato completo mais recente de models_dir segundo o RegistroModelos
+    (SavedModel antes de .keras/.h5; exportações ainda em escrita ficam de fora).
+    """
+    models_dir = models_dir or MODELS_DIR
+    registry = RegistroModelos(models_dir)
+    registry.atualizar()
+    artifact = registry.mais_recente()
+    if artifact is None:
+        raise FileNotFoundError(f"Nenhum modelo completo encontrado em {models_dir}")
+    return artifact["caminho"]
+
+
+class TFLitePredictor:
+    """Roda um .tflite em lotes, quantizando a entrada e dequantizando a saída quando o modelo é int8."""
+
+    def __init__(self, model_path: ModelPath, num_threads: Optional[int] = None):
+        import tensorflow as tf
+
+        self.interpreter = tf.lite.Interpreter(model_path=str(model_path), num_threads=num_threads)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        if batch.shape[0] != self._batch_size:
+            self.interpreter.resize_tensor_input(self.input["index"], batch.shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = batch.shape[0]
+
+        dtype = self.input["dtype"]
+        if np.issubdtype(dtype, np.integer):
+            scale, zero_point = self.input["quantization"]
+            info = np.iinfo(dtype)
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max)
+        self.interpreter.set_tensor(self.input["index"], batch.astype(dtype))
+        self.interpreter.invoke()
+
+        out = self.interpreter.get_tensor(self.output["index"])
+        if np.issubdtype(self.output["dtype"], np.integer):
+            scale, zero_point = self.output["quantization"]
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+
+def load_predictor(model_path: Path, num_threads: Optional[int] = None) -> Predictor:
+    """Função lote -> probabilidades para um .tflite, SavedModel, .keras ou .h5."""
+    if model_path.suffix == ".tflite":
+        return TFLitePredictor(model_path, num_threads)
+    return carregar_artefato(model_path)
+
+
+def batch_at(X, start: int, end: int) -> np.ndarray:
+    """Lote float32 normalizado de X (SplitShards, ndarray uint8 ou ndarray float do .npz)."""
+    if isinstance(X, dataset_store.SplitShards):
+        return X.lote(start, end)
+    if X.dtype == np.uint8:
+        return dataset_store.normalizar(X[start:end])
+    return np.asarray(X[start:end], dtype=np.float32)
+
+
+def predict_in_batches(predict: Predictor, X, batch_size: int = 32) -> np.ndarray:
+    return np.concatenate([predict(batch_at(X, i, i + batch_size)) for i in range(0, len(X), batch_size)])
+
+
+def measure_latency(predict: Predictor, X, samples: int = 50, warmup: int = 5) -> Dict[str, float]:
+    """Latência por imagem (lote de 1), em ms."""
+    samples = min(samples, len(X))
+    for i in range(min(warmup, samples)):
+        predict(batch_at(X, i, i + 1))
+    times = []
+    for i in range(samples):
+        batch = batch_at(X, i, i + 1)
+        start = time.perf_counter()
+        predict(batch)
+        times.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "latency_ms_mean": float(np.mean(times)),
+        "latency_ms_p50": float(np.percentile(times, 50)),
+        "latency_ms_p95": float(np.percentile(times, 95)),
+    }
+
+
+def measure_throughput(predict: Predictor, X, batch_size: int = 32, max_images: int = 256) -> float:
+    """Imagens por segundo em lotes de `batch_size` (o primeiro lote serve de aquecimento)."""
+    total = min(len(X), max_images)
+    batches = [batch_at(X, i, min(i + batch_size, total)) for i in range(0, total, batch_size)]
+    predict(batches[0])
+    start = time.perf_counter()
+    for batch in batches:
+        predict(batch)
+    return total / (time.perf_counter() - start)
+
+
+def model_size_mb(model_path: Path) -> float:
+    if model_path.is_file():
+        return model_path.stat().st_size / 1e6
+    return sum(p.stat().st_size for p in model_path.rglob("*") if p.is_file()) / 1e6
+
+
+def dataset_classes(y: np.ndarray) -> List[str]:
+    """Classes do dataset ordenadas: a ordem do LabelEncoder do treino, e portanto a das saídas do modelo."""
+    return [str(c) for c in np.unique(np.asarray(y))]
+
+
+def resolve_classes(models_dir: Path, y_test: np.ndarray) -> List[str]:
+    label_file = models_dir / "label_classes.json"
+    if label_file.exists():
+        try:
+            return json.loads(label_file.read_text(encoding="utf-8"))
+        except Exception:
+            pass
+    return dataset_classes(y_test)
+
+
+def encode_labels(y_test: np.ndarray, classes: List[str]) -> np.ndarray:
+    """
+    Índices de `y_test` na ordem de `classes`. Rótulos fora dela (uma classe
+    do dataset que o modelo não conhece) levantam ValueError, em vez de
+    distorcer a acurácia e a matriz de confusão.
+    """
+    try:
+        encoded = y_test.astype(int)
+    except Exception:
+        mapping = {label: idx for idx, label in enumerate(classes)}
+        unknown = sorted({str(label) for label in y_test if label not in mapping})
+        if unknown:
+            raise ValueError(f"Rótulos fora das classes do modelo {list(classes)}: {unknown}")
+        return np.array([mapping[label] for label in y_test], dtype=int)
+    unknown = sorted({int(label) for label in encoded if not 0 <= label < len(classes)})
+    if unknown:
+        raise ValueError(f"Índices de rótulo fora das {len(classes)} classes do modelo: {unknown}")
+    return encoded
+
+
+def save_json_report(report: dict, filename: str) -> Path:
+    ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = ARTIFACTS_DIR / filename
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Relatório salvo → {path}")
+    return path
+
+
+def plot_confusion(cm: np.ndarray, class_names: List[str], out_path: Path):
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(6, 6))
+    plt.imshow(cm, interpolation="nearest")
+    plt.title("Matriz de Confusão")
+    plt.colorbar()
+
+    ticks = np.arange(len(class_names))
+    plt.xticks(ticks, class_names, rotation=45)
+    plt.yticks(ticks, class_names)
+
+    threshold = cm.max() / 2
+    for i, j in np.ndindex(cm.shape):
+        plt.text(j, i, f"{cm[i, j]}", ha="center", color="white" if cm[i, j] > threshold else "black")
+
+    plt.ylabel("Label real")
+    plt.xlabel("Predição")
+    plt.tight_layout()
+    plt.savefig(out_path)
+    plt.close()
+    print(f"Matriz salva → {out_path}")
+
+
+def plot_roc_curves(y_true: np.ndarray, y_probs: np.ndarray, class_names: List[str], out_path: Path):
+    from sklearn.metrics import roc_curve, auc
+
+    curves = []
+    for i in range(len(class_names)):
+        fpr, tpr, _ = roc_curve(y_true == i, y_probs[:, i])
+        curves.append((fpr, tpr, auc(fpr, tpr)))
+    plot_roc(curves, class_names, out_path)
+
+
+def plot_roc(curves: List[Tuple[np.ndarray, np.ndarray, float]], class_names: List[str], out_path: Path):
+    """Uma curva um-contra-todos (fpr, tpr, auc) por classe."""
+    import matplotlib.pyplot as plt
+
+    plt.figure()
+    for (fpr, tpr, roc_auc), name in zip(curves, class_names):
+        plt.plot(fpr, tpr, lw=2, label=f"Classe {name} (AUC={roc_auc:.2f})")
+
+    plt.plot([0, 1], [0, 1], "k--", lw=2)
+    plt.xlabel("False Positive Rate")
+    plt.ylabel("True Positive Rate")
+    plt.title("Curvas ROC")
+    plt.legend(loc="lower right")
+    plt.savefig(out_path)
+    plt.close()
+    print(f"ROC salvo → {out_path}")
+
+
+def iter_batches(X, batch_size: int = 32, prefetch: int = 2):
+    """
+    Gera (início, lote) lendo os lotes de X numa thread, com no máximo
+    `prefetch` lotes à frente, para que a leitura do disco se sobreponha
+    à predição do lote anterior.
+    """
+    pending = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for start in range(0, len(X), batch_size):
+                with instrumentation.etapa("evaluate.leitura"):
+                    batch = batch_at(X, start, start + batch_size)
+                if not put((start, batch)):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(None)
+
+    reader = threading.Thread(target=read, name="evaluate-prefetch", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+
+class StreamingMetrics:
+    """
+    Acumuladores incrementais: matriz de confusão e, por classe, histogramas
+    das probabilidades dos exemplos positivos e negativos (`roc_bins` faixas
+    em [0, 1]), de onde saem as curvas ROC e a AUC sem guardar y_probs.
+    """
+
+    def __init__(self, n_classes: int, roc_bins: int = ROC_BINS):
+        self.n_classes = n_classes
+        self.roc_bins = roc_bins
+        self.confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+        self.positives = np.zeros((n_classes, roc_bins), dtype=np.int64)
+        self.negatives = np.zeros((n_classes, roc_bins), dtype=np.int64)
+
+    def update(self, y_true: np.ndarray, y_probs: np.ndarray):
+        y_pred = np.argmax(y_probs, axis=1)
+        np.add.at(self.confusion, (y_true, y_pred), 1)
+        bins = np.clip((y_probs * self.roc_bins).astype(np.int64), 0, self.roc_bins - 1)
+        for c in range(self.n_classes):
+            positive = y_true == c
+            self.positives[c] += np.bincount(bins[positive, c], minlength=self.roc_bins)
+            self.negatives[c] += np.bincount(bins[~positive, c], minlength=self.roc_bins)
+
+    @property
+    def accuracy(self) -> float:
+        total = self.confusion.sum()
+        return float(np.trace(self.confusion) / total) if total else 0.0
+
+    def roc_curves(self) -> List[Tuple[np.ndarray, np.ndarray, float]]:
+        """(fpr, tpr, auc) por classe, varrendo o limiar da faixa mais alta para a mais baixa."""
+        curves = []
+        for c in range(self.n_classes):
+            tp = np.concatenate([[0], np.cumsum(self.positives[c][::-1])])
+            fp = np.concatenate([[0], np.cumsum(self.negatives[c][::-1])])
+            with np.errstate(invalid="ignore", divide="ignore"):
+                tpr = tp / tp[-1]
+                fpr = fp / fp[-1]
+            curves.append((fpr, tpr, float(np.trapz(tpr, fpr))))
+        return curves
+
+
+def report_from_confusion(cm: np.ndarray, class_names: List[str]) -> dict:
+    """Mesmo dicionário do classification_report(output_dict=True) do sklearn, a partir da matriz de confusão."""
+    tp = np.diag(cm).astype(float)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(support > 0, tp / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    report = {}
+    for i, name in enumerate(class_names):
+        report[name] = {"precision": float(precision[i]), "recall": float(recall[i]),
+                        "f1-score": float(f1[i]), "support": int(support[i])}
+    total = int(support.sum())
+    report["accuracy"] = float(tp.sum() / total) if total else 0.0
+    report["macro avg"] = {"precision": float(precision.mean()), "recall": float(recall.mean()),
+                           "f1-score": float(f1.mean()), "support": total}
+    weights = support / total if total else np.zeros_like(precision)
+    report["weighted avg"] = {"precision": float(precision @ weights), "recall": float(recall @ weights),
+                              "f1-score": float(f1 @ weights), "support": total}
+    return report
+
+
+def evaluate_streaming(predict: Predictor, X_test, y_test, class_names: List[str], batch_size: int = 32,
+                       prefetch: int = 2, roc_bins: int = ROC_BINS) -> StreamingMetrics:
+    """Avalia lote a lote, sem materializar X_test nem a matriz de probabilidades."""
+    metrics = StreamingMetrics(len(class_names), roc_bins)
+    for start, batch in iter_batches(X_test, batch_size, prefetch):
+        with instrumentation.etapa("evaluate.predict"):
+            y_probs = predict(batch)
+        y_true = encode_labels(np.asarray(y_test[start:start + len(batch)]), class_names)
+        metrics.update(y_true, y_probs)
+    return metrics
+
+
+def log_mlflow(mlflow_uri: str, artifacts: List[Path]):
+    import mlflow
+
+    try:
+        mlflow.set_tracking_uri(mlflow_uri)
+        mlflow.set_experiment("iris_diagnostic_evaluation")
+
+        with mlflow.start_run():
+            for artifact in artifacts:
+                if artifact.exists():
+                    mlflow.log_artifact(str(artifact))
+            instrumentation.registrar_mlflow()
+        print("MLflow log concluído.")
+    except Exception as e:
+        print(f"Erro no MLflow log: {e}")
+
+
+def evaluate_model(model_path: Optional[Path] = None, dataset_path: Optional[Path] = None, streaming: bool = False,
+                   batch_size: int = 32, prefetch: int = 2, roc_bins: int = ROC_BINS):
+    """
+    Com `streaming`, o split de teste é lido em lotes (memmap, no caso dos
+    shards) e as métricas são acumuladas lote a lote; os relatórios gerados
+    são os mesmos, com a ROC calculada sobre `roc_bins` faixas de probabilidade.
+    """
+    with instrumentation.etapa("evaluate.carregar_dados"):
+        X_test, y_test = dataset_store.abrir_split(dataset_path or origem_dataset_padrao(), "test")
+    model_path = model_path or find_latest_model()
+
+    print(f"Carregando modelo → {model_path}")
+    with instrumentation.etapa("evaluate.carregar_modelo"):
+        predict = load_predictor(model_path)
+    class_names = resolve_classes(model_path.parent, y_test)
+
+    if streaming:
+        metrics = evaluate_streaming(predict, X_test, y_test, class_names, batch_size, prefetch, roc_bins)
+        cm = metrics.confusion
+        results = {
+            "accuracy": metrics.accuracy,
+            "confusion_matrix": cm.tolist(),
+            "classification_report": report_from_confusion(cm, class_names),
+        }
+    else:
+        with instrumentation.etapa("evaluate.predict"):
+            y_probs = predict_in_batches(predict, X_test, batch_size)
+        y_pred = np.argmax(y_probs, axis=1)
+        y_true = encode_labels(y_test, class_names)
+
+        from sklearn.metrics import classification_report, confusion_matrix
+
+        with instrumentation.etapa("evaluate.metricas"):
+            cm = confusion_matrix(y_true, y_pred, labels=range(len(class_names)))
+            report = classification_report(y_true, y_pred, labels=range(len(class_names)),
+                                           target_names=class_names, output_dict=True, zero_division=0)
+
+        results = {
+            "accuracy": float(np.mean(y_pred == y_true)),
+            "confusion_matrix": cm.tolist(),
+            "classification_report": report,
+        }
+
+    report_path = save_json_report(results, "evaluation_report.json")
+    cm_img_path = ARTIFACTS_DIR / "confusion_matrix.png"
+    roc_img_path = ARTIFACTS_DIR / "roc.png"
+    with instrumentation.etapa("evaluate.graficos"):
+        plot_confusion(cm, class_names, cm_img_path)
+        try:
+            if streaming:
+                plot_roc(metrics.roc_curves(), class_names, roc_img_path)
+            else:
+                plot_roc_curves(y_true, y_probs, class_names, roc_img_path)
+        except Exception:
+            print("Falha ao gerar curvas ROC.")
+    instrumentation.salvar("evaluate", str(ARTIFACTS_DIR))
+
+    mlflow_uri = os.getenv("MLFLOW_TRACKING_URI")
+    if mlflow_uri:
+        log_mlflow(mlflow_uri, [report_path, cm_img_path, roc_img_path])
+
+    print("Avaliação finalizada com sucesso.")
+
+
+class MemoryBudget:
+    """Limita a soma da memória estimada dos modelos carregados ao mesmo tempo."""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.used = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, n_bytes: int):
+        with self._cond:
+            # Um modelo maior que o orçamento inteiro ainda roda, mas sozinho.
+            self._cond.wait_for(lambda: self.used == 0 or self.used + n_bytes <= self.budget_bytes)
+            self.used += n_bytes
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.used -= n_bytes
+                self._cond.notify_all()
+
+
+class ExclusiveGate:
+    """Lotes de predição entram juntos; a medição de latência espera e roda sozinha."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._exclusive)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._exclusive)
+            self._exclusive = True
+            self._cond.wait_for(lambda: self._shared == 0)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+def discover_models(models_dir: Path, patterns: Optional[List[str]] = None,
+                    types: Tuple[str, ...] = ("saved_model", "keras", "h5")) -> List[dict]:
+    """Artefatos completos em models_dir (via RegistroModelos), filtrados por tipo e padrões glob da versão."""
+    registry = RegistroModelos(models_dir, idade_minima_s=0)
+    artifacts = [a for a in registry.atualizar() if a["tipo"] in types]
+    if patterns:
+        artifacts = [a for a in artifacts if any(fnmatch.fnmatch(a["versao"], p) for p in patterns)]
+    return artifacts
+
+
+def _evaluate_artifact(artifact: dict, X_test, y_test, batch_size: int, latency_samples: int,
+                       budget: MemoryBudget, gate: ExclusiveGate, load_lock: threading.Lock) -> dict:
+    from sklearn.metrics import classification_report, roc_curve, auc
+
+    row = {"model": artifact["versao"], "type": artifact["tipo"], "size_mb": artifact["tamanho_bytes"] / 1e6}
+    try:
+        with budget.reserve(int(artifact["tamanho_bytes"] * SWEEP_MEMORY_FACTOR)):
+            with load_lock:  # a desserialização do Keras não é segura entre threads
+                predict = load_predictor(artifact["caminho"])
+            batches = []
+            for start in range(0, len(X_test), batch_size):
+                batch = batch_at(X_test, start, start + batch_size)
+                with gate.shared():
+                    batches.append(predict(batch))
+            y_probs = np.concatenate(batches)
+            with gate.exclusive():
+                row.update(measure_latency(predict, X_test, latency_samples))
+            del predict
+
+        # Checkpoints .keras ficam soltos em models/, sem label_classes.json: a ordem vem do dataset.
+        class_names = artifact["classes"] or dataset_classes(y_test)
+        y_true = encode_labels(np.asarray(y_test), class_names)
+        y_pred = np.argmax(y_probs, axis=1)
+        report = classification_report(y_true, y_pred, labels=range(len(class_names)),
+                                       target_names=class_names, output_dict=True, zero_division=0)
+        aucs = {}
+        for i, name in enumerate(class_names):
+            if 0 < np.sum(y_true == i) < len(y_true):
+                fpr, tpr, _ = roc_curve(y_true == i, y_probs[:, i])
+                aucs[name] = float(auc(fpr, tpr))
+        row.update(
+            status="ok",
+            accuracy=float(np.mean(y_pred == y_true)),
+            f1={name: report[name]["f1-score"] for name in class_names},
+            macro_f1=report["macro avg"]["f1-score"],
+            auc=aucs,
+            macro_auc=float(np.mean(list(aucs.values()))) if aucs else None,
+        )
+    except Exception as e:
+        row.update(status="erro", error=str(e))
+        print(f"Falha ao avaliar {artifact['versao']}: {e}")
+    return row
+
+
+def evaluate_sweep(models_dir: Path = MODELS_DIR, dataset_path: Optional[Path] = None,
+                   patterns: Optional[List[str]] = None, workers: int = 2, memory_budget_mb: float = 4096,
+                   batch_size: int = 32, latency_samples: int = 50) -> List[dict]:
+    """
+    Avalia todos os artefatos encontrados (ou os que casam com `patterns`)
+    sobre o mesmo split de teste, carregado uma única vez. Até `workers`
+    modelos rodam em paralelo, desde que a memória estimada deles caiba em
+    `memory_budget_mb`. Retorna uma linha por modelo, ordenada pela acurácia.
+    """
+    artifacts = discover_models(models_dir, patterns)
+    if not artifacts:
+        raise FileNotFoundError(f"Nenhum modelo encontrado em {models_dir}")
+
+    with instrumentation.etapa("evaluate.carregar_dados"):
+        X_test, y_test = dataset_store.abrir_split(dataset_path or origem_dataset_padrao(), "test")
+        if isinstance(X_test, dataset_store.SplitShards):
+            X_test = X_test.carregar(normalizado=False)  # uint8; cada lote é normalizado na hora
+    print(f"{len(artifacts)} modelos | {len(X_test)} imagens de teste | workers={workers}")
+
+    budget = MemoryBudget(int(memory_budget_mb * 2**20))
+    gate = ExclusiveGate()
+    load_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sweep") as executor:
+        rows = list(executor.map(
+            lambda a: _evaluate_artifact(a, X_test, y_test, batch_size, latency_samples, budget, gate, load_lock),
+            artifacts,
+        ))
+    return sorted(rows, key=lambda r: r.get("accuracy", -1.0), reverse=True)
+
+
+def print_sweep(rows: List[dict]):
+    class_names = sorted({name for r in rows for name in r.get("f1", {})})
+    header = f"{'modelo':<55} {'acurácia':>9} {'AUC':>6} {'lat. ms':>8} " + " ".join(f"F1 {n:>10}" for n in class_names)
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        if r["status"] != "ok":
+            print(f"{r['model']:<55} erro: {r['error']}")
+            continue
+        macro_auc = f"{r['macro_auc']:.3f}" if r["macro_auc"] is not None else "-"
+        f1 = " ".join(f"{r['f1'].get(n, float('nan')):>13.3f}" for n in class_names)
+        print(f"{r['model']:<55} {r['accuracy']:>9.4f} {macro_auc:>6} {r['latency_ms_mean']:>8.2f} {f1}")
+
+
+def log_sweep_mlflow(mlflow_uri: str, rows: List[dict], report_path: Path, dataset_path: Path):
+    """Uma run pai com a tabela comparativa e uma run aninhada por modelo."""
+    import mlflow
+
+    try:
+        mlflow.set_tracking_uri(mlflow_uri)
+        mlflow.set_experiment("iris_diagnostic_evaluation")
+
+        with mlflow.start_run(run_name=f"sweep_{int(time.time())}"):
+            mlflow.log_param("dataset", str(dataset_path))
+            mlflow.log_param("models", len(rows))
+            mlflow.log_artifact(str(report_path))
+            for r in rows:
+                with mlflow.start_run(run_name=r["model"], nested=True):
+                    mlflow.log_params({"model": r["model"], "type": r["type"], "status": r["status"]})
+                    if r["status"] != "ok":
+                        continue
+                    metrics = {"accuracy": r["accuracy"], "macro_f1": r["macro_f1"], "size_mb": r["size_mb"],
+                               "latency_ms_mean": r["latency_ms_mean"], "latency_ms_p95": r["latency_ms_p95"]}
+                    metrics.update({f"f1_{n}": v for n, v in r["f1"].items()})
+                    metrics.update({f"auc_{n}": v for n, v in r["auc"].items()})
+                    mlflow.log_metrics(metrics)
+        print("MLflow log concluído.")
+    except Exception as e:
+        print(f"Erro no MLflow log: {e}")
+
+
+def find_variants(variants: List[str]) -> Dict[str, Path]:
+    """Aceita arquivos .tflite ou diretórios com eles (ex.: a pasta tflite gerada por export_tflite.py)."""
+    found = {}
+    for item in map(Path, variants):
+        for path in sorted(item.glob("*.tflite")) if item.is_dir() else [item]:
+            found[path.stem.replace("model_", "")] = path
+    return found
+
+
+def compare_variants(
+    baseline_path: Path,
+    variant_paths: Dict[str, Path],
+    dataset_path: Optional[Path] = None,
+    batch_size: int = 32,
+    latency_samples: int = 50,
+    num_threads: Optional[int] = None,
+) -> List[dict]:
+    """
+    Avalia o modelo float32 de referência e cada variante no mesmo split de
+    teste e devolve uma linha por modelo com acurácia, delta de acurácia em
+    relação à referência, latência por imagem, throughput e tamanho.
+    """
+    X_test, y_test = dataset_store.abrir_split(dataset_path or origem_dataset_padrao(), "test")
+    class_names = resolve_classes(baseline_path.parent, y_test)
+    y_true = encode_labels(np.asarray(y_test), class_names)
+
+    rows = []
+    for name, path in [("float32", baseline_path)] + list(variant_paths.items()):
+        print(f"Avaliando {name} → {path}")
+        predict = load_predictor(path, num_threads)
+        y_pred = np.argmax(predict_in_batches(predict, X_test, batch_size), axis=1)
+        rows.append({
+            "variant": name,
+            "path": str(path),
+            "accuracy": float(np.mean(y_pred == y_true)),
+            **measure_latency(predict, X_test, latency_samples),
+            "throughput_img_s": measure_throughput(predict, X_test, batch_size),
+            "size_mb": model_size_mb(path),
+        })
+
+    for row in rows:
+        row["accuracy_delta"] = row["accuracy"] - rows[0]["accuracy"]
+    return rows
+
+
+def print_comparison(rows: List[dict]):
+    header = f"{'variante':<10} {'acurácia':>9} {'delta':>8} {'lat. média':>11} {'lat. p95':>9} {'img/s':>8} {'MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['variant']:<10} {r['accuracy']:>9.4f} {r['accuracy_delta']:>+8.4f} "
+              f"{r['latency_ms_mean']:>9.2f}ms {r['latency_ms_p95']:>7.2f}ms "
+              f"{r['throughput_img_s']:>8.1f} {r['size_mb']:>8.2f}")
+
+
+def cascade_tradeoff(confidence: np.ndarray, pred_stage1: np.ndarray, pred_full: np.ndarray, y_true: np.ndarray,
+                     latency_stage1_ms: float, latency_full_ms: float,
+                     thresholds: Optional[np.ndarray] = None) -> List[dict]:
+    """
+    Para cada limiar: taxa de escalonamento (confiança calibrada <= limiar),
+    acurácia da cascata e latência média estimada por imagem (o estágio 1
+    sempre roda; o modelo completo só nas escaladas).
+    """
+    if thresholds is None:
+        thresholds = np.round(np.linspace(0.0, 1.0, 101), 2)
+    rows = []
+    for threshold in thresholds:
+        escalate = confidence <= threshold
+        pred = np.where(escalate, pred_full, pred_stage1)
+        latency = latency_stage1_ms + float(np.mean(escalate)) * latency_full_ms
+        rows.append({
+            "threshold": float(threshold),
+            "escalation_rate": float(np.mean(escalate)),
+            "accuracy": float(np.mean(pred == y_true)),
+            "latency_ms_estimated": latency,
+            "speedup": latency_full_ms / latency if latency > 0 else None,
+        })
+    return rows
+
+
+def choose_threshold(rows: List[dict], full_accuracy: float, max_accuracy_drop: float) -> dict:
+    """A linha mais rápida cuja acurácia fica a no máximo `max_accuracy_drop` da do modelo completo."""
+    eligible = [r for r in rows if r["accuracy"] >= full_accuracy - max_accuracy_drop]
+    # Sempre há ao menos o limiar 1.0 (tudo escalado), com a acurácia do modelo completo.
+    return min(eligible or rows[-1:], key=lambda r: (r["latency_ms_estimated"], -r["threshold"]))
+
+
+def resolve_cascade_inputs(config_path: Path, model_path: Optional[Path] = None,
+                           dataset_path: Optional[Path] = None) -> Tuple[Path, Path]:
+    """
+    Modelo completo e dataset da cascata: os passados explicitamente, senão os
+    do cascade.json (`modelo_completo`, gravado pela última avaliação, e
+    `dataset`, o do treino do estágio 1). Sem modelo no config (ou com um que
+    não existe mais), vale o mais recente do RegistroModelos em MODELS_DIR.
+    """
+    config = json.loads(Path(config_path).read_text(encoding="utf-8"))
+    if model_path is None and config.get("modelo_completo"):
+        model_path = Path(config["modelo_completo"])
+        if not model_path.exists():
+            print(f"Aviso: modelo completo do {config_path} não existe mais ({model_path}); usando o registro.")
+            model_path = None
+    if model_path is None:
+        try:
+            model_path = find_latest_model()
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Nenhum modelo completo para a cascata: {config_path} não tem um 'modelo_completo' válido e não há "
+                f"modelos em {MODELS_DIR}. Passe --model com o caminho do modelo.") from None
+    if dataset_path is None:
+        dataset_path = Path(config["dataset"]) if config.get("dataset") else origem_dataset_padrao()
+    return Path(model_path), Path(dataset_path)
+
+
+def evaluate_cascade(config_path: Path, model_path: Optional[Path] = None, dataset_path: Optional[Path] = None,
+                     batch_size: int = 32, latency_samples: int = 50, max_accuracy_drop: float = 0.005,
+                     save_threshold: bool = True) -> dict:
+    """
+    Escolhe o limiar da cascata no split de validação e confere no de teste.
+    Na validação, os dois estágios rodam uma vez sobre todas as imagens e a
+    curva acurácia x latência é montada a partir das latências medidas de
+    cada um. No teste, a cascata roda de verdade com o limiar escolhido.
+    """
+    import cascade
+
+    model_path, dataset_path = resolve_cascade_inputs(config_path, model_path, dataset_path)
+    print(f"Estágio 1 → {config_path} | modelo completo → {model_path}")
+    cascata = cascade.Cascata.carregar(config_path)
+    predict_full = load_predictor(model_path)
+
+    X_val, y_val = dataset_store.abrir_split(dataset_path, "val")
+    class_names = cascata.classes or resolve_classes(model_path.parent, y_val)
+    y_val_true = encode_labels(np.asarray(y_val), class_names)
+    with instrumentation.etapa("evaluate.cascata_validacao"):
+        probs_stage1 = predict_in_batches(cascata.confianca, X_val, batch_size)
+        pred_full = np.argmax(predict_in_batches(predict_full, X_val, batch_size), axis=1)
+    latency_stage1 = measure_latency(cascata.confianca, X_val, latency_samples)["latency_ms_mean"]
+    latency_full = measure_latency(predict_full, X_val, latency_samples)["latency_ms_mean"]
+
+    rows = cascade_tradeoff(probs_stage1.max(axis=1), probs_stage1.argmax(axis=1), pred_full, y_val_true,
+                            latency_stage1, latency_full)
+    full_accuracy = float(np.mean(pred_full == y_val_true))
+    chosen = choose_threshold(rows, full_accuracy, max_accuracy_drop)
+    cascata.limiar = chosen["threshold"]
+
+    X_test, y_test = dataset_store.abrir_split(dataset_path, "test")
+    y_test_true = encode_labels(np.asarray(y_test), class_names)
+    predict_cascade = lambda batch: cascata.prever(batch, predict_full)  # noqa: E731
+    with instrumentation.etapa("evaluate.cascata_teste"):
+        pred_cascade = np.argmax(predict_in_batches(predict_cascade, X_test, batch_size), axis=1)
+        escalation_rate = cascata.resumo()["taxa_escalonamento"]
+        pred_full_test = np.argmax(predict_in_batches(predict_full, X_test, batch_size), axis=1)
+    test = {
+        "accuracy": float(np.mean(pred_cascade == y_test_true)),
+        "accuracy_full": float(np.mean(pred_full_test == y_test_true)),
+        "escalation_rate": escalation_rate,
+        "latency_ms_mean": measure_latency(predict_cascade, X_test, latency_samples)["latency_ms_mean"],
+        "latency_ms_mean_full": measure_latency(predict_full, X_test, latency_samples)["latency_ms_mean"],
+    }
+
+    if save_threshold:
+        cascade.salvar_config(config_path, limiar=chosen["threshold"], modelo_completo=str(model_path))
+    return {
+        "config": str(config_path),
+        "model": str(model_path),
+        "temperature": cascata.temperatura,
+        "max_accuracy_drop": max_accuracy_drop,
+        "validation": {"accuracy_full": full_accuracy, "latency_ms_stage1": latency_stage1,
+                       "latency_ms_full": latency_full, "chosen": chosen, "curve": rows},
+        "test": test,
+    }
+
+
+def print_cascade(result: dict):
+    val, test, chosen = result["validation"], result["test"], result["validation"]["chosen"]
+    header = f"{'limiar':>7} {'escalonamento':>14} {'acurácia':>9} {'lat. estimada':>14} {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in val["curve"]:
+        if round(r["threshold"] * 100) % 5 and r is not chosen:
+            continue
+        marca = " <-" if r is chosen else ""
+        print(f"{r['threshold']:>7.2f} {r['escalation_rate']:>13.1%} {r['accuracy']:>9.4f} "
+              f"{r['latency_ms_estimated']:>12.2f}ms {r['speedup']:>7.2f}x{marca}")
+    print(f"\nValidação: estágio 1 {val['latency_ms_stage1']:.2f}ms, completo {val['latency_ms_full']:.2f}ms, "
+          f"acurácia do completo {val['accuracy_full']:.4f}")
+    print(f"Teste com limiar {chosen['threshold']:.2f}: acurácia {test['accuracy']:.4f} "
+          f"(completo {test['accuracy_full']:.4f}), escalonamento {test['escalation_rate']:.1%}, "
+          f"latência {test['latency_ms_mean']:.2f}ms (completo {test['latency_ms_mean_full']:.2f}ms)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Avaliar o modelo treinado ou comparar variantes TFLite.")
+    parser.add_argument("--model", type=str, help="SavedModel/.keras/.h5/.tflite (padrão: o mais recente em models/)")
+    parser.add_argument("--dataset", type=str,
+                        help="Shards ou .npz processado (padrão: o de data/processed, o mesmo do train)")
+    parser.add_argument("--variants", nargs="+",
+                        help="Arquivos .tflite ou diretórios com eles; compara cada um com o modelo float32")
+    parser.add_argument("--batch-size", dest="batch_size", type=int, default=32)
+    parser.add_argument("--latency-samples", dest="latency_samples", type=int, default=50,
+                        help="Imagens usadas na medição de latência por imagem")
+    parser.add_argument("--threads", type=int, help="Threads do interpretador TFLite")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Avaliar todos os modelos de models/ (ou os filtrados) sobre o mesmo teste")
+    parser.add_argument("--models-dir", dest="models_dir", type=str, default=str(MODELS_DIR),
+                        help="Diretório varrido pelo --sweep")
+    parser.add_argument("--filter", nargs="+", help="Padrões glob da versão dos modelos no --sweep")
+    parser.add_argument("--workers", type=int, default=2, help="Modelos avaliados em paralelo no --sweep")
+    parser.add_argument("--memory-budget-mb", dest="memory_budget_mb", type=float, default=4096,
+                        help="Memória estimada máxima dos modelos carregados ao mesmo tempo no --sweep")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Ler o teste em lotes e acumular as métricas sem carregar tudo em memória")
+    parser.add_argument("--prefetch", type=int, default=2, help="Lotes lidos à frente no modo streaming")
+    parser.add_argument("--roc-bins", dest="roc_bins", type=int, default=ROC_BINS,
+                        help="Faixas de probabilidade usadas na ROC do modo streaming")
+    parser.add_argument("--cascade", type=str,
+                        help="cascade.json do estágio 1: escolher o limiar na validação e avaliar a cascata no teste "
+                             "(modelo e dataset padrão: os do cascade.json)")
+    parser.add_argument("--max-accuracy-drop", dest="max_accuracy_drop", type=float, default=0.005,
+                        help="Perda máxima de acurácia (validação) aceita em troca de latência no --cascade")
+    parser.add_argument("--no-save-threshold", dest="save_threshold", action="store_false",
+                        help="Não gravar o limiar escolhido no cascade.json")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    model_path = Path(args.model) if args.model else None
+    dataset_path = Path(args.dataset) if args.dataset else None
+    if args.cascade:
+        result = evaluate_cascade(Path(args.cascade), model_path, dataset_path, args.batch_size,
+                                  args.latency_samples, args.max_accuracy_drop, args.save_threshold)
+        print_cascade(result)
+        report_path = save_json_report(result, "cascade_report.json")
+        mlflow_uri = os.getenv("MLFLOW_TRACKING_URI")
+        if mlflow_uri:
+            log_mlflow(mlflow_uri, [report_path])
+    elif args.sweep:
+        dataset_path = dataset_path or origem_dataset_padrao()
+        rows = evaluate_sweep(Path(args.models_dir), dataset_path, args.filter, args.workers, args.memory_budget_mb,
+                              args.batch_size, args.latency_samples)
+        print_sweep(rows)
+        report_path = save_json_report({"dataset": str(dataset_path), "models": rows}, "sweep_report.json")
+        mlflow_uri = os.getenv("MLFLOW_TRACKING_URI")
+        if mlflow_uri:
+            log_sweep_mlflow(mlflow_uri, rows, report_path, dataset_path)
+    elif not args.variants:
+        evaluate_model(model_path, dataset_path, args.streaming, args.batch_size, args.prefetch, args.roc_bins)
+    else:
+        baseline = model_path or find_latest_model()
+        rows = compare_variants(baseline, find_variants(args.variants), dataset_path,
+                                args.batch_size, args.latency_samples, args.threads)
+        print_comparison(rows)
+        report_path = save_json_report({"baseline": str(baseline), "variants": rows}, "variant_comparison.json")
+        mlflow_uri = os.getenv("MLFLOW_TRACKING_URI")
+        if mlflow_uri:
+            log_mlflow(mlflow_uri, [report_path])
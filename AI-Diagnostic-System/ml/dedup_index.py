@@ -0,0 +1,216 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+VERSAO_INDICE = 1
+LIMIAR_PADRAO = 6  # bits diferentes (de 64) para duas imagens contarem como quase-duplicatas
+POLITICAS = ("manter", "pular", "agrupar")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS phashes (
+    path TEXT PRIMARY KEY,
+    tamanho INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    phash INTEGER,
+    erro TEXT
+);
+"""
+
+
+def phash(imagem):
+    """
+    Hash perceptual de 64 bits (pHash): DCT da imagem em cinza reduzida a
+    32x32; cada bit diz se o coeficiente de baixa frequência está acima da
+    mediana. Recompressão, redimensionamento e pequenas mudanças de
+    exposição mudam poucos bits.
+    """
+    if imagem.ndim == 3:
+        imagem = cv2.cvtColor(imagem, cv2.COLOR_BGR2GRAY)
+    reduzida = cv2.resize(imagem, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    baixas = cv2.dct(reduzida)[:8, :8].flatten()
+    bits = baixas > np.median(baixas[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def calcular_phash(path):
+    """(phash, erro). O JPEG é decodificado já reduzido e em cinza, bem mais barato que a leitura cheia."""
+    try:
+        imagem = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+        if imagem is None:
+            raise ValueError("cv2.imread não conseguiu decodificar o arquivo")
+        return phash(imagem), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _para_sqlite(valor):
+    # INTEGER do SQLite é de 64 bits com sinal.
+    return valor - (1 << 64) if valor is not None and valor >= 1 << 63 else valor
+
+
+def _de_sqlite(valor):
+    return valor + (1 << 64) if valor is not None and valor < 0 else valor
+
+
+class ArvoreBK:
+    """
+    BK-tree sobre a distância de Hamming: a busca por raio descarta as
+    subárvores cuja distância ao nó fica fora de [d - limiar, d + limiar],
+    sem comparar contra todos os hashes.
+    """
+
+    def __init__(self):
+        self.raiz = None
+        self._tamanho = 0
+
+    def __len__(self):
+        return self._tamanho
+
+    def inserir(self, valor, item):
+        self._tamanho += 1
+        if self.raiz is None:
+            self.raiz = (valor, [item], {})
+            return
+        no = self.raiz
+        while True:
+            d = hamming(valor, no[0])
+            if d == 0:
+                no[1].append(item)
+                return
+            filho = no[2].get(d)
+            if filho is None:
+                no[2][d] = (valor, [item], {})
+                return
+            no = filho
+
+    def buscar(self, valor, limiar):
+        """[(distância, item)] dos itens a até `limiar` bits de `valor`."""
+        encontrados = []
+        pendentes = [self.raiz] if self.raiz is not None else []
+        while pendentes:
+            no = pendentes.pop()
+            d = hamming(valor, no[0])
+            if d <= limiar:
+                encontrados.extend((d, item) for item in no[1])
+            for distancia, filho in no[2].items():
+                if d - limiar <= distancia <= d + limiar:
+                    pendentes.append(filho)
+        return encontrados
+
+
+class IndiceDuplicatas:
+    """
+    Índice SQLite persistente com o pHash de cada imagem. Arquivos com
+    tamanho e mtime inalterados não são relidos em `atualizar`.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conexao = sqlite3.connect(self.path)
+        self.conexao.executescript(_SCHEMA)
+        self.conexao.execute(f"PRAGMA user_version = {VERSAO_INDICE}")
+
+    def fechar(self):
+        self.conexao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+        return False
+
+    def atualizar(self, paths, workers=None):
+        """Calcula em paralelo o pHash só dos arquivos novos ou alterados. Retorna as contagens."""
+        conhecidos = {path: (tamanho, mtime) for path, tamanho, mtime in
+                      self.conexao.execute("SELECT path, tamanho, mtime_ns FROM phashes")}
+        pendentes = []
+        for path in paths:
+            st = os.stat(path)
+            if conhecidos.get(path) != (st.st_size, st.st_mtime_ns):
+                pendentes.append((path, st))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            calculados = list(executor.map(calcular_phash, [path for path, _ in pendentes]))
+
+        with self.conexao:
+            self.conexao.executemany(
+                "INSERT OR REPLACE INTO phashes (path, tamanho, mtime_ns, phash, erro) VALUES (?, ?, ?, ?, ?)",
+                [(path, st.st_size, st.st_mtime_ns, _para_sqlite(valor), erro)
+                 for (path, st), (valor, erro) in zip(pendentes, calculados)],
+            )
+        return {"total": len(paths), "calculados": len(pendentes), "reutilizados": len(paths) - len(pendentes),
+                "falhas": sum(1 for _, erro in calculados if erro is not None)}
+
+    def hashes(self, paths=None):
+        """{path: phash} das imagens legíveis (só de `paths`, quando passado)."""
+        cursor = self.conexao.execute("SELECT path, phash FROM phashes WHERE erro IS NULL")
+        todos = {path: _de_sqlite(valor) for path, valor in cursor}
+        if paths is None:
+            return todos
+        return {path: todos[path] for path in paths if path in todos}
+
+
+def agrupar(hashes, limiar=LIMIAR_PADRAO):
+    """
+    Grupos de quase-duplicatas: componentes conexas do grafo "a até `limiar`
+    bits", montadas com consultas à BK-tree. Retorna listas de paths com mais
+    de um membro; o primeiro (em ordem de path) é o representante.
+    """
+    arvore = ArvoreBK()
+    for path, valor in hashes.items():
+        arvore.inserir(valor, path)
+
+    pai = {path: path for path in hashes}
+
+    def raiz(path):
+        while pai[path] != path:
+            pai[path] = pai[pai[path]]
+            path = pai[path]
+        return path
+
+    for path, valor in hashes.items():
+        for _, vizinho in arvore.buscar(valor, limiar):
+            a, b = raiz(path), raiz(vizinho)
+            if a != b:
+                pai[max(a, b)] = min(a, b)
+
+    grupos = {}
+    for path in sorted(hashes):
+        grupos.setdefault(raiz(path), []).append(path)
+    return [membros for membros in grupos.values() if len(membros) > 1]
+
+
+def detectar(itens, indice_path, limiar=LIMIAR_PADRAO, workers=None):
+    """
+    Atualiza o índice com `itens` [(path, classe)] e devolve
+    ({path: representante} das imagens em grupos, grupos, contagens do índice).
+    """
+    paths = [path for path, _ in itens]
+    with IndiceDuplicatas(indice_path) as indice:
+        contagens = indice.atualizar(paths, workers)
+        hashes = indice.hashes(paths)
+    grupos = agrupar(hashes, limiar)
+    representante = {path: membros[0] for membros in grupos for path in membros}
+    return representante, grupos, contagens
+
+
+def resumir(itens, grupos, limiar, politica):
+    """Resumo para os relatórios: grupos, imagens redundantes e grupos com classes misturadas."""
+    classe = dict(itens)
+    return {
+        "politica": politica,
+        "limiar_hamming": limiar,
+        "grupos": len(grupos),
+        "imagens_em_grupos": sum(len(g) for g in grupos),
+        "redundantes": sum(len(g) - 1 for g in grupos),
+        "grupos_com_classes_diferentes": [g for g in grupos if len({classe[p] for p in g}) > 1],
+    }
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+"""
+Destilação de conhecimento: treina um aluno pequeno nas probabilidades
+suavizadas (temperatura T) de um professor já exportado em models/ e nos
+rótulos verdadeiros. A perda é
+
+    alfa * CE(rótulo, aluno) + (1 - alfa) * T² * KL(softmax(prof / T) || softmax(aluno / T))
+
+Os dois modelos exportados terminam em softmax, então as log-probabilidades
+fazem o papel dos logits (a softmax com temperatura é a mesma). As do
+professor são calculadas uma vez por versão do dataset e ficam em
+data/teacher_logits/<chave>/<split>.npy. Como elas valem para as imagens
+originais, o aluno treina sem aumento de dados. Uso:
+
+    python ml/train.py --professor models/iris_model_final_<ts>/saved_model --aluno mobilenet_small
+
+Gera models/iris_student_<timestamp>/saved_model e loga no MLflow, lado a
+lado para professor e aluno, tamanho, parâmetros e latência em CPU.
+"""
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+import dataset_store
+import instrumentation
+import mlflow_tracking
+from embedding_cache import versao_dataset
+
+ROOT = Path(__file__).resolve().parents[1]
+MODELS_DIR = ROOT / "models"
+LOGITS_DIR = ROOT / "data" / "teacher_logits"
+IMG_SHAPE = (224, 224, 3)
+VERSAO_CACHE = 1
+TEMPERATURA_PADRAO = 4.0
+ALFA_PADRAO = 0.5
+ALUNOS = ("mobilenet_small", "cnn")
+ALFA_MOBILENET = 0.75  # largura do MobileNetV3Small do aluno
+LEARNING_RATE = 5e-4
+DEFAULT_EPOCHS = 30
+BATCH_SIZE = 32
+AMOSTRAS_LATENCIA = 50
+RANDOM_SEED = 42
+
+
+def hash_saved_model(diretorio):
+    """Grafo e índice das variáveis (que guarda o checksum de cada tensor) identificam o SavedModel."""
+    h = hashlib.sha1()
+    for nome in ("saved_model.pb", os.path.join("variables", "variables.index")):
+        with open(os.path.join(str(diretorio), nome), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def log_probabilidades(probs):
+    return np.log(np.clip(probs, 1e-7, 1.0)).astype(np.float32)
+
+
+class CacheLogits:
+    """
+    Log-probabilidades do professor por split, em <cache_dir>/<chave>/<split>.npy
+    com forma (imagens, classes). A chave combina o hash do SavedModel do
+    professor e a versão do dataset: trocar qualquer um gera um cache novo.
+    """
+
+    def __init__(self, cache_dir, professor_hash, dataset_versao):
+        config = {"versao": VERSAO_CACHE, "professor": professor_hash, "dataset": dataset_versao}
+        self.chave = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+        self.diretorio = os.path.join(str(cache_dir), self.chave)
+        self.config = config
+
+    def caminho(self, split):
+        return os.path.join(self.diretorio, f"{split}.npy")
+
+    def obter(self, split, X, prever, batch_size):
+        """Logits de `split`; na primeira vez passa X pelo professor e grava o resultado."""
+        caminho = self.caminho(split)
+        if os.path.exists(caminho):
+            return np.load(caminho), False
+
+        os.makedirs(self.diretorio, exist_ok=True)
+        logits = np.concatenate([log_probabilidades(prever(lote))
+                                 for lote in dataset_store.iterar_lotes(X, batch_size)])
+        temporario = caminho + ".tmp.npy"
+        np.save(temporario, logits)
+        os.replace(temporario, caminho)
+        with open(os.path.join(self.diretorio, "config.json"), "w", encoding="utf-8") as f:
+            json.dump(self.config, f, indent=2)
+        return logits, True
+
+
+def construir_aluno(num_classes, arquitetura="mobilenet_small", input_shape=IMG_SHAPE,
+                    learning_rate=LEARNING_RATE, temperatura=TEMPERATURA_PADRAO, alfa=ALFA_PADRAO):
+    """
+    Aluno compilado com a perda de destilação. `mobilenet_small` é um
+    MobileNetV3Small (largura 0.75) treinado inteiro; `cnn` reaproveita a CNN
+    do estágio 1 da cascata, em 128x128.
+    """
+    import tensorflow as tf
+    from tensorflow import keras
+    from tensorflow.keras import layers, models
+
+    if arquitetura == "cnn":
+        import cascade
+
+        model = cascade.construir_estagio1(num_classes, input_shape, resolucao=128, filtros=(32, 64, 128, 192))
+    else:
+        base_model = keras.applications.MobileNetV3Small(
+            input_shape=input_shape,
+            include_top=False,
+            weights="imagenet",
+            pooling="avg",
+            alpha=ALFA_MOBILENET,
+            name="backbone",
+        )
+        inp = layers.Input(shape=input_shape, name="input_layer")
+        x = tf.keras.applications.mobilenet_v3.preprocess_input(inp)
+        x = base_model(x)
+        x = layers.Dropout(0.3, name="head_dropout")(x)
+        out = layers.Dense(num_classes, activation="softmax", name="output_layer")(x)
+        model = models.Model(inputs=inp, outputs=out, name="iris_aluno_mobilenet_small")
+
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+        loss=perda_destilacao(temperatura, alfa),
+        metrics=[acuracia_rotulo],
+    )
+    return model
+
+
+def perda_destilacao(temperatura=TEMPERATURA_PADRAO, alfa=ALFA_PADRAO):
+    """
+    Perda sobre alvos [rótulo, logits do professor...] e as probabilidades do
+    aluno. O fator T² mantém a escala do gradiente do termo suave.
+    """
+    import tensorflow as tf
+
+    def perda(alvo, probs):
+        rotulos = tf.cast(alvo[:, 0], tf.int32)
+        dura = tf.keras.losses.sparse_categorical_crossentropy(rotulos, probs)
+        suave_professor = tf.nn.softmax(alvo[:, 1:] / temperatura)
+        log_suave_aluno = tf.nn.log_softmax(tf.math.log(tf.clip_by_value(probs, 1e-7, 1.0)) / temperatura)
+        kl = tf.reduce_sum(
+            suave_professor * (tf.math.log(tf.clip_by_value(suave_professor, 1e-7, 1.0)) - log_suave_aluno), axis=-1)
+        return alfa * dura + (1 - alfa) * temperatura ** 2 * kl
+
+    return perda
+
+
+def acuracia_rotulo(alvo, probs):
+    """Acurácia contra o rótulo verdadeiro (a coluna 0 do alvo)."""
+    import tensorflow as tf
+
+    acertos = tf.equal(tf.argmax(probs, axis=-1, output_type=tf.int32), tf.cast(alvo[:, 0], tf.int32))
+    return tf.cast(acertos, tf.float32)
+
+
+def alvos(y_enc, logits):
+    return np.concatenate([np.asarray(y_enc, np.float32)[:, None], logits], axis=1)
+
+
+def medir_modelo(saved_model_dir, X, amostras=AMOSTRAS_LATENCIA):
+    """Tamanho em disco, número de parâmetros e latência por imagem (lote de 1) em CPU, em ms."""
+    import tensorflow as tf
+
+    diretorio = Path(saved_model_dir)
+    tamanho = sum(p.stat().st_size for p in diretorio.rglob("*") if p.is_file())
+    with tf.device("/CPU:0"):
+        carregado = tf.saved_model.load(str(diretorio))
+        parametros = sum(int(np.prod(v.shape)) for v in carregado.variables if v.dtype.is_floating)
+        amostras = min(amostras, len(X))
+        lotes = [np.asarray(lote, np.float32) for lote, _ in zip(dataset_store.iterar_lotes(X, 1), range(amostras))]
+        for lote in lotes[:5]:
+            carregado.serve(tf.constant(lote))
+        tempos = []
+        for lote in lotes:
+            inicio = time.perf_counter()
+            carregado.serve(tf.constant(lote)).numpy()
+            tempos.append((time.perf_counter() - inicio) * 1000.0)
+    return {
+        "size_mb": tamanho / 1e6,
+        "parametros": parametros,
+        "latency_ms_mean": float(np.mean(tempos)),
+        "latency_ms_p95": float(np.percentile(tempos, 95)),
+    }
+
+
+def treinar_aluno(args):
+    import tensorflow as tf
+    from tensorflow.keras import callbacks
+
+    import tf_dataset
+    from cascade import prever_em_lotes
+    from model_registry import carregar_artefato
+    from train import codificar_labels, origem_dataset_padrao
+
+    tf.random.set_seed(RANDOM_SEED)
+    professor_dir = Path(args.professor)
+    if not (professor_dir / "saved_model.pb").exists():
+        raise FileNotFoundError(f"SavedModel do professor não encontrado em {professor_dir}")
+    origem = Path(args.dataset) if args.dataset else origem_dataset_padrao()
+    with instrumentation.etapa("distillation.carregar_dados"):
+        splits = {split: dataset_store.abrir_split(origem, split) for split in dataset_store.SPLITS}
+    y_train_enc, y_val_enc, y_test_enc, num_classes, label_encoder = codificar_labels(
+        *(splits[split][1] for split in dataset_store.SPLITS))
+    label_names = label_encoder.classes_
+    classes_professor = professor_dir.parent / "label_classes.json"
+    if classes_professor.exists():
+        if json.loads(classes_professor.read_text(encoding="utf-8")) != label_names.tolist():
+            raise ValueError(f"As classes do professor ({classes_professor}) não batem com as do dataset")
+
+    epochs = args.epochs or DEFAULT_EPOCHS
+    batch_size = args.batch_size or BATCH_SIZE
+    temperatura = args.temperatura_destilacao
+    alfa = args.alfa_destilacao
+
+    cache = CacheLogits(LOGITS_DIR, hash_saved_model(professor_dir), versao_dataset(origem))
+    prever_professor = carregar_artefato(professor_dir)
+    logits = {}
+    calculados = []
+    with instrumentation.etapa("distillation.logits_professor"):
+        for split in dataset_store.SPLITS:
+            logits[split], novo = cache.obter(split, splits[split][0], prever_professor, batch_size)
+            if novo:
+                calculados.append(split)
+    del prever_professor
+    print(f"Logits do professor: cache {cache.chave} "
+          f"({'calculados: ' + ', '.join(calculados) if calculados else 'reaproveitados'})")
+
+    X_train, X_val, X_test = (splits[split][0] for split in dataset_store.SPLITS)
+    ds_train = tf_dataset.construir_dataset(X_train, alvos(y_train_enc, logits["train"]), batch_size,
+                                            shuffle_buffer=args.shuffle_buffer or tf_dataset.SHUFFLE_BUFFER_PADRAO,
+                                            seed=RANDOM_SEED)
+    ds_val = tf_dataset.construir_dataset(X_val, alvos(y_val_enc, logits["val"]), batch_size)
+    model = construir_aluno(num_classes, args.aluno, temperatura=temperatura, alfa=alfa)
+
+    timestamp = int(time.time())
+    with mlflow_tracking.mlflow_run(run_name=f"run_aluno_{timestamp}",
+                                    experiment_name=args.experiment_name or "iris_diagnostic_destilacao") as run:
+        registro = mlflow_tracking.LoggerAssincrono(run.info.run_id)
+        registro.log_params({"epochs": epochs, "batch_size": batch_size, "aluno": args.aluno,
+                             "professor": str(professor_dir), "temperatura": temperatura, "alfa": alfa,
+                             "cache_logits": cache.chave, "learning_rate": LEARNING_RATE})
+        with instrumentation.etapa("distillation.fit"):
+            historico = model.fit(ds_train, validation_data=ds_val, epochs=epochs, verbose=2, callbacks=[
+                callbacks.EarlyStopping(monitor="val_loss", patience=6, restore_best_weights=True),
+                callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=3),
+            ])
+        for nome, valores in historico.history.items():
+            for epoca, valor in enumerate(valores):
+                registro.log_metric(nome, float(valor), step=epoca)
+
+        with instrumentation.etapa("distillation.avaliar"):
+            pred_aluno = prever_em_lotes(model, X_test, batch_size).argmax(axis=1)
+        pred_professor = logits["test"].argmax(axis=1)
+        registro.log_metrics({
+            "test_accuracy_aluno": float(np.mean(pred_aluno == y_test_enc)),
+            "test_accuracy_professor": float(np.mean(pred_professor == y_test_enc)),
+            "concordancia_professor": float(np.mean(pred_aluno == pred_professor)),
+        })
+
+        destino = MODELS_DIR / f"iris_student_{timestamp}"
+        destino.mkdir(parents=True, exist_ok=True)
+        model_save_path = destino / "saved_model"
+        with open(destino / "label_classes.json", "w", encoding="utf-8") as f:
+            json.dump(label_names.tolist(), f)
+        with instrumentation.etapa("distillation.salvar"):
+            model.export(str(model_save_path))
+
+        # Os dois são medidos do SavedModel, nas mesmas imagens de teste.
+        with instrumentation.etapa("distillation.medir"):
+            comparacao = {"professor": medir_modelo(professor_dir, X_test),
+                          "aluno": medir_modelo(model_save_path, X_test)}
+        for papel, medidas in comparacao.items():
+            registro.log_metrics({f"{papel}_{nome}": valor for nome, valor in medidas.items()})
+        registro.log_metrics({
+            "reducao_parametros": comparacao["professor"]["parametros"] / comparacao["aluno"]["parametros"],
+            "speedup_latencia": comparacao["professor"]["latency_ms_mean"] / comparacao["aluno"]["latency_ms_mean"],
+        })
+        with open(destino / "destilacao.json", "w", encoding="utf-8") as f:
+            json.dump({"professor": str(professor_dir), "cache_logits": cache.chave, "temperatura": temperatura,
+                       "alfa": alfa, **comparacao}, f, indent=2, ensure_ascii=False)
+        registro.log_artifact(str(destino / "destilacao.json"))
+        registro.log_artifact(str(destino / "label_classes.json"))
+        registro.log_artifacts(str(model_save_path), artifact_path="saved_models")
+        registro.fechar()
+        if registro.erros:
+            print(f"Aviso: {registro.erros} envio(s) ao MLflow falharam; veja o log.")
+
+    print(f"✅ Aluno salvo em {model_save_path}")
+    return {
+        "run_id": run.info.run_id,
+        "model_path": str(model_save_path),
+        "test_accuracy": float(np.mean(pred_aluno == y_test_enc)),
+        "parametros": comparacao["aluno"]["parametros"],
+        "parametros_professor": comparacao["professor"]["parametros"],
+        "latency_ms": comparacao["aluno"]["latency_ms_mean"],
+        "latency_ms_professor": comparacao["professor"]["latency_ms_mean"],
+    }
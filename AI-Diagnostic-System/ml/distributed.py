@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""
+Treino data-parallel em vários processos com MultiWorkerMirroredStrategy.
+
+Cada worker lê a configuração do cluster do TF_CONFIG (ou das flags
+--cluster/--indice-tarefa do train.py), treina sobre a sua fatia do dataset
+e soma os gradientes de todos por all-reduce em anel a cada passo. Só o
+chefe (a tarefa "chief" ou, sem ela, o worker 0) grava checkpoints e fala
+com o MLflow.
+
+Executado direto, lança N workers nesta máquina:
+
+    python ml/distributed.py --workers 4 -- --epochs 10 --batch-size 16
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+from pathlib import Path
+
+TRAIN_SCRIPT = Path(__file__).resolve().parent / "train.py"
+
+
+def configurar_cluster(cluster=None, indice_tarefa=None):
+    """
+    Define o TF_CONFIG a partir de `cluster` ("host:porta,host:porta,...")
+    e `indice_tarefa` quando passados; senão usa o TF_CONFIG do ambiente.
+    Retorna {"tipo", "indice", "num_workers", "posicao", "chefe"}, onde
+    `posicao` é a ordem do processo no cluster (o chefe é 0).
+    """
+    if cluster:
+        workers = [w.strip() for w in cluster.split(",") if w.strip()]
+        if indice_tarefa is None or not 0 <= indice_tarefa < len(workers):
+            raise ValueError(f"--indice-tarefa deve estar entre 0 e {len(workers) - 1}")
+        os.environ["TF_CONFIG"] = json.dumps({"cluster": {"worker": workers},
+                                              "task": {"type": "worker", "index": indice_tarefa}})
+    if not os.environ.get("TF_CONFIG"):
+        raise ValueError("Modo distribuído sem cluster: defina TF_CONFIG ou passe --cluster e --indice-tarefa")
+
+    tf_config = json.loads(os.environ["TF_CONFIG"])
+    tarefa = tf_config.get("task", {})
+    tipo, indice = tarefa.get("type", "worker"), int(tarefa.get("index", 0))
+    membros = tf_config.get("cluster", {})
+    num_workers = len(membros.get("chief", [])) + len(membros.get("worker", []))
+    posicao = indice + len(membros.get("chief", [])) if tipo == "worker" else indice
+    return {"tipo": tipo, "indice": indice, "num_workers": num_workers, "posicao": posicao,
+            "chefe": posicao == 0}
+
+
+def criar_estrategia():
+    """MultiWorkerMirroredStrategy com all-reduce em anel (o adequado para CPU)."""
+    import tensorflow as tf
+
+    comunicacao = tf.distribute.experimental.CommunicationOptions(
+        implementation=tf.distribute.experimental.CommunicationImplementation.RING)
+    return tf.distribute.MultiWorkerMirroredStrategy(communication_options=comunicacao)
+
+
+def somar_entre_workers(estrategia, valores):
+    """All-reduce (soma) de uma lista de tensores entre todos os workers."""
+    import tensorflow as tf
+
+    def somar():
+        # tf.identity dentro da réplica põe os valores no dispositivo dela.
+        return tf.distribute.get_replica_context().all_reduce("SUM", [tf.identity(v) for v in valores])
+
+    return estrategia.experimental_local_results(estrategia.run(somar))[0]
+
+
+def sincronizar_pesos(model, estrategia, chefe):
+    """Copia os pesos do chefe para todos os workers (soma com zeros dos demais)."""
+    import tensorflow as tf
+
+    pesos = [v for v in model.weights if "float" in str(v.dtype)]
+
+    @tf.function
+    def sincronizar():
+        valores = [v.value if chefe else tf.zeros_like(v.value) for v in pesos]
+        for v, valor in zip(pesos, somar_entre_workers(estrategia, valores)):
+            v.assign(valor)
+
+    sincronizar()
+
+
+def encerrar(estrategia):
+    """
+    Barreira final: cada worker espera os demais (o chefe, depois de avaliar,
+    salvar e logar) antes de sair. Um worker que sai antes é dado como falho
+    pelo serviço de coordenação do cluster.
+    """
+    import tensorflow as tf
+
+    somar_entre_workers(estrategia, [tf.constant(0.0)])
+
+
+def ajustar(model, estrategia, chefe, dataset, passos_por_epoca, batch_size_global, epochs,
+            validacao=None, callbacks=(), verbose=True):
+    """
+    Loop de treino data-parallel equivalente ao model.fit, com uma réplica
+    (CPU) por worker. O modelo e o otimizador são os comuns do Keras, fora de
+    estrategia.scope(): as camadas aleatórias (aumento, dropout) guardam o
+    seed em variáveis uint32, que a estratégia não consegue espelhar. A
+    estratégia entra só na comunicação: os pesos partem dos do chefe e, a cada
+    passo, os gradientes de todos os workers são somados antes de aplicados,
+    então os pesos continuam idênticos em todos.
+    `dataset` é a fatia deste worker, repetida indefinidamente. A validação
+    roda localmente e inteira em cada worker, então todos chegam às mesmas
+    decisões de EarlyStopping/ReduceLROnPlateau.
+    Retorna o histórico {métrica: [valor por época]}.
+    """
+    import tensorflow as tf
+    from tensorflow import keras
+
+    num_workers = estrategia.num_replicas_in_sync
+    otimizador = model.optimizer
+    otimizador.build(model.trainable_variables)
+    perda = keras.losses.SparseCategoricalCrossentropy(reduction=None)
+    sincronizar_pesos(model, estrategia, chefe)
+
+    def acertos(labels, probs):
+        return tf.reduce_sum(tf.cast(tf.equal(tf.argmax(probs, -1, output_type=labels.dtype), labels), tf.float32))
+
+    @tf.function
+    def passo_treino(imagens, labels):
+        with tf.GradientTape() as tape:
+            probs = model(imagens, training=True)
+            # Somada entre os workers, vira a média do lote global mais a regularização uma vez.
+            loss = tf.reduce_sum(perda(labels, probs)) / batch_size_global
+            if model.losses:
+                loss += tf.add_n(model.losses) / num_workers
+        gradientes = tape.gradient(loss, model.trainable_variables)
+        *gradientes, loss, certos = somar_entre_workers(estrategia, gradientes + [loss, acertos(labels, probs)])
+        otimizador.apply_gradients(zip(gradientes, model.trainable_variables))
+        return loss, certos
+
+    @tf.function
+    def passo_validacao(imagens, labels):
+        probs = model(imagens, training=False)
+        return tf.reduce_sum(perda(labels, probs)), acertos(labels, probs)
+
+    lista = keras.callbacks.CallbackList(list(callbacks), model=model)
+    model.stop_training = False
+    historico = {}
+    iterador = iter(dataset)
+    lista.on_train_begin()
+    for epoch in range(epochs):
+        lista.on_epoch_begin(epoch)
+        inicio = time.perf_counter()
+        soma_loss = soma_acertos = 0.0
+        for _ in range(passos_por_epoca):
+            loss, certos = passo_treino(*next(iterador))
+            soma_loss += float(loss)
+            soma_acertos += float(certos)
+        logs = {"loss": soma_loss / passos_por_epoca,
+                "accuracy": soma_acertos / (passos_por_epoca * batch_size_global)}
+
+        if validacao is not None:
+            soma_loss = soma_acertos = total = 0.0
+            for imagens, labels in validacao:
+                loss, certos = passo_validacao(imagens, labels)
+                soma_loss += float(loss)
+                soma_acertos += float(certos)
+                total += int(labels.shape[0])
+            regularizacao = float(tf.add_n(model.losses)) if model.losses else 0.0
+            logs["val_loss"] = soma_loss / total + regularizacao
+            logs["val_accuracy"] = soma_acertos / total
+
+        lista.on_epoch_end(epoch, logs)
+        for k, v in logs.items():
+            historico.setdefault(k, []).append(v)
+        if verbose:
+            metricas = " - ".join(f"{k}: {v:.4f}" for k, v in logs.items())
+            print(f"Época {epoch + 1}/{epochs} - {time.perf_counter() - inicio:.1f}s - {metricas}", flush=True)
+        if model.stop_training:
+            break
+    lista.on_train_end()
+    return historico
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def lancar_local(num_workers, argumentos_treino, threads_por_worker=None):
+    """
+    Sobe `num_workers` processos do train.py em portas livres de localhost,
+    dividindo os núcleos entre eles. Se um worker falhar, os outros são
+    encerrados (senão ficariam esperando o all-reduce para sempre).
+    Retorna o código de saída.
+    """
+    cluster = ",".join(f"localhost:{porta_livre()}" for _ in range(num_workers))
+    threads = threads_por_worker or max(1, (os.cpu_count() or 1) // num_workers)
+    processos = []
+    for indice in range(num_workers):
+        env = dict(os.environ,
+                   TF_NUM_INTRAOP_THREADS=str(threads),
+                   TF_NUM_INTEROP_THREADS="2",
+                   OMP_NUM_THREADS=str(threads))
+        env.pop("TF_CONFIG", None)
+        comando = [sys.executable, str(TRAIN_SCRIPT), "--distribuido", "--cluster", cluster,
+                   "--indice-tarefa", str(indice), *argumentos_treino]
+        processos.append(subprocess.Popen(comando, env=env))
+    print(f"{num_workers} workers em {cluster} ({threads} threads cada)")
+
+    codigo = 0
+    pendentes = list(processos)
+    while pendentes:
+        for p in list(pendentes):
+            if p.poll() is None:
+                continue
+            pendentes.remove(p)
+            if p.returncode != 0 and codigo == 0:
+                codigo = p.returncode
+                print(f"[ERRO] Worker {processos.index(p)} saiu com código {p.returncode}; encerrando os demais")
+                for outro in pendentes:
+                    outro.terminate()
+        time.sleep(0.2)
+    return codigo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Lançar o treino distribuído com N workers nesta máquina.",
+        epilog="Os argumentos depois de `--` vão para o train.py de cada worker.")
+    parser.add_argument("--workers", type=int, default=2, help="Número de processos worker")
+    parser.add_argument("--threads-por-worker", type=int, help="Threads intra-op de cada worker (padrão: núcleos / workers)")
+    args, resto = parser.parse_known_args()
+    if resto and resto[0] == "--":
+        resto = resto[1:]
+    sys.exit(lancar_local(args.workers, resto, args.threads_por_worker))
@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+import dataset_store
+
+VERSAO_CACHE = 1
+VISOES_PADRAO = 2
+
+
+def dividir_modelo(model, backbone="backbone", ignorar=("data_augmentation",)):
+    """
+    Separa o modelo em (extrator, cabeca), compartilhando os pesos:
+    extrator vai da entrada à saída do backbone (sem as camadas de `ignorar`)
+    e cabeca vai das features do backbone à saída. Treinar a cabeça atualiza
+    o modelo completo.
+    """
+    from tensorflow.keras import layers, models
+
+    camada_backbone = model.get_layer(backbone)
+    inp = layers.Input(shape=model.input_shape[1:], name="input_layer")
+    x = inp
+    restantes = []
+    for layer in model.layers[1:]:
+        if restantes or layer is camada_backbone:
+            restantes.append(layer)
+        elif layer.name not in ignorar:
+            x = layer(x)
+    x = camada_backbone(x, training=False)
+    x = x[0] if isinstance(x, (list, tuple)) else x
+    extrator = models.Model(inputs=inp, outputs=x, name=f"{model.name}_extrator")
+
+    features = layers.Input(shape=tuple(x.shape[1:]), name="features")
+    y = features
+    for layer in restantes[1:]:
+        y = layer(y)
+    cabeca = models.Model(inputs=features, outputs=y, name=f"{model.name}_cabeca")
+    return extrator, cabeca
+
+
+def hash_pesos(camada):
+    h = hashlib.sha1()
+    for peso in camada.weights:
+        h.update(np.ascontiguousarray(peso.numpy()).tobytes())
+    return h.hexdigest()
+
+
+def versao_dataset(origem):
+    """
+    Identifica o conteúdo do dataset processado sem relê-lo: os arquivos
+    pequenos (índice, labels, splits) entram por conteúdo e os shards, ou o
+    .npz, por tamanho e mtime.
+    """
+    origem = str(origem)
+    h = hashlib.sha1()
+    if dataset_store.eh_dataset_shards(origem):
+        for nome in sorted(os.listdir(origem)):
+            caminho = os.path.join(origem, nome)
+            if nome in (dataset_store.INDEX_FILE, dataset_store.LABELS_FILE, dataset_store.SPLITS_FILE):
+                with open(caminho, "rb") as f:
+                    h.update(f.read())
+            elif nome.endswith(".u8"):
+                st = os.stat(caminho)
+                h.update(f"{nome}:{st.st_size}:{st.st_mtime_ns}".encode())
+    else:
+        st = os.stat(origem)
+        h.update(f"{os.path.abspath(origem)}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+
+class CacheEmbeddings:
+    """
+    Features do backbone por split, em <cache_dir>/<chave>/<split>.npy com
+    forma (visões, imagens, dimensão). A chave combina o hash dos pesos do
+    backbone, a versão do dataset, o número de visões aumentadas e o seed,
+    então qualquer mudança em um deles gera um cache novo.
+    A visão 0 é a imagem original; as visões 1..K usam aumentos fixos
+    (um seed por visão) e só são calculadas para o treino.
+    """
+
+    def __init__(self, cache_dir, pesos_hash, dataset_versao, visoes=VISOES_PADRAO, seed=0):
+        self.visoes = visoes
+        config = {"versao": VERSAO_CACHE, "pesos": pesos_hash, "dataset": dataset_versao,
+                  "visoes": visoes, "seed": seed}
+        self.chave = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+        self.diretorio = os.path.join(str(cache_dir), self.chave)
+        self.config = config
+
+    def caminho(self, split):
+        return os.path.join(self.diretorio, f"{split}.npy")
+
+    def obter(self, split, X, extrator, batch_size, aumentos=()):
+        """
+        Features de `split` (memmap somente leitura). Na primeira vez passa X
+        pelo extrator uma vez por visão e grava o resultado; `aumentos` são
+        as camadas de aumento das visões 1..K.
+        """
+        caminho = self.caminho(split)
+        if os.path.exists(caminho):
+            return np.load(caminho, mmap_mode="r"), False
+
+        os.makedirs(self.diretorio, exist_ok=True)
+        dimensao = int(extrator.output_shape[-1])
+        temporario = caminho + ".tmp.npy"
+        saida = np.lib.format.open_memmap(temporario, mode="w+", dtype=np.float32,
+                                          shape=(1 + len(aumentos), len(X), dimensao))
+        for visao, aumento in enumerate((None,) + tuple(aumentos)):
+            inicio = 0
+            for lote in dataset_store.iterar_lotes(X, batch_size):
+                if aumento is not None:
+                    lote = aumento(lote, training=True)
+                fim = inicio + len(lote)
+                saida[visao, inicio:fim] = np.asarray(extrator.predict_on_batch(lote))
+                inicio = fim
+        saida.flush()
+        del saida
+        os.replace(temporario, caminho)
+        with open(os.path.join(self.diretorio, "config.json"), "w", encoding="utf-8") as f:
+            json.dump(self.config, f, indent=2)
+        return np.load(caminho, mmap_mode="r"), True
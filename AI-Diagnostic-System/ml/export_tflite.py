@@ -0,0 +1,146 @@
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+import dataset_store
+from model_registry import RegistroModelos
+
+ROOT = Path(__file__).resolve().parents[1]
+MODELS_DIR = ROOT / "models"
+VARIANTES = ("dinamico", "float16", "int8")
+AMOSTRAS_REPRESENTATIVAS = 200
+RANDOM_SEED = 42
+
+
+def dataset_representativo(origem, amostras=AMOSTRAS_REPRESENTATIVAS, seed=RANDOM_SEED):
+    """
+    Gerador de calibração para a quantização int8: `amostras` imagens do split
+    de treino processado, sorteadas de forma estratificada por classe e já
+    normalizadas como na inferência (float32 em [0, 1]).
+    """
+    X, y = dataset_store.abrir_split(origem, "train")
+    y = np.asarray(y)
+    rng = np.random.default_rng(seed)
+    classes = np.unique(y)
+    por_classe = max(1, amostras // len(classes))
+    indices = np.concatenate([
+        rng.permutation(np.flatnonzero(y == classe))[:por_classe] for classe in classes
+    ])
+    indices = np.sort(indices[:amostras])
+
+    def gerar():
+        for i in indices:
+            imagem = X[int(i)]
+            if imagem.dtype == np.uint8:
+                imagem = dataset_store.normalizar(imagem)
+            yield [np.asarray(imagem, dtype=np.float32)[None]]
+
+    return gerar
+
+
+def converter(saved_model_dir, variante, representativo=None):
+    """Converte um SavedModel em bytes TFLite na variante pedida."""
+    import tensorflow as tf
+
+    conversor = tf.lite.TFLiteConverter.from_saved_model(str(saved_model_dir))
+    conversor.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variante == "float16":
+        conversor.target_spec.supported_types = [tf.float16]
+    elif variante == "int8":
+        if representativo is None:
+            raise ValueError("A variante int8 precisa de um dataset representativo")
+        conversor.representative_dataset = representativo
+        conversor.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        conversor.inference_input_type = tf.int8
+        conversor.inference_output_type = tf.int8
+    elif variante != "dinamico":
+        raise ValueError(f"Variante desconhecida: {variante}")
+    return conversor.convert()
+
+
+def exportar_variantes(saved_model_dir, destino=None, origem_dataset=None, variantes=VARIANTES,
+                       amostras=AMOSTRAS_REPRESENTATIVAS):
+    """
+    Gera as variantes TFLite de `saved_model_dir` em `destino` (padrão: pasta
+    `tflite` ao lado do SavedModel, junto do label_classes.json).
+    Retorna {variante: caminho do .tflite}.
+    """
+    saved_model_dir = Path(saved_model_dir)
+    destino = Path(destino) if destino else saved_model_dir.parent / "tflite"
+    destino.mkdir(parents=True, exist_ok=True)
+
+    representativo = None
+    if "int8" in variantes:
+        from train import origem_dataset_padrao
+
+        origem = origem_dataset or origem_dataset_padrao()
+        representativo = dataset_representativo(origem, amostras)
+
+    caminhos = {}
+    for variante in variantes:
+        caminho = destino / f"model_{variante}.tflite"
+        caminho.write_bytes(converter(saved_model_dir, variante, representativo))
+        caminhos[variante] = caminho
+        print(f"Variante {variante}: {caminho} ({caminho.stat().st_size / 1e6:.2f} MB)")
+
+    label_classes = saved_model_dir.parent / "label_classes.json"
+    if label_classes.exists():
+        (destino / "label_classes.json").write_text(label_classes.read_text(encoding="utf-8"), encoding="utf-8")
+    return caminhos
+
+
+def registrar_mlflow(caminhos, artifact_path="tflite"):
+    """Loga os .tflite e o tamanho de cada variante na run MLflow ativa."""
+    import mlflow
+
+    for variante, caminho in caminhos.items():
+        mlflow.log_artifact(str(caminho), artifact_path=artifact_path)
+        mlflow.log_metric(f"tflite_{variante}_mb", Path(caminho).stat().st_size / 1e6)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Exportar o SavedModel treinado em variantes TFLite quantizadas.")
+    parser.add_argument("--saved-model", dest="saved_model", type=str,
+                        help="Diretório do SavedModel (padrão: o mais recente em models/)")
+    parser.add_argument("--destino", type=str, help="Diretório de saída (padrão: <modelo>/tflite)")
+    parser.add_argument("--dataset", type=str,
+                        help="Shards ou .npz processado de onde vem o dataset representativo do int8 "
+                             "(padrão: o mesmo do train)")
+    parser.add_argument("--variantes", nargs="+", choices=VARIANTES, default=list(VARIANTES))
+    parser.add_argument("--amostras", type=int, default=AMOSTRAS_REPRESENTATIVAS,
+                        help="Número de imagens de treino usadas na calibração int8")
+    parser.add_argument("--experiment-name", type=str, default="iris_diagnostic_tflite_export",
+                        help="Experimento MLflow onde as variantes são logadas")
+    parser.add_argument("--sem-mlflow", dest="sem_mlflow", action="store_true",
+                        help="Não logar as variantes no MLflow")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.saved_model:
+        saved_model = Path(args.saved_model)
+    else:
+        registro = RegistroModelos(MODELS_DIR, idade_minima_s=0)
+        registro.atualizar()
+        artefato = registro.mais_recente()
+        if artefato is None or artefato["tipo"] != "saved_model":
+            print(f"[ERRO] Nenhum SavedModel encontrado em {MODELS_DIR}")
+            sys.exit(1)
+        saved_model = artefato["caminho"]
+
+    caminhos = exportar_variantes(saved_model, args.destino, args.dataset, args.variantes, args.amostras)
+
+    if not args.sem_mlflow:
+        from mlflow_tracking import mlflow_run
+
+        with mlflow_run(run_name=f"tflite_{saved_model.parent.name}", experiment_name=args.experiment_name):
+            import mlflow
+
+            mlflow.log_param("saved_model", str(saved_model))
+            mlflow.log_param("amostras_representativas", args.amostras)
+            registrar_mlflow(caminhos)
+    print(json.dumps({v: str(c) for v, c in caminhos.items()}, indent=2))
@@ -0,0 +1,184 @@
+import os
+
+import numpy as np
+
+from manifest import hash_arquivo, hash_parametros
+
+MAX_BYTES_PADRAO = 1 << 30
+CUSTO_FIXO_ENTRADA = 64  # chave + círculo + contador, em bytes (aproximado)
+
+
+class CacheGeometria:
+    """
+    Cache persistente da geometria de segmentação: o círculo da íris (x, y, r)
+    e a máscara de reflexos, indexados por hash do conteúdo + hash dos
+    parâmetros do detector.
+
+    Em disco é um .npz colunar (uma coluna por campo, máscaras compactadas com
+    np.packbits e concatenadas). Da máscara só se guarda o retângulo que
+    contém os pixels de reflexo (dentro do disco da íris, já que o resto da
+    imagem segmentada é preto), não o quadro inteiro. O tamanho é limitado
+    por `max_bytes`; ao salvar, as entradas acessadas há mais tempo são
+    descartadas primeiro.
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES_PADRAO):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._entradas = {}
+        self._relogio = 0
+        self._alterado = False
+        self._carregar()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    @staticmethod
+    def chave(conteudo_hash, parametros):
+        return f"{conteudo_hash}:{hash_parametros(parametros)}"
+
+    def _ler_disco(self):
+        if not os.path.exists(self.path):
+            return {}, 0
+        entradas = {}
+        with np.load(self.path) as dados:
+            chaves = dados["chave"].astype(str)
+            circulos = dados["circulo"]
+            acessos = dados["acesso"]
+            inicios = dados["mascara_inicio"]
+            formas = dados["mascara_forma"]
+            # Arquivos antigos guardam a máscara inteira: a caixa é o quadro todo.
+            caixas = (dados["mascara_caixa"] if "mascara_caixa" in dados.files
+                      else np.concatenate([np.zeros_like(formas), formas], axis=1))
+            bits = dados["mascara_bits"]
+        for i, chave in enumerate(chaves):
+            circulo = None if circulos[i][2] < 0 else tuple(int(v) for v in circulos[i])
+            mascara = None
+            if formas[i][0] > 0:
+                mascara = (tuple(int(v) for v in formas[i]), tuple(int(v) for v in caixas[i]),
+                           bits[inicios[i]:inicios[i + 1]].copy())
+            entradas[chave] = [circulo, mascara, int(acessos[i])]
+        return entradas, int(acessos.max()) if len(acessos) else 0
+
+    def _carregar(self):
+        self._entradas, self._relogio = self._ler_disco()
+
+    def obter_compactada(self, conteudo_hash, parametros):
+        """(círculo, máscara compactada) sem descompactar, para enviar a outro processo; senão None."""
+        entrada = self._entradas.get(self.chave(conteudo_hash, parametros))
+        if entrada is None:
+            return None
+        self._relogio += 1
+        entrada[2] = self._relogio
+        self._alterado = True
+        return entrada[0], entrada[1]
+
+    def obter(self, conteudo_hash, parametros):
+        """
+        Retorna {"circulo": (x, y, r) ou None, "mascara": ndarray uint8 ou None}
+        se a imagem já foi segmentada com esses parâmetros; senão None.
+        """
+        encontrada = self.obter_compactada(conteudo_hash, parametros)
+        if encontrada is None:
+            return None
+        return {"circulo": encontrada[0], "mascara": self.descompactar(encontrada[1])}
+
+    def obter_arquivo(self, path, parametros):
+        return self.obter(hash_arquivo(path), parametros)
+
+    @staticmethod
+    def compactar(mascara):
+        """
+        Forma compacta (forma, caixa, bits) de uma máscara binária: `caixa`
+        (y0, x0, altura, largura) é o retângulo dos pixels marcados e só ele
+        vai para `bits`. Barata de guardar e de enviar entre processos.
+        """
+        linhas = np.flatnonzero(mascara.any(axis=1))
+        colunas = np.flatnonzero(mascara.any(axis=0))
+        if not len(linhas):
+            return tuple(mascara.shape[:2]), (0, 0, 0, 0), np.zeros(0, dtype=np.uint8)
+        y0, x0 = int(linhas[0]), int(colunas[0])
+        recorte = mascara[y0:linhas[-1] + 1, x0:colunas[-1] + 1]
+        return tuple(mascara.shape[:2]), (y0, x0) + recorte.shape, np.packbits(recorte.reshape(-1) > 0)
+
+    @staticmethod
+    def descompactar(compactada):
+        """Máscara uint8 (0/255) no tamanho original a partir de `compactar`; None continua None."""
+        if compactada is None:
+            return None
+        forma, (y0, x0, altura, largura), bits = compactada
+        mascara = np.zeros(forma, dtype=np.uint8)
+        recorte = np.unpackbits(bits, count=altura * largura).reshape(altura, largura)
+        mascara[y0:y0 + altura, x0:x0 + largura] = recorte * np.uint8(255)
+        return mascara
+
+    def gravar(self, conteudo_hash, parametros, circulo, mascara=None, compactada=None):
+        if mascara is not None:
+            compactada = self.compactar(mascara)
+        self._relogio += 1
+        self._entradas[self.chave(conteudo_hash, parametros)] = [
+            tuple(int(v) for v in circulo) if circulo is not None else None,
+            compactada,
+            self._relogio,
+        ]
+        self._alterado = True
+
+    @staticmethod
+    def _tamanho(entrada):
+        return CUSTO_FIXO_ENTRADA + (len(entrada[1][2]) if entrada[1] is not None else 0)
+
+    def _despejar(self):
+        total = sum(self._tamanho(e) for e in self._entradas.values())
+        if total <= self.max_bytes:
+            return 0
+        removidas = 0
+        for chave, entrada in sorted(self._entradas.items(), key=lambda item: item[1][2]):
+            if total <= self.max_bytes:
+                break
+            total -= self._tamanho(entrada)
+            del self._entradas[chave]
+            removidas += 1
+        return removidas
+
+    def salvar(self):
+        """Mescla com o que outro processo tenha gravado, aplica o limite de tamanho e grava."""
+        if not self._alterado:
+            return
+        em_disco, _ = self._ler_disco()
+        for chave, entrada in em_disco.items():
+            self._entradas.setdefault(chave, entrada)
+        self._despejar()
+
+        chaves = list(self._entradas)
+        circulos = np.full((len(chaves), 3), -1, dtype=np.int32)
+        acessos = np.zeros(len(chaves), dtype=np.int64)
+        formas = np.zeros((len(chaves), 2), dtype=np.int32)
+        caixas = np.zeros((len(chaves), 4), dtype=np.int32)
+        inicios = np.zeros(len(chaves) + 1, dtype=np.int64)
+        partes = []
+        for i, chave in enumerate(chaves):
+            circulo, mascara, acesso = self._entradas[chave]
+            if circulo is not None:
+                circulos[i] = circulo
+            acessos[i] = acesso
+            tamanho = 0
+            if mascara is not None:
+                formas[i], caixas[i] = mascara[0], mascara[1]
+                partes.append(mascara[2])
+                tamanho = len(mascara[2])
+            inicios[i + 1] = inicios[i] + tamanho
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporario = self.path + ".tmp.npz"
+        np.savez_compressed(
+            temporario,
+            chave=np.array(chaves, dtype="S"),
+            circulo=circulos,
+            acesso=acessos,
+            mascara_inicio=inicios,
+            mascara_forma=formas,
+            mascara_caixa=caixas,
+            mascara_bits=np.concatenate(partes) if partes else np.zeros(0, dtype=np.uint8),
+        )
+        os.replace(temporario, self.path)
+        self._alterado = False
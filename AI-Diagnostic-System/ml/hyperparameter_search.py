@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+"""
+Busca de hiperparâmetros do train.py em paralelo, com poda ASHA.
+
+    python ml/hyperparameter_search.py --trials 24 --workers 4 --epocas-max 27
+
+Os trials rodam num pool limitado de processos, cada um com um número fixo
+de threads (e núcleos próprios, quando o sistema permite). O val_loss de cada
+época vai para um escalonador compartilhado, que interrompe os trials piores
+que o topo 1/eta de cada degrau (successive halving assíncrono). O dataset é
+aberto uma vez por processo como memmap, então todos os trials leem as mesmas
+páginas em cache. O coordenador registra cada trial como uma run aninhada do
+MLflow sob a run da busca.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from multiprocessing.managers import SyncManager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+import dataset_store
+import mlflow_tracking
+
+ESPACO_PADRAO = {
+    "learning_rate": [1e-3, 3e-4, 1e-4, 3e-5],
+    "batch_size": [16, 32, 64],
+    "dropout": [0.3, 0.5, 0.7],
+    "unidades_densas": [64, 128, 256],
+    "base_model_trainable": [False, True],
+}
+TRIALS_PADRAO = 16
+EPOCAS_MIN_PADRAO = 1
+EPOCAS_MAX_PADRAO = 27
+ETA_PADRAO = 3
+SEED = 42
+
+
+def amostrar_configuracoes(espaco, n, seed=SEED):
+    """Até `n` configurações distintas sorteadas do espaço {parâmetro: [valores]}."""
+    total = int(np.prod([len(v) for v in espaco.values()]))
+    rng = random.Random(seed)
+    vistas, configuracoes = set(), []
+    while len(configuracoes) < min(n, total):
+        config = {nome: rng.choice(valores) for nome, valores in espaco.items()}
+        chave = json.dumps(config, sort_keys=True)
+        if chave not in vistas:
+            vistas.add(chave)
+            configuracoes.append(config)
+    return configuracoes
+
+
+class EscalonadorASHA:
+    """
+    Successive halving assíncrono: os degraus ficam nas épocas
+    epocas_min * eta^k (< epocas_max). Ao chegar a um degrau, o trial segue
+    só se o seu val_loss estiver entre os 1/eta melhores já reportados
+    naquele degrau (o primeiro a chegar sempre segue). Nenhum trial espera
+    pelos outros. Vive num processo gerenciador e é compartilhado pelo pool.
+    """
+
+    def __init__(self, epocas_min=EPOCAS_MIN_PADRAO, epocas_max=EPOCAS_MAX_PADRAO, eta=ETA_PADRAO):
+        self.eta = eta
+        self.degraus = []
+        epoca = epocas_min
+        while epoca < epocas_max:
+            self.degraus.append(epoca)
+            epoca *= eta
+        self.valores = {d: [] for d in self.degraus}
+        self.podados = {}
+        self._lock = threading.Lock()
+
+    def reportar(self, trial, epoca, valor):
+        """Registra o val_loss de `trial` ao fim de `epoca` (1-based). Retorna False se o trial deve parar."""
+        if epoca not in self.valores:
+            return True
+        with self._lock:
+            valores = self.valores[epoca]
+            valores.append(valor)
+            promovidos = max(1, len(valores) // self.eta)
+            continuar = valor <= sorted(valores)[promovidos - 1]
+            if not continuar:
+                self.podados[trial] = epoca
+            return continuar
+
+    def resumo(self):
+        with self._lock:
+            return {"degraus": self.degraus, "reportados": {d: len(v) for d, v in self.valores.items()},
+                    "podados": dict(self.podados)}
+
+
+class GerenciadorBusca(SyncManager):
+    pass
+
+
+GerenciadorBusca.register("EscalonadorASHA", EscalonadorASHA)
+
+
+def compartilhar_npz(origem, destino):
+    """
+    O .npz legado é comprimido e seria descompactado por trial; os splits
+    são gravados uma vez como .npy e abertos em memmap por todos os processos.
+    """
+    with np.load(str(origem), allow_pickle=True) as data:
+        for split in dataset_store.SPLITS:
+            np.save(os.path.join(destino, f"X_{split}.npy"), data[f"X_{split}"])
+            np.save(os.path.join(destino, f"y_{split}.npy"), data[f"y_{split}"])
+    return destino
+
+
+# ----------------------------------------------------------------- processos do pool
+
+_worker = {}
+
+
+def _inicializar_worker(origem, threads, nucleos, escalonador):
+    """Fixa as threads (antes de importar o TensorFlow) e os núcleos do processo, e abre o dataset."""
+    for variavel in ("TF_NUM_INTRAOP_THREADS", "OMP_NUM_THREADS"):
+        os.environ[variavel] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    try:
+        os.sched_setaffinity(0, nucleos.get_nowait())
+    except Exception:
+        pass  # sem afinidade (fora do Linux ou mais processos que conjuntos de núcleos)
+
+    import train
+
+    if dataset_store.eh_dataset_shards(origem):
+        splits = [dataset_store.abrir_split(origem, split) for split in dataset_store.SPLITS]
+    else:
+        splits = [(np.load(os.path.join(origem, f"X_{split}.npy"), mmap_mode="r"),
+                   np.load(os.path.join(origem, f"y_{split}.npy"), allow_pickle=True))
+                  for split in dataset_store.SPLITS]
+    (X_train, y_train), (X_val, y_val), (X_test, y_test) = splits
+    y_train_enc, y_val_enc, _, num_classes, _ = train.codificar_labels(y_train, y_val, y_test)
+    _worker.update(X_train=X_train, y_train=y_train_enc, X_val=X_val, y_val=y_val_enc,
+                   num_classes=num_classes, escalonador=escalonador)
+
+
+def executar_trial(trial, params, epocas_max, shuffle_buffer=None):
+    """Treina uma configuração até `epocas_max` ou até o escalonador podá-la."""
+    import tensorflow as tf
+    from tensorflow import keras
+
+    import tf_dataset
+    import train
+
+    inicio = time.perf_counter()
+    escalonador = _worker["escalonador"]
+    historico, situacao = {}, {"status": "completo"}
+
+    class PodaASHA(keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            for k, v in (logs or {}).items():
+                historico.setdefault(k, []).append(float(v))
+            if not escalonador.reportar(trial, epoch + 1, float(logs["val_loss"])):
+                situacao["status"] = "podado"
+                self.model.stop_training = True
+
+    try:
+        tf.random.set_seed(train.RANDOM_SEED + trial)
+        model = train.construir_modelo_avancado(
+            train.IMG_SHAPE, _worker["num_classes"],
+            base_model_trainable=params.get("base_model_trainable", False),
+            dropout=params.get("dropout", train.DROPOUT),
+            unidades_densas=params.get("unidades_densas", train.UNIDADES_DENSAS),
+            learning_rate=params.get("learning_rate", train.LEARNING_RATE),
+        )
+        batch_size = params.get("batch_size", train.BATCH_SIZE)
+        ds_train = tf_dataset.construir_dataset(_worker["X_train"], _worker["y_train"], batch_size,
+                                                shuffle_buffer=shuffle_buffer or tf_dataset.SHUFFLE_BUFFER_PADRAO,
+                                                seed=train.RANDOM_SEED)
+        ds_val = tf_dataset.construir_dataset(_worker["X_val"], _worker["y_val"], batch_size)
+        model.fit(ds_train, validation_data=ds_val, epochs=epocas_max, callbacks=[PodaASHA()], verbose=0)
+    except Exception as e:
+        situacao = {"status": "falhou", "erro": str(e)}
+
+    resultado = {"trial": trial, "params": params, "historico": historico,
+                 "epocas": len(historico.get("val_loss", [])), "duracao_s": time.perf_counter() - inicio,
+                 "pid": os.getpid(), **situacao}
+    if historico.get("val_loss"):
+        resultado["melhor_val_loss"] = min(historico["val_loss"])
+        resultado["melhor_val_accuracy"] = max(historico.get("val_accuracy", [0.0]))
+    return resultado
+
+
+# ----------------------------------------------------------------- coordenador
+
+def registrar_trial(resultado, experimento):
+    """Run aninhada do MLflow com os parâmetros, as curvas por época e o desfecho do trial."""
+    with mlflow_tracking.mlflow_run(run_name=f"trial_{resultado['trial']:03d}", experiment_name=experimento,
+                                    nested=True) as run:
+        with mlflow_tracking.LoggerAssincrono(run.info.run_id) as registro:
+            registro.log_params(resultado["params"])
+            registro.set_tag("status", resultado["status"])
+            if resultado.get("erro"):
+                registro.set_tag("erro", resultado["erro"][:500])
+            for nome, valores in resultado["historico"].items():
+                for epoca, valor in enumerate(valores):
+                    registro.log_metric(nome, valor, step=epoca)
+            registro.log_metrics({"epocas": resultado["epocas"], "duracao_s": resultado["duracao_s"]})
+
+
+def buscar(origem, espaco=None, trials=TRIALS_PADRAO, workers=None, threads_por_trial=None,
+           epocas_min=EPOCAS_MIN_PADRAO, epocas_max=EPOCAS_MAX_PADRAO, eta=ETA_PADRAO,
+           seed=SEED, experimento=None, shuffle_buffer=None):
+    """
+    Roda a busca e retorna o resumo com o melhor trial. `espaco` é
+    {parâmetro: [valores]} (padrão: ESPACO_PADRAO) e os trials são sorteados
+    dele sem repetição.
+    """
+    import mlflow
+
+    espaco = espaco or ESPACO_PADRAO
+    configuracoes = amostrar_configuracoes(espaco, trials, seed)
+    nucleos_disponiveis = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") \
+        else list(range(os.cpu_count() or 1))
+    workers = workers or max(1, len(nucleos_disponiveis) // (threads_por_trial or 1))
+    threads = threads_por_trial or max(1, len(nucleos_disponiveis) // workers)
+    experimento = experimento or "iris_hyperparameter_search"
+
+    temporario = None
+    origem = str(origem)
+    if not dataset_store.eh_dataset_shards(origem):
+        temporario = tempfile.mkdtemp(prefix="busca_dataset_")
+        origem = compartilhar_npz(origem, temporario)
+
+    contexto = multiprocessing.get_context("spawn")
+    gerenciador = GerenciadorBusca(ctx=contexto)
+    gerenciador.start()
+    escalonador = gerenciador.EscalonadorASHA(epocas_min, epocas_max, eta)
+    nucleos = gerenciador.Queue()
+    for w in range(workers):
+        conjunto = nucleos_disponiveis[w * threads:(w + 1) * threads]
+        if len(conjunto) == threads:
+            nucleos.put(set(conjunto))
+
+    inicio = time.perf_counter()
+    resultados = []
+    try:
+        with mlflow_tracking.mlflow_run(run_name=f"busca_{int(time.time())}", experiment_name=experimento) as run:
+            mlflow.log_params({"trials": len(configuracoes), "workers": workers, "threads_por_trial": threads,
+                               "epocas_min": epocas_min, "epocas_max": epocas_max, "eta": eta, "seed": seed})
+            mlflow.log_dict(espaco, "espaco.json")
+            print(f"{len(configuracoes)} trials em {workers} processos ({threads} threads cada); "
+                  f"degraus ASHA nas épocas {escalonador.resumo()['degraus']}")
+
+            with ProcessPoolExecutor(max_workers=workers, mp_context=contexto, initializer=_inicializar_worker,
+                                     initargs=(origem, threads, nucleos, escalonador)) as pool:
+                futuros = {pool.submit(executar_trial, i, config, epocas_max, shuffle_buffer): (i, config)
+                           for i, config in enumerate(configuracoes)}
+                for futuro in as_completed(futuros):
+                    trial, config = futuros[futuro]
+                    try:
+                        resultado = futuro.result()
+                    except Exception as e:  # processo do pool morreu (ex.: falta de memória)
+                        resultado = {"trial": trial, "params": config, "historico": {}, "epocas": 0,
+                                     "duracao_s": 0.0, "status": "falhou", "erro": str(e)}
+                    resultados.append(resultado)
+                    registrar_trial(resultado, experimento)
+                    print(f" - trial {trial:03d}: {resultado['status']} após {resultado['epocas']} épocas"
+                          + (f", val_loss {resultado['melhor_val_loss']:.4f}" if "melhor_val_loss" in resultado else ""))
+
+            validos = [r for r in resultados if "melhor_val_loss" in r]
+            melhor = min(validos, key=lambda r: r["melhor_val_loss"]) if validos else None
+            epocas_rodadas = sum(r["epocas"] for r in resultados)
+            resumo = {
+                "run_id": run.info.run_id,
+                "duracao_s": time.perf_counter() - inicio,
+                "epocas_rodadas": epocas_rodadas,
+                "epocas_sem_poda": len(configuracoes) * epocas_max,
+                "contagens": {s: sum(1 for r in resultados if r["status"] == s)
+                              for s in ("completo", "podado", "falhou")},
+                "asha": escalonador.resumo(),
+                "melhor": melhor and {k: melhor[k] for k in ("trial", "params", "melhor_val_loss", "epocas")},
+            }
+            mlflow.log_metrics({"epocas_rodadas": epocas_rodadas, "duracao_s": resumo["duracao_s"],
+                                "trials_podados": resumo["contagens"]["podado"],
+                                **({"melhor_val_loss": melhor["melhor_val_loss"]} if melhor else {})})
+            if melhor:
+                mlflow.log_params({f"melhor_{k}": v for k, v in melhor["params"].items()})
+            mlflow.log_dict({"resumo": resumo, "trials": sorted(resultados, key=lambda r: r["trial"])},
+                            "busca.json")
+    finally:
+        gerenciador.shutdown()
+        if temporario:
+            shutil.rmtree(temporario, ignore_errors=True)
+    return resumo
+
+
+def main():
+    import train
+
+    parser = argparse.ArgumentParser(description="Busca de hiperparâmetros em paralelo com poda ASHA.")
+    parser.add_argument("--dataset", type=str,
+                        help="Diretório de shards ou arquivo .npz (padrão: o mesmo do train.py)")
+    parser.add_argument("--espaco", type=str,
+                        help="JSON {parâmetro: [valores]} com learning_rate, batch_size, dropout, "
+                             "unidades_densas e/ou base_model_trainable (padrão: ESPACO_PADRAO)")
+    parser.add_argument("--trials", type=int, default=TRIALS_PADRAO, help="Número de configurações sorteadas")
+    parser.add_argument("--workers", type=int, help="Trials simultâneos (padrão: núcleos / threads por trial)")
+    parser.add_argument("--threads-por-trial", dest="threads_por_trial", type=int,
+                        help="Threads intra-op de cada trial (padrão: núcleos / workers)")
+    parser.add_argument("--epocas-min", dest="epocas_min", type=int, default=EPOCAS_MIN_PADRAO,
+                        help="Época do primeiro degrau do ASHA")
+    parser.add_argument("--epocas-max", dest="epocas_max", type=int, default=EPOCAS_MAX_PADRAO,
+                        help="Épocas de um trial que nunca é podado")
+    parser.add_argument("--eta", type=int, default=ETA_PADRAO, help="Fator de redução do successive halving")
+    parser.add_argument("--shuffle-buffer", dest="shuffle_buffer", type=int,
+                        help="Tamanho do buffer de embaralhamento do tf.data")
+    parser.add_argument("--seed", type=int, default=SEED, help="Seed do sorteio das configurações")
+    parser.add_argument("--experiment-name", type=str, help="Nome do experimento MLflow")
+    args = parser.parse_args()
+
+    espaco = None
+    if args.espaco:
+        with open(args.espaco, encoding="utf-8") as f:
+            espaco = json.load(f)
+    origem = Path(args.dataset) if args.dataset else train.origem_dataset_padrao()
+    resumo = buscar(origem, espaco, args.trials, args.workers, args.threads_por_trial, args.epocas_min,
+                    args.epocas_max, args.eta, args.seed, args.experiment_name, args.shuffle_buffer)
+    print(f"\n{resumo['epocas_rodadas']} de {resumo['epocas_sem_poda']} épocas rodadas "
+          f"({resumo['contagens']['podado']} trials podados) em {resumo['duracao_s']:.0f}s")
+    if resumo["melhor"]:
+        print(f"Melhor trial: {resumo['melhor']['trial']} (val_loss {resumo['melhor']['melhor_val_loss']:.4f})")
+        for k, v in resumo["melhor"]["params"].items():
+            print(f" - {k}: {v}")
+
+
+if __name__ == "__main__":
+    # Os processos do pool (spawn) importam este arquivo pelo nome do módulo;
+    # rodando como script, as funções enviadas a eles precisam vir de lá e não de __main__.
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from hyperparameter_search import main as _main
+
+    _main()
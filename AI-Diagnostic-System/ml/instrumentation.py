@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import bisect
+import resource
+import threading
+from functools import wraps
+
+LIMITES_HISTOGRAMA_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                        10.0, 30.0, 60.0, 300.0)
+DIR_PADRAO = os.getenv("ML_INSTRUMENTACAO_DIR", "data/instrumentacao")
+PREFIXO_PROMETHEUS = "neurovision"
+_PAGINA = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+_ativo = os.getenv("ML_INSTRUMENTACAO", "1") != "0"
+
+
+def ativo():
+    return _ativo
+
+
+def ativar(valor=True):
+    """Liga/desliga a instrumentação no processo atual (padrão vem de ML_INSTRUMENTACAO=0/1)."""
+    global _ativo
+    _ativo = valor
+
+
+def rss_atual_bytes():
+    """RSS corrente do processo, lido de /proc; fora do Linux cai no pico do getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGINA
+    except (OSError, IndexError, ValueError):
+        return pico_rss_bytes()
+
+
+def pico_rss_bytes(filhos=False):
+    """Pico de RSS do processo (ou o maior entre os filhos já finalizados), via getrusage."""
+    quem = resource.RUSAGE_CHILDREN if filhos else resource.RUSAGE_SELF
+    return resource.getrusage(quem).ru_maxrss * 1024  # ru_maxrss vem em KiB no Linux
+
+
+class Estatistica:
+    """Contagem, soma, mínimo, máximo e histograma de durações de uma etapa."""
+
+    def __init__(self):
+        self.contagem = 0
+        self.total_s = 0.0
+        self.min_s = float("inf")
+        self.max_s = 0.0
+        self.baldes = [0] * (len(LIMITES_HISTOGRAMA_S) + 1)
+        self.rss_max_bytes = 0
+
+    def adicionar(self, duracao, rss=0):
+        self.contagem += 1
+        self.total_s += duracao
+        self.min_s = min(self.min_s, duracao)
+        self.max_s = max(self.max_s, duracao)
+        self.baldes[bisect.bisect_left(LIMITES_HISTOGRAMA_S, duracao)] += 1
+        self.rss_max_bytes = max(self.rss_max_bytes, rss)
+
+    def quantil(self, q):
+        """Estimativa pelo limite superior do balde onde a fração acumulada atinge q."""
+        alvo = q * self.contagem
+        acumulado = 0
+        for limite, n in zip(LIMITES_HISTOGRAMA_S + (self.max_s,), self.baldes):
+            acumulado += n
+            if acumulado >= alvo:
+                return min(limite, self.max_s)
+        return self.max_s
+
+    def para_dict(self):
+        return {
+            "contagem": self.contagem,
+            "total_s": self.total_s,
+            "media_s": self.total_s / self.contagem if self.contagem else 0.0,
+            "min_s": self.min_s if self.contagem else 0.0,
+            "max_s": self.max_s,
+            "p50_s": self.quantil(0.5),
+            "p95_s": self.quantil(0.95),
+            "baldes": list(self.baldes),
+            "rss_max_bytes": self.rss_max_bytes,
+        }
+
+    def mesclar(self, dados):
+        if not dados["contagem"]:
+            return
+        self.contagem += dados["contagem"]
+        self.total_s += dados["total_s"]
+        self.min_s = min(self.min_s, dados["min_s"])
+        self.max_s = max(self.max_s, dados["max_s"])
+        self.baldes = [a + b for a, b in zip(self.baldes, dados["baldes"])]
+        self.rss_max_bytes = max(self.rss_max_bytes, dados["rss_max_bytes"])
+
+
+class Registro:
+    """Agrega as durações por etapa e os contadores do processo. Seguro entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.etapas = {}
+        self.contadores = {}
+        self._pico_rss_externo = 0
+
+    def registrar(self, nome, duracao, rss=0):
+        with self._lock:
+            estatistica = self.etapas.get(nome)
+            if estatistica is None:
+                estatistica = self.etapas[nome] = Estatistica()
+            estatistica.adicionar(duracao, rss)
+
+    def incrementar(self, nome, valor=1):
+        with self._lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + valor
+
+    def limpar(self):
+        with self._lock:
+            self.etapas.clear()
+            self.contadores.clear()
+            self._pico_rss_externo = 0
+
+    def resumo(self):
+        with self._lock:
+            return {
+                "etapas": {nome: e.para_dict() for nome, e in sorted(self.etapas.items())},
+                "contadores": dict(sorted(self.contadores.items())),
+                "pico_rss_bytes": max(pico_rss_bytes(), self._pico_rss_externo),
+                "pico_rss_filhos_bytes": pico_rss_bytes(filhos=True),
+            }
+
+    def mesclar(self, resumo):
+        """Soma um resumo vindo de outro processo (ex.: um worker do pool de pré-processamento)."""
+        with self._lock:
+            for nome, dados in resumo["etapas"].items():
+                self.etapas.setdefault(nome, Estatistica()).mesclar(dados)
+            for nome, valor in resumo["contadores"].items():
+                self.contadores[nome] = self.contadores.get(nome, 0) + valor
+            self._pico_rss_externo = max(self._pico_rss_externo, resumo["pico_rss_bytes"])
+
+
+REGISTRO = Registro()
+
+
+class _Etapa:
+    __slots__ = ("nome", "inicio")
+
+    def __init__(self, nome):
+        self.nome = nome
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRO.registrar(self.nome, time.perf_counter() - self.inicio, rss_atual_bytes())
+        return False
+
+
+class _Nula:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULA = _Nula()
+
+
+def etapa(nome):
+    """
+    Context manager que mede a duração de um trecho e o RSS ao final.
+    Desligado, devolve um objeto vazio compartilhado (custo de uma chamada).
+    """
+    return _Etapa(nome) if _ativo else _NULA
+
+
+def cronometrar(nome=None):
+    """Decorator equivalente a `etapa`; o nome padrão é modulo.funcao."""
+    def decorator(func):
+        rotulo = nome or f"{func.__module__}.{func.__name__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _ativo:
+                return func(*args, **kwargs)
+            with _Etapa(rotulo):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def incrementar(nome, valor=1):
+    if _ativo:
+        REGISTRO.incrementar(nome, valor)
+
+
+# ---------------------------------------------------------------- exportação
+def metricas_planas(prefixo="inst"):
+    """Resumo achatado em {nome: valor}, no formato aceito pelo MLflow."""
+    resumo = REGISTRO.resumo()
+    metricas = {}
+    for nome, e in resumo["etapas"].items():
+        for campo in ("contagem", "total_s", "media_s", "p50_s", "p95_s", "max_s"):
+            metricas[f"{prefixo}.{nome}.{campo}"] = float(e[campo])
+        metricas[f"{prefixo}.{nome}.rss_max_mb"] = e["rss_max_bytes"] / 2**20
+    for nome, valor in resumo["contadores"].items():
+        metricas[f"{prefixo}.contador.{nome}"] = float(valor)
+    metricas[f"{prefixo}.pico_rss_mb"] = resumo["pico_rss_bytes"] / 2**20
+    metricas[f"{prefixo}.pico_rss_filhos_mb"] = resumo["pico_rss_filhos_bytes"] / 2**20
+    return metricas
+
+
+def registrar_mlflow(prefixo="inst"):
+    """Loga o resumo como métricas na run MLflow ativa, via mlflow_tracking."""
+    if not _ativo or not REGISTRO.etapas:
+        return
+    from mlflow_tracking import log_metrics
+
+    log_metrics(metricas_planas(prefixo))
+
+
+def texto_prometheus():
+    resumo = REGISTRO.resumo()
+    linhas = [f"# TYPE {PREFIXO_PROMETHEUS}_etapa_segundos histogram"]
+    for nome, e in resumo["etapas"].items():
+        acumulado = 0
+        for limite, n in zip(LIMITES_HISTOGRAMA_S, e["baldes"]):
+            acumulado += n
+            linhas.append(f'{PREFIXO_PROMETHEUS}_etapa_segundos_bucket{{etapa="{nome}",le="{limite}"}} {acumulado}')
+        linhas.append(f'{PREFIXO_PROMETHEUS}_etapa_segundos_bucket{{etapa="{nome}",le="+Inf"}} {e["contagem"]}')
+        linhas.append(f'{PREFIXO_PROMETHEUS}_etapa_segundos_sum{{etapa="{nome}"}} {e["total_s"]}')
+        linhas.append(f'{PREFIXO_PROMETHEUS}_etapa_segundos_count{{etapa="{nome}"}} {e["contagem"]}')
+    linhas.append(f"# TYPE {PREFIXO_PROMETHEUS}_etapa_rss_max_bytes gauge")
+    for nome, e in resumo["etapas"].items():
+        linhas.append(f'{PREFIXO_PROMETHEUS}_etapa_rss_max_bytes{{etapa="{nome}"}} {e["rss_max_bytes"]}')
+    linhas.append(f"# TYPE {PREFIXO_PROMETHEUS}_eventos_total counter")
+    for nome, valor in resumo["contadores"].items():
+        linhas.append(f'{PREFIXO_PROMETHEUS}_eventos_total{{nome="{nome}"}} {valor}')
+    linhas.append(f"# TYPE {PREFIXO_PROMETHEUS}_pico_rss_bytes gauge")
+    linhas.append(f"{PREFIXO_PROMETHEUS}_pico_rss_bytes {resumo['pico_rss_bytes']}")
+    return "\n".join(linhas) + "\n"
+
+
+def exportar_json(caminho):
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(REGISTRO.resumo(), f, indent=2)
+    return caminho
+
+
+def salvar(nome, diretorio=None):
+    """
+    Grava <diretorio>/<nome>.json e <diretorio>/<nome>.prom (texto Prometheus),
+    para runs sem servidor de tracking. Retorna os caminhos gravados.
+    """
+    if not _ativo or not REGISTRO.etapas:
+        return []
+    diretorio = diretorio or DIR_PADRAO
+    os.makedirs(diretorio, exist_ok=True)
+    caminho_json = exportar_json(os.path.join(diretorio, f"{nome}.json"))
+    caminho_prom = os.path.join(diretorio, f"{nome}.prom")
+    with open(caminho_prom, "w", encoding="utf-8") as f:
+        f.write(texto_prometheus())
+    return [caminho_json, caminho_prom]
+
+
+# ------------------------------------------------------- pools de processos
+def exportar_ao_sair(diretorio):
+    """
+    Para initializers de workers: zera o que veio do processo pai no fork e
+    grava o resumo do worker em <diretorio>/<pid>.json quando ele termina.
+    """
+    from multiprocessing import util
+
+    REGISTRO.limpar()
+    caminho = os.path.join(diretorio, f"{os.getpid()}.json")
+    util.Finalize(None, exportar_json, args=(caminho,), exitpriority=10)
+
+
+def mesclar_diretorio(diretorio):
+    """Mescla e apaga os resumos gravados pelos workers em `diretorio`."""
+    for nome in os.listdir(diretorio):
+        caminho = os.path.join(diretorio, nome)
+        with open(caminho, encoding="utf-8") as f:
+            REGISTRO.mesclar(json.load(f))
+        os.remove(caminho)
+    os.rmdir(diretorio)
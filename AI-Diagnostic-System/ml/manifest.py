@@ -0,0 +1,170 @@
+import os
+import json
+import hashlib
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+VERSAO_MANIFESTO = 2
+PROPORCOES_SPLIT = (("train", 0.70), ("val", 0.15), ("test", 0.15))
+
+
+def hash_arquivo(path, bloco=1 << 20):
+    """SHA-256 do conteúdo do arquivo, lido em blocos."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for parte in iter(lambda: f.read(bloco), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+
+def hash_parametros(parametros):
+    """Hash curto e estável de um dicionário de parâmetros serializável em JSON."""
+    texto = json.dumps(parametros, sort_keys=True, default=list)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def split_por_deficit(contagem):
+    """
+    Split mais abaixo da proporção-alvo, dada a `contagem` por split de uma
+    classe. Em empate, vale a ordem de PROPORCOES_SPLIT.
+    """
+    total = sum(contagem.values()) + 1
+    return max(PROPORCOES_SPLIT, key=lambda item: item[1] * total - contagem[item[0]])[0]
+
+
+class Manifesto:
+    """
+    Registro persistente (JSON) do que já foi pré-processado.
+    Cada entrada, indexada pelo caminho da imagem, guarda tamanho, mtime,
+    hash do conteúdo, hash dos parâmetros, classe, split, o arquivo de saída
+    e as medidas do filtro de qualidade (quality_gate.medir). Imagens
+    reprovadas no filtro ficam registradas com saída None, para que mudar os
+    limiares só reaplique o filtro às medidas guardadas. Entradas novas
+    saem do planejar sem split; ele é definido depois do processamento, por
+    atribuir_splits.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.entradas = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                dados = json.load(f)
+            if dados.get("versao") == VERSAO_MANIFESTO:
+                self.entradas = dados["entradas"]
+
+    def salvar(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporario = self.path + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"versao": VERSAO_MANIFESTO, "entradas": self.entradas}, f, ensure_ascii=False)
+        os.replace(temporario, self.path)
+
+    def _hash_se_necessario(self, path):
+        st = os.stat(path)
+        entrada = self.entradas.get(path)
+        if entrada and entrada["tamanho"] == st.st_size and entrada["mtime_ns"] == st.st_mtime_ns:
+            return st, entrada["hash"]
+        return st, hash_arquivo(path)
+
+    def planejar(self, itens, params_hash, base_saida, workers=None, reprocessar=None):
+        """
+        Compara a listagem atual `itens` [(path, classe)] com o manifesto.
+        Retorna (pendentes, removidos): pendentes são entradas novas, alteradas
+        ou com parâmetros diferentes, além das válidas para as quais
+        `reprocessar(entrada)` é verdadeiro; removidos são paths que sumiram
+        do disco. Entradas válidas só têm tamanho/mtime atualizados.
+        """
+        atuais = {path for path, _ in itens}
+        removidos = [path for path in self.entradas if path not in atuais]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            stats = list(executor.map(self._hash_se_necessario, [path for path, _ in itens]))
+
+        pendentes = []
+        for (path, classe), (st, conteudo_hash) in zip(itens, stats):
+            anterior = self.entradas.get(path)
+            entrada = {
+                "classe": classe,
+                "tamanho": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "hash": conteudo_hash,
+                "parametros": params_hash,
+                # Imagens já conhecidas mantêm o split, mesmo se o conteúdo mudar.
+                "split": anterior.get("split") if anterior else None,
+                "saida": os.path.join(conteudo_hash[:2], f"{conteudo_hash}_{params_hash}.npy"),
+            }
+            valida = (
+                anterior is not None
+                and anterior["hash"] == conteudo_hash
+                and anterior["parametros"] == params_hash
+                and anterior["classe"] == classe
+                and (anterior["saida"] is None or os.path.exists(os.path.join(base_saida, anterior["saida"])))
+            )
+            if valida and not (reprocessar is not None and reprocessar(anterior)):
+                anterior.update(tamanho=st.st_size, mtime_ns=st.st_mtime_ns)
+            else:
+                pendentes.append((path, entrada))
+        return pendentes, removidos
+
+    def atribuir_splits(self, paths, dividir):
+        """
+        Define o split das entradas de `paths` que ainda não têm um. Na
+        primeira execução (nenhuma entrada com split), `dividir(labels)` sorteia
+        todas de uma vez, com o mesmo 70/15/15 estratificado do
+        carregar_dataset. Depois disso só as imagens novas são colocadas, uma
+        a uma, no split da sua classe mais abaixo da proporção; as demais nunca
+        mudam de split. Retorna quantas entradas receberam split.
+        """
+        sem_split = [path for path in paths if self.entradas[path].get("split") is None]
+        if not sem_split:
+            return 0
+        if all(e.get("split") is None for e in self.entradas.values()):
+            splits = dividir(np.array([self.entradas[path]["classe"] for path in paths]))
+            for path, split in zip(paths, splits):
+                self.entradas[path]["split"] = str(split)
+            return len(paths)
+
+        contagens = defaultdict(Counter)
+        for entrada in self.entradas.values():
+            if entrada.get("split") is not None:
+                contagens[entrada["classe"]][entrada["split"]] += 1
+        for path in sem_split:
+            entrada = self.entradas[path]
+            entrada["split"] = split_por_deficit(contagens[entrada["classe"]])
+            contagens[entrada["classe"]][entrada["split"]] += 1
+        return len(sem_split)
+
+    def registrar(self, path, entrada, imagem, base_saida):
+        """Grava `imagem` e registra a entrada; sem imagem (reprovada no filtro), a entrada fica sem saída."""
+        if imagem is None:
+            self.entradas[path] = {**entrada, "saida": None}
+            return
+        destino = os.path.join(base_saida, entrada["saida"])
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        np.save(destino, imagem)
+        self.entradas[path] = entrada
+
+    def remover(self, paths, base_saida):
+        """Remove entradas e apaga saídas que nenhuma outra entrada referencia."""
+        saidas = {self.entradas.pop(path)["saida"] for path in paths if path in self.entradas} - {None}
+        em_uso = {e["saida"] for e in self.entradas.values()}
+        for saida in saidas - em_uso:
+            destino = os.path.join(base_saida, saida)
+            if os.path.exists(destino):
+                os.remove(destino)
+
+    def limpar_orfaos(self, base_saida):
+        """Apaga saídas de parâmetros antigos que não são mais referenciadas."""
+        em_uso = {e["saida"] for e in self.entradas.values()}
+        if not os.path.isdir(base_saida):
+            return 0
+        removidos = 0
+        for pasta in os.listdir(base_saida):
+            for nome in os.listdir(os.path.join(base_saida, pasta)):
+                if os.path.join(pasta, nome) not in em_uso:
+                    os.remove(os.path.join(base_saida, pasta, nome))
+                    removidos += 1
+        return removidos
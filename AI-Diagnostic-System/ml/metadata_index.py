@@ -0,0 +1,185 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from manifest import hash_arquivo
+
+VERSAO_INDICE = 1
+EXTENSOES = (".jpg", ".png", ".jpeg")
+COLUNAS = ("path", "classe", "largura", "altura", "modo", "tamanho", "mtime_ns", "hash",
+           "iris_x", "iris_y", "iris_r", "erro")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS imagens (
+    path TEXT PRIMARY KEY,
+    classe TEXT,
+    largura INTEGER,
+    altura INTEGER,
+    modo TEXT,
+    tamanho INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT,
+    iris_x INTEGER,
+    iris_y INTEGER,
+    iris_r INTEGER,
+    erro TEXT
+);
+CREATE INDEX IF NOT EXISTS imagens_classe ON imagens (classe);
+CREATE INDEX IF NOT EXISTS imagens_hash ON imagens (hash);
+"""
+
+
+def listar_arquivos(raiz):
+    """
+    (path, classe) das imagens em raiz/<classe>/ e, no layout antigo sem
+    pastas de classe, das soltas na raiz (classe vazia). Ordem determinística.
+    """
+    itens = []
+    for nome in sorted(os.listdir(raiz)):
+        caminho = os.path.join(raiz, nome)
+        if os.path.isdir(caminho):
+            itens.extend((os.path.join(caminho, f), nome) for f in sorted(os.listdir(caminho))
+                         if f.lower().endswith(EXTENSOES))
+        elif nome.lower().endswith(EXTENSOES):
+            itens.append((caminho, ""))
+    return itens
+
+
+def ler_cabecalho(path):
+    """Dimensões, modo e hash do conteúdo. O PIL só decodifica o cabeçalho aqui."""
+    from PIL import Image
+
+    conteudo_hash = hash_arquivo(path)
+    try:
+        with Image.open(path) as img:
+            largura, altura = img.size
+            modo = img.mode
+    except Exception as e:
+        return {"hash": conteudo_hash, "largura": None, "altura": None, "modo": None, "erro": str(e)}
+    return {"hash": conteudo_hash, "largura": largura, "altura": altura, "modo": modo, "erro": None}
+
+
+class IndiceMetadados:
+    """
+    Índice SQLite com os metadados das imagens brutas: dimensões, modo,
+    tamanho, mtime, hash do conteúdo, classe e, quando conhecida, a
+    geometria da íris. Arquivos com tamanho e mtime inalterados não são
+    relidos em `atualizar`; as outras etapas consultam o índice em vez de
+    percorrer o disco.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conexao = sqlite3.connect(self.path)
+        self.conexao.row_factory = sqlite3.Row
+        self.conexao.executescript(_SCHEMA)
+        self.conexao.execute(f"PRAGMA user_version = {VERSAO_INDICE}")
+
+    def fechar(self):
+        self.conexao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+        return False
+
+    def __len__(self):
+        return self.conexao.execute("SELECT COUNT(*) FROM imagens").fetchone()[0]
+
+    def atualizar(self, itens, workers=None):
+        """
+        Sincroniza o índice com `itens` [(path, classe)]: lê em paralelo só os
+        arquivos novos ou com tamanho/mtime diferentes e remove os que sumiram.
+        Retorna as contagens por situação.
+        """
+        conhecidos = {linha["path"]: linha for linha in
+                      self.conexao.execute("SELECT path, classe, tamanho, mtime_ns FROM imagens")}
+        atuais = {path for path, _ in itens}
+        removidos = [path for path in conhecidos if path not in atuais]
+
+        pendentes, classe_alterada = [], []
+        for path, classe in itens:
+            st = os.stat(path)
+            anterior = conhecidos.get(path)
+            if anterior is not None and anterior["tamanho"] == st.st_size and anterior["mtime_ns"] == st.st_mtime_ns:
+                if anterior["classe"] != classe:
+                    classe_alterada.append((classe, path))
+                continue
+            pendentes.append((path, classe, st))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            cabecalhos = list(executor.map(ler_cabecalho, [path for path, _, _ in pendentes]))
+
+        linhas = [
+            (path, classe, cab["largura"], cab["altura"], cab["modo"], st.st_size, st.st_mtime_ns, cab["hash"],
+             None, None, None, cab["erro"])
+            for (path, classe, st), cab in zip(pendentes, cabecalhos)
+        ]
+
+        with self.conexao:
+            self.conexao.executemany("DELETE FROM imagens WHERE path = ?", [(p,) for p in removidos])
+            self.conexao.executemany("UPDATE imagens SET classe = ? WHERE path = ?", classe_alterada)
+            self.conexao.executemany(
+                f"INSERT OR REPLACE INTO imagens ({', '.join(COLUNAS)}) VALUES ({', '.join('?' * len(COLUNAS))})",
+                linhas,
+            )
+        return {
+            "total": len(itens),
+            "lidas": len(pendentes),
+            "inalteradas": len(itens) - len(pendentes),
+            "removidas": len(removidos),
+            "falhas": sum(1 for cab in cabecalhos if cab["erro"] is not None),
+        }
+
+    def preencher_geometria(self, geometria):
+        """
+        Completa o círculo da íris das imagens que ainda não o têm.
+        `geometria(hash)` devolve (x, y, r) ou None (ex.: consulta ao cache do preprocess).
+        """
+        cursor = self.conexao.execute("SELECT path, hash FROM imagens WHERE erro IS NULL AND iris_r IS NULL")
+        atualizacoes = []
+        for path, conteudo_hash in cursor.fetchall():
+            circulo = geometria(conteudo_hash)
+            if circulo:
+                atualizacoes.append((*circulo, path))
+        with self.conexao:
+            self.conexao.executemany("UPDATE imagens SET iris_x = ?, iris_y = ?, iris_r = ? WHERE path = ?",
+                                     atualizacoes)
+        return len(atualizacoes)
+
+    def consultar(self, onde="1", parametros=()):
+        """Linhas (dict) que satisfazem a cláusula WHERE `onde`, ordenadas por path."""
+        cursor = self.conexao.execute(f"SELECT * FROM imagens WHERE {onde} ORDER BY path", parametros)
+        return [dict(linha) for linha in cursor]
+
+    def itens(self, classe=None, incluir_falhas=False):
+        """(path, classe) das imagens indexadas, no formato de preprocess.listar_imagens."""
+        condicoes, parametros = [], []
+        if not incluir_falhas:
+            condicoes.append("erro IS NULL")
+        if classe is not None:
+            condicoes.append("classe = ?")
+            parametros.append(classe)
+        linhas = self.consultar(" AND ".join(condicoes) or "1", parametros)
+        return [(linha["path"], linha["classe"]) for linha in linhas]
+
+    def grupos_por_hash(self):
+        """{hash: [paths]} dos conteúdos que aparecem em mais de um arquivo (cópias exatas)."""
+        cursor = self.conexao.execute(
+            "SELECT hash, path FROM imagens WHERE hash IN "
+            "(SELECT hash FROM imagens GROUP BY hash HAVING COUNT(*) > 1) ORDER BY hash, path"
+        )
+        grupos = {}
+        for conteudo_hash, path in cursor:
+            grupos.setdefault(conteudo_hash, []).append(path)
+        return grupos
+
+    def resumo(self):
+        """Contagem de imagens, falhas e tamanho total por classe."""
+        cursor = self.conexao.execute(
+            "SELECT classe, COUNT(*), SUM(erro IS NOT NULL), SUM(tamanho) FROM imagens GROUP BY classe ORDER BY classe"
+        )
+        return {classe: {"imagens": n, "falhas": falhas, "bytes": total} for classe, n, falhas, total in cursor}
@@ -1,10 +1,13 @@
 import os
+import time
+import queue
+import atexit
 import logging
 import importlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturoTimeout
 from contextlib import contextmanager
-from typing import Optional, Any, Generator
-
-import mlflow
+from typing import Optional, Any, Dict, Generator, List, Tuple
 
 # Configuração básica de logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -13,6 +16,17 @@ logger = logging.getLogger(__name__)
 DEFAULT_EXPERIMENT = os.getenv("MLFLOW_EXPERIMENT", "default_experiment")
 MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000")
 
+# Limites do endpoint log-batch do MLflow.
+MAX_METRICAS_POR_LOTE = 1000
+MAX_PARAMS_TAGS_POR_LOTE = 100
+MAX_ENTIDADES_POR_LOTE = 1000  # métricas + params + tags
+TAMANHO_FILA_PADRAO = 10_000
+INTERVALO_ENVIO_S = 1.0
+
+# (tracking_uri, experimento) -> experiment_id, e o par ativo no processo.
+_experimentos: Dict[Tuple[str, str], str] = {}
+_experimento_ativo: Optional[Tuple[str, str]] = None
+
 
 def _check_module(module_name: str) -> bool:
     """Verifica se um módulo está disponível para import."""
@@ -27,22 +41,35 @@ def init_mlflow(
     Inicializa o MLflow e define o experimento ativo.
     Retorna o experiment_id configurado.
     """
+    global _experimento_ativo
+    import mlflow
+
     uri = tracking_uri or MLFLOW_TRACKING_URI
     exp_name = experiment_name or DEFAULT_EXPERIMENT
+    chave = (uri, exp_name)
+
+    # O experiment_id fica em cache por processo: entrar de novo numa run
+    # (inclusive aninhada) não repete a consulta ao servidor.
+    if chave == _experimento_ativo:
+        return _experimentos[chave]
 
     mlflow.set_tracking_uri(uri)
 
     try:
-        existing_exp = mlflow.get_experiment_by_name(exp_name)
+        experiment_id = _experimentos.get(chave)
+        if experiment_id is None:
+            existing_exp = mlflow.get_experiment_by_name(exp_name)
 
-        if existing_exp is None:
-            experiment_id = mlflow.create_experiment(exp_name)
-            logger.info(f"Experimento '{exp_name}' criado (id={experiment_id})")
-        else:
-            experiment_id = existing_exp.experiment_id
-            logger.info(f"Experimento '{exp_name}' carregado (id={experiment_id})")
+            if existing_exp is None:
+                experiment_id = mlflow.create_experiment(exp_name)
+                logger.info(f"Experimento '{exp_name}' criado (id={experiment_id})")
+            else:
+                experiment_id = existing_exp.experiment_id
+                logger.info(f"Experimento '{exp_name}' carregado (id={experiment_id})")
+            _experimentos[chave] = experiment_id
 
-        mlflow.set_experiment(exp_name)
+        mlflow.set_experiment(experiment_id=experiment_id)
+        _experimento_ativo = chave
         logger.info(f"MLflow configurado. URI={uri} | experiment={exp_name}")
         return experiment_id
 
@@ -61,6 +88,8 @@ def mlflow_run(
     Context manager para iniciar uma run do MLflow.
     Pode ser nested e opcionalmente inicializar outro experimento.
     """
+    import mlflow
+
     init_mlflow(experiment_name=experiment_name) if experiment_name else init_mlflow()
 
     try:
@@ -88,12 +117,14 @@ def log_model(
     if not _check_module("keras"):
         raise ImportError("Keras não está instalado no ambiente")
 
-    if not hasattr(mlflow, "keras"):
-        raise ImportError("mlflow.keras não está disponível. Instale MLflow com suporte Keras.")
+    try:
+        import mlflow.keras
+    except ImportError as e:
+        raise ImportError("mlflow.keras não está disponível. Instale MLflow com suporte Keras.") from e
 
     try:
         model_uri = mlflow.keras.log_model(
-            keras_model=model,
+            model,
             artifact_path=artifact_path,
             registered_model_name=registered_model_name
         )
@@ -110,6 +141,8 @@ def log_artifact(
     artifact_path: Optional[str] = None
 ) -> str:
 
+    import mlflow
+
     if not os.path.exists(local_path):
         raise FileNotFoundError(f"Arquivo '{local_path}' não encontrado")
 
@@ -121,3 +154,192 @@ def log_artifact(
     except Exception as e:
         logger.error(f"Falha ao logar artefato: {e}", exc_info=True)
         raise RuntimeError("Erro ao registrar artefato no MLflow") from e
+
+
+def log_metrics(
+    metrics: Dict[str, float],
+    step: Optional[int] = None
+) -> None:
+    """Loga várias métricas de uma vez na run ativa."""
+    import mlflow
+
+    try:
+        mlflow.log_metrics(metrics, step=step)
+        logger.info(f"{len(metrics)} métricas logadas")
+
+    except Exception as e:
+        logger.error(f"Falha ao logar métricas: {e}", exc_info=True)
+        raise RuntimeError("Erro ao registrar métricas no MLflow") from e
+
+
+class LoggerAssincrono:
+    """
+    Logger com buffer para uma run: métricas, params e tags entram numa fila
+    limitada e uma thread de fundo os envia agrupados via log_batch (no
+    máximo a cada `intervalo_s`). Artefatos sobem numa thread separada.
+    A chamada só bloqueia quando a fila está cheia.
+
+    `flush()` espera tudo o que já foi enfileirado; `fechar()` também encerra
+    as threads e é registrado no atexit, então nada se perde ao sair.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        tamanho_fila: int = TAMANHO_FILA_PADRAO,
+        intervalo_s: float = INTERVALO_ENVIO_S,
+        client: Any = None
+    ):
+        from mlflow.tracking import MlflowClient
+
+        self.run_id = run_id
+        self.intervalo_s = intervalo_s
+        self.client = client or MlflowClient()
+        self.erros = 0
+        self._fila: queue.Queue = queue.Queue(maxsize=tamanho_fila)
+        self._parar = threading.Event()
+        self._uploads = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mlflow-artifacts")
+        self._pendentes: List[Future] = []
+        self._fechado = False
+        self._thread = threading.Thread(target=self._executar, name="mlflow-batch", daemon=True)
+        self._thread.start()
+        atexit.register(self.fechar)
+
+    # ------------------------------------------------------------- enfileirar
+    def log_metric(self, key: str, value: float, step: Optional[int] = None, timestamp: Optional[int] = None):
+        from mlflow.entities import Metric
+
+        self._colocar(Metric(key, float(value), timestamp or int(time.time() * 1000), step or 0))
+
+    def log_metrics(self, metrics: Dict[str, float], step: Optional[int] = None):
+        timestamp = int(time.time() * 1000)
+        for key, value in metrics.items():
+            self.log_metric(key, value, step, timestamp)
+
+    def log_param(self, key: str, value: Any):
+        from mlflow.entities import Param
+
+        self._colocar(Param(key, str(value)))
+
+    def log_params(self, params: Dict[str, Any]):
+        for key, value in params.items():
+            self.log_param(key, value)
+
+    def set_tag(self, key: str, value: Any):
+        from mlflow.entities import RunTag
+
+        self._colocar(RunTag(key, str(value)))
+
+    def _colocar(self, item) -> None:
+        if self._fechado:
+            raise RuntimeError(f"Logger da run {self.run_id} já foi encerrado")
+        self._fila.put(item)
+
+    def log_artifact(self, local_path: str, artifact_path: Optional[str] = None) -> Future:
+        return self._enviar(self.client.log_artifact, local_path, artifact_path)
+
+    def log_artifacts(self, local_dir: str, artifact_path: Optional[str] = None) -> Future:
+        return self._enviar(self.client.log_artifacts, local_dir, artifact_path)
+
+    def _enviar(self, funcao, caminho: str, artifact_path: Optional[str]) -> Future:
+        if not os.path.exists(caminho):
+            raise FileNotFoundError(f"Arquivo '{caminho}' não encontrado")
+        futuro = self._uploads.submit(funcao, self.run_id, caminho, artifact_path)
+        futuro.add_done_callback(self._registrar_upload)
+        self._pendentes.append(futuro)
+        return futuro
+
+    def _registrar_upload(self, futuro: Future):
+        if futuro.exception() is not None:
+            self.erros += 1
+            logger.error(f"Falha no upload de artefato: {futuro.exception()}")
+
+    # ------------------------------------------------------------------ envio
+    def _drenar(self, primeiro) -> None:
+        from mlflow.entities import Metric, Param
+
+        metricas, params, tags = [], [], []
+        item = primeiro
+        while item is not None:
+            destino = metricas if isinstance(item, Metric) else params if isinstance(item, Param) else tags
+            destino.append(item)
+            if (len(metricas) >= MAX_METRICAS_POR_LOTE or len(params) + len(tags) >= MAX_PARAMS_TAGS_POR_LOTE
+                    or len(metricas) + len(params) + len(tags) >= MAX_ENTIDADES_POR_LOTE):
+                break
+            try:
+                item = self._fila.get_nowait()
+            except queue.Empty:
+                item = None
+        try:
+            self.client.log_batch(self.run_id, metrics=metricas, params=params, tags=tags)
+        except Exception as e:
+            self.erros += 1
+            logger.error(f"Falha no log_batch ({len(metricas)} métricas, {len(params)} params): {e}")
+        finally:
+            # Só agora o lote conta como entregue: o flush espera o envio, não a retirada da fila.
+            for _ in range(len(metricas) + len(params) + len(tags)):
+                self._fila.task_done()
+
+    def _executar(self) -> None:
+        while not (self._parar.is_set() and self._fila.empty()):
+            try:
+                primeiro = self._fila.get(timeout=self.intervalo_s)
+            except queue.Empty:
+                continue
+            self._drenar(primeiro)
+            if not self._parar.is_set():
+                # Acumula um pouco antes do próximo envio para formar lotes maiores.
+                self._parar.wait(self.intervalo_s)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera o envio de tudo o que já foi enfileirado, inclusive artefatos.
+        `timeout` (segundos) vale para a espera inteira, fila e uploads; se
+        ele expira, retorna False e o que falta continua sendo enviado.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+
+        def restante() -> Optional[float]:
+            return None if limite is None else max(0.0, limite - time.monotonic())
+
+        with self._fila.all_tasks_done:
+            if not self._fila.all_tasks_done.wait_for(lambda: not self._fila.unfinished_tasks, restante()):
+                return False
+        pendentes, self._pendentes = self._pendentes, []
+        for i, futuro in enumerate(pendentes):
+            try:
+                futuro.result(timeout=restante())
+            except FuturoTimeout:
+                self._pendentes = pendentes[i:] + self._pendentes
+                return False
+            except Exception:
+                pass  # já contado e logado em _registrar_upload
+        return True
+
+    def fechar(self) -> None:
+        if self._fechado:
+            return
+        self._fechado = True
+        self._parar.set()
+        self._thread.join()
+        self.flush()
+        self._uploads.shutdown(wait=True)
+        atexit.unregister(self.fechar)
+        logger.info(f"Logger da run {self.run_id} encerrado ({self.erros} erros)")
+
+    def __enter__(self) -> "LoggerAssincrono":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.fechar()
+
+
+def callback_keras(logger_mlflow: LoggerAssincrono, prefixo: str = "") -> Any:
+    """Callback Keras que envia as métricas de cada época ao LoggerAssincrono assim que a época termina."""
+    from tensorflow import keras
+
+    class MLflowCallback(keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            logger_mlflow.log_metrics({f"{prefixo}{k}": float(v) for k, v in (logs or {}).items()}, step=epoch)
+
+    return MLflowCallback()
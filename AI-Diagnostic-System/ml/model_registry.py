@@ -0,0 +1,245 @@
+import json
+import time
+import zipfile
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATH = Path(__file__).resolve().parent / "models" / "model_schema.json"
+MAX_BYTES_PADRAO = 2 << 30
+IDADE_MINIMA_PADRAO_S = 10.0
+FORMA_AQUECIMENTO = (1, 224, 224, 3)
+ASSINATURA_HDF5 = b"\x89HDF\r\n\x1a\n"
+
+
+def _mtime_mais_recente(caminho: Path) -> float:
+    if caminho.is_file():
+        return caminho.stat().st_mtime
+    return max((p.stat().st_mtime for p in caminho.rglob("*")), default=caminho.stat().st_mtime)
+
+
+def _tamanho(caminho: Path) -> int:
+    if caminho.is_file():
+        return caminho.stat().st_size
+    return sum(p.stat().st_size for p in caminho.rglob("*") if p.is_file())
+
+
+def _estrutura_completa(caminho: Path, tipo: str) -> bool:
+    if tipo == "saved_model":
+        return (caminho / "saved_model.pb").exists() and (caminho / "variables" / "variables.index").exists()
+    if tipo == "keras":
+        return zipfile.is_zipfile(caminho)
+    with open(caminho, "rb") as f:
+        return f.read(len(ASSINATURA_HDF5)) == ASSINATURA_HDF5
+
+
+def carregar_metadados(caminho: Path) -> Dict[str, Any]:
+    """
+    Classes de label_classes.json (ao lado do artefato), na ordem das saídas
+    do modelo, e o model_schema.json do projeto. Sem label_classes.json as
+    classes ficam None: a lista do schema não segue a ordem do LabelEncoder
+    do treino e não serve para nomear as saídas.
+    """
+    schema = {}
+    if SCHEMA_PATH.exists():
+        with open(SCHEMA_PATH, encoding="utf-8") as f:
+            schema = json.load(f)
+    classes = None
+    label_classes = caminho.parent / "label_classes.json"
+    if label_classes.exists():
+        with open(label_classes, encoding="utf-8") as f:
+            classes = json.load(f)
+    return {"classes": classes, "schema": schema}
+
+
+def carregar_artefato(caminho: Path) -> Callable[[np.ndarray], np.ndarray]:
+    """Carrega um SavedModel ou arquivo .keras/.h5 e retorna uma função lote -> probabilidades."""
+    import tensorflow as tf
+
+    if caminho.suffix in (".keras", ".h5"):
+        modelo = tf.keras.models.load_model(str(caminho), compile=False)
+        return lambda lote: np.asarray(modelo.predict_on_batch(lote))
+
+    carregado = tf.saved_model.load(str(caminho))
+    return lambda lote: carregado.serve(tf.constant(lote, dtype=tf.float32)).numpy()
+
+
+class ModeloCarregado:
+    """Modelo pronto para uso. Quem está predizendo mantém a referência, mesmo após um hot-swap."""
+
+    def __init__(self, artefato: Dict[str, Any], prever: Callable[[np.ndarray], np.ndarray]):
+        self.artefato = artefato
+        self.versao = artefato["versao"]
+        self.classes = artefato["classes"]
+        self.tamanho_bytes = artefato["tamanho_bytes"]
+        self._prever = prever
+
+    def prever(self, lote: np.ndarray) -> np.ndarray:
+        return self._prever(lote)
+
+
+class RegistroModelos:
+    """
+    Índice dos artefatos em models_dir (SavedModel, .keras e .h5) com cache LRU
+    de modelos carregados limitado por memória, aquecimento ao carregar,
+    fixação de versão e troca atômica para o modelo completo mais recente.
+
+    Um artefato só entra no índice quando a estrutura está completa e nenhum
+    arquivo dele foi modificado nos últimos `idade_minima_s` segundos, o que
+    evita pegar um checkpoint que o ModelCheckpoint ainda está escrevendo.
+    """
+
+    def __init__(
+        self,
+        models_dir: Path,
+        max_bytes: int = MAX_BYTES_PADRAO,
+        idade_minima_s: float = IDADE_MINIMA_PADRAO_S,
+        carregador: Callable[[Path], Callable[[np.ndarray], np.ndarray]] = carregar_artefato,
+        forma_aquecimento=FORMA_AQUECIMENTO,
+    ):
+        self.models_dir = Path(models_dir)
+        self.max_bytes = max_bytes
+        self.idade_minima_s = idade_minima_s
+        self.carregador = carregador
+        self.forma_aquecimento = forma_aquecimento
+        self._indice: Dict[str, Dict[str, Any]] = {}
+        self._cache: "OrderedDict[str, ModeloCarregado]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._atual: Optional[ModeloCarregado] = None
+        self._fixada: Optional[str] = None
+        self._parar = threading.Event()
+        self._observador: Optional[threading.Thread] = None
+
+    # ---------------------------------------------------------------- índice
+    def _candidatos(self):
+        for caminho in self.models_dir.glob("**/saved_model"):
+            yield caminho, "saved_model"
+        for caminho in self.models_dir.glob("**/*.keras"):
+            yield caminho, "keras"
+        for caminho in self.models_dir.glob("**/*.h5"):
+            yield caminho, "h5"
+
+    def atualizar(self) -> List[Dict[str, Any]]:
+        """Reindexa models_dir. Artefatos já conhecidos e inalterados não são reprocessados."""
+        agora = time.time()
+        indice = {}
+        for caminho, tipo in self._candidatos():
+            versao = caminho.relative_to(self.models_dir).as_posix()
+            try:
+                mtime = _mtime_mais_recente(caminho)
+                anterior = self._indice.get(versao)
+                if anterior is not None and anterior["mtime"] == mtime:
+                    indice[versao] = anterior
+                    continue
+                if agora - mtime < self.idade_minima_s or not _estrutura_completa(caminho, tipo):
+                    continue
+                indice[versao] = {
+                    "versao": versao,
+                    "caminho": caminho,
+                    "tipo": tipo,
+                    "mtime": mtime,
+                    "tamanho_bytes": _tamanho(caminho),
+                    **carregar_metadados(caminho),
+                }
+            except OSError:
+                # Arquivo removido ou sendo reescrito durante a varredura.
+                continue
+        with self._lock:
+            self._indice = indice
+        return self.listar()
+
+    def listar(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return sorted(self._indice.values(), key=lambda a: a["mtime"])
+
+    def mais_recente(self, tipos=("saved_model",)) -> Optional[Dict[str, Any]]:
+        artefatos = [a for a in self.listar() if a["tipo"] in tipos] or self.listar()
+        return artefatos[-1] if artefatos else None
+
+    # ----------------------------------------------------------------- cache
+    def _carregar(self, artefato: Dict[str, Any]) -> ModeloCarregado:
+        inicio = time.perf_counter()
+        modelo = ModeloCarregado(artefato, self.carregador(artefato["caminho"]))
+        modelo.prever(np.zeros(self.forma_aquecimento, dtype=np.float32))
+        logger.info(f"Modelo {artefato['versao']} carregado e aquecido em {time.perf_counter() - inicio:.2f}s")
+        return modelo
+
+    def _despejar(self) -> None:
+        protegidos = {self._fixada, self._atual.versao if self._atual else None}
+        total = sum(m.tamanho_bytes for m in self._cache.values())
+        for versao in list(self._cache):
+            if total <= self.max_bytes:
+                break
+            if versao in protegidos:
+                continue
+            total -= self._cache.pop(versao).tamanho_bytes
+
+    def obter(self, versao: Optional[str] = None) -> ModeloCarregado:
+        """Retorna o modelo da versão pedida (ou o mais recente), carregando se necessário."""
+        if not self._indice:
+            self.atualizar()
+        artefato = self._indice.get(versao) if versao else self.mais_recente()
+        if artefato is None:
+            raise FileNotFoundError(f"Modelo não encontrado em {self.models_dir}: {versao or 'mais recente'}")
+
+        with self._lock:
+            modelo = self._cache.get(artefato["versao"])
+            if modelo is not None:
+                self._cache.move_to_end(artefato["versao"])
+                return modelo
+        # O carregamento acontece fora do lock para não travar quem já está predizendo.
+        modelo = self._carregar(artefato)
+        with self._lock:
+            self._cache[artefato["versao"]] = modelo
+            self._despejar()
+        return modelo
+
+    # ------------------------------------------------------------- hot-swap
+    def fixar(self, versao: Optional[str]) -> ModeloCarregado:
+        """Fixa uma versão (None volta a seguir a mais recente)."""
+        self._fixada = versao
+        modelo = self.obter(versao)
+        self._atual = modelo
+        return modelo
+
+    def atual(self) -> ModeloCarregado:
+        modelo = self._atual
+        if modelo is None:
+            modelo = self._atual = self.obter(self._fixada)
+        return modelo
+
+    def verificar_atualizacao(self) -> bool:
+        """Troca o modelo atual se um artefato completo mais novo apareceu. Retorna True se trocou."""
+        if self._fixada is not None:
+            return False
+        self.atualizar()
+        recente = self.mais_recente()
+        if recente is None or (self._atual is not None and self._atual.versao == recente["versao"]):
+            return False
+        novo = self.obter(recente["versao"])
+        self._atual = novo  # atribuição única: predições em andamento seguem com o modelo antigo
+        logger.info(f"Hot-swap para o modelo {novo.versao}")
+        return True
+
+    def iniciar_observador(self, intervalo_s: float = 30.0) -> None:
+        def observar():
+            while not self._parar.wait(intervalo_s):
+                try:
+                    self.verificar_atualizacao()
+                except Exception as e:
+                    logger.error(f"Falha ao verificar novos modelos: {e}", exc_info=True)
+
+        self._parar.clear()
+        self._observador = threading.Thread(target=observar, name="model-registry-watcher", daemon=True)
+        self._observador.start()
+
+    def parar(self) -> None:
+        self._parar.set()
+        if self._observador is not None:
+            self._observador.join(timeout=5)
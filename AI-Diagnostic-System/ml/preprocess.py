@@ -1,86 +1,696 @@
 
 
 import os
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import cv2
 import numpy as np
-import tensorflow as tf
-from sklearn.model_selection import train_test_split
+
+import dataset_store
+import dedup_index
+import instrumentation
+import manifest
+import quality_gate
+import split_manifest
+from metadata_index import IndiceMetadados
+from geometry_cache import CacheGeometria
 
 RAW_DIR = "data/raw"
 PROCESSED_DIR = "data/processed"
+SHARDS_DIR = os.path.join(PROCESSED_DIR, "dataset_shards")
+NPZ_PATH = os.path.join(PROCESSED_DIR, "dataset_prepared.npz")
+MANIFEST_PATH = os.path.join(PROCESSED_DIR, "manifest.json")
+CACHE_IMAGENS_DIR = os.path.join(PROCESSED_DIR, "cache_imagens")
+# Fixo em relação ao módulo, para que os scripts/ abram o mesmo cache qualquer que seja o cwd.
+CACHE_GEOMETRIA_PATH = str(Path(__file__).resolve().parents[1] / "data" / "processed" / "geometria_cache.npz")
+INDICE_DUPLICATAS_PATH = os.path.join(PROCESSED_DIR, "duplicatas.sqlite")
 IMG_SIZE = (224, 224)
+EXTENSOES = ('.jpg', '.png', '.jpeg')
+CHUNKSIZE_PADRAO = 16
 
-def segmentar_iris(imagem):
-    gray = cv2.cvtColor(imagem, cv2.COLOR_BGR2GRAY)
-    gray = cv2.medianBlur(gray, 5)
-    circles = cv2.HoughCircles(
-        gray,
-        cv2.HOUGH_GRADIENT,
-        dp=1,
-        minDist=100,
-        param1=100,
-        param2=30,
-        minRadius=30,
-        maxRadius=120
+HOUGH_PARAMS = dict(dp=1, minDist=100, param1=100, param2=30, minRadius=30, maxRadius=120)
+MODOS_SEGMENTACAO = ("referencia", "rapido")
+LADO_MAX_PIRAMIDE = 640  # maior lado do nível da pirâmide usado na detecção rápida
+MARGEM_REFINO = 0.2      # fração do raio usada como folga na janela de refino
+LIMIAR_REFLEXO = 240
+RAIO_INPAINT = 5
+
+def _hough(gray, **params):
+    circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, **{**HOUGH_PARAMS, **params})
+    if circles is None:
+        return None
+    x, y, r = np.uint16(np.around(circles))[0][0]
+    return int(x), int(y), int(r)
+
+def _localizar_iris_rapido(gray):
+    nivel = gray
+    escala = 1
+    while max(nivel.shape) > LADO_MAX_PIRAMIDE:
+        nivel = cv2.pyrDown(nivel)
+        escala *= 2
+    if escala == 1:
+        return _hough(cv2.medianBlur(gray, 5))
+
+    grosso = _hough(
+        cv2.medianBlur(nivel, 5),
+        minDist=max(1, HOUGH_PARAMS["minDist"] // escala),
+        minRadius=max(1, HOUGH_PARAMS["minRadius"] // escala),
+        maxRadius=max(2, -(-HOUGH_PARAMS["maxRadius"] // escala)),
+    )
+    if grosso is None:
+        return None
+
+    # Refino em resolução cheia, restrito a uma janela em torno da estimativa grossa.
+    x, y, r = (v * escala for v in grosso)
+    folga = int(r * MARGEM_REFINO) + escala
+    meia = r + folga
+    x0, y0 = max(0, x - meia), max(0, y - meia)
+    janela = cv2.medianBlur(gray[y0:y + meia + 1, x0:x + meia + 1], 5)
+    refinado = _hough(
+        janela,
+        minDist=max(janela.shape),
+        minRadius=max(1, r - folga),
+        maxRadius=r + folga,
     )
+    if refinado is None:
+        return x, y, r
+    return refinado[0] + x0, refinado[1] + y0, refinado[2]
+
+def localizar_iris(imagem, modo="referencia"):
+    """Retorna o círculo (x, y, r) da íris em coordenadas da imagem original, ou None."""
+    gray = cv2.cvtColor(imagem, cv2.COLOR_BGR2GRAY)
+    if modo == "rapido":
+        return _localizar_iris_rapido(gray)
+    if modo != "referencia":
+        raise ValueError(f"Modo de segmentação inválido: {modo}")
+    return _hough(cv2.medianBlur(gray, 5))
+
+def segmentar_iris(imagem, modo="referencia"):
+    """
+    No modo "referencia" mascara a íris mantendo o quadro inteiro.
+    No modo "rapido" também recorta a imagem ao retângulo da íris, para que a
+    remoção de reflexos e o resize trabalhem só sobre o disco da íris.
+    """
+    return aplicar_segmentacao(imagem, localizar_iris(imagem, modo), recortar=modo == "rapido")
+
+def aplicar_segmentacao(imagem, circulo, recortar=False):
+    if circulo is None:
+        return imagem
+
+    x, y, r = circulo
+    if recortar:
+        y0, x0 = max(0, y - r), max(0, x - r)
+        imagem = imagem[y0:y + r + 1, x0:x + r + 1]
+        x, y = x - x0, y - y0
+    mask = np.zeros(imagem.shape[:2], dtype=np.uint8)
+    cv2.circle(mask, (x, y), r, (255, 255, 255), -1)
+    return cv2.bitwise_and(imagem, imagem, mask=mask)
+
+def comparar_segmentacao(paths, tolerancia=0.1):
+    """
+    Compara os círculos encontrados pelos modos "referencia" e "rapido".
+    Um par concorda quando centro e raio diferem no máximo `tolerancia` x raio
+    de referência, ou quando nenhum dos modos encontra círculo.
+    """
+    divergencias = []
+    tempos = {modo: 0.0 for modo in MODOS_SEGMENTACAO}
+    avaliadas = 0
+    for path in paths:
+        imagem = cv2.imread(path)
+        if imagem is None:
+            continue
+        avaliadas += 1
+        circulos = {}
+        for modo in MODOS_SEGMENTACAO:
+            inicio = time.perf_counter()
+            circulos[modo] = localizar_iris(imagem, modo)
+            tempos[modo] += time.perf_counter() - inicio
+
+        ref, rapido = circulos["referencia"], circulos["rapido"]
+        if ref is None and rapido is None:
+            continue
+        if ref is not None and rapido is not None:
+            limite = tolerancia * max(ref[2], 1)
+            dist_centro = float(np.hypot(ref[0] - rapido[0], ref[1] - rapido[1]))
+            if dist_centro <= limite and abs(ref[2] - rapido[2]) <= limite:
+                continue
+        divergencias.append({"arquivo": path, "referencia": ref, "rapido": rapido})
 
-    if circles is not None:
-        circles = np.uint16(np.around(circles))
-        x, y, r = circles[0][0]
-        mask = np.zeros_like(gray)
-        cv2.circle(mask, (x, y), r, (255, 255, 255), -1)
-        result = cv2.bitwise_and(imagem, imagem, mask=mask)
-        return result
-    return imagem
+    return {
+        "avaliadas": avaliadas,
+        "tolerancia": tolerancia,
+        "concordancia": (avaliadas - len(divergencias)) / avaliadas if avaliadas else 1.0,
+        "tempo_medio_s": {m: t / avaliadas if avaliadas else 0.0 for m, t in tempos.items()},
+        "divergencias": divergencias,
+    }
 
-def remover_reflexos(imagem):
+def mascara_reflexos(imagem):
     gray = cv2.cvtColor(imagem, cv2.COLOR_BGR2GRAY)
-    mask = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY)[1]
-    inpainted = cv2.inpaint(imagem, mask, 5, cv2.INPAINT_TELEA)
+    return cv2.threshold(gray, LIMIAR_REFLEXO, 255, cv2.THRESH_BINARY)[1]
+
+def remover_reflexos(imagem, mask=None):
+    if mask is None:
+        mask = mascara_reflexos(imagem)
+    inpainted = cv2.inpaint(imagem, mask, RAIO_INPAINT, cv2.INPAINT_TELEA)
     return inpainted
 
-def preprocessar_imagem(path):
-    imagem = cv2.imread(path)
+def preprocessar_array(imagem, segmentacao="referencia", geometria=None):
+    """
+    Executa o pipeline sobre uma imagem BGR já decodificada.
+    Se `geometria` ({"circulo", "mascara"}) vier do cache, a detecção de Hough
+    e o cálculo da máscara de reflexos são pulados.
+    Retorna (imagem uint8 redimensionada, geometria usada).
+    """
+    if geometria is not None:
+        circulo = geometria["circulo"]
+        instrumentation.incrementar("preprocess.geometria_cache_hit")
+    else:
+        with instrumentation.etapa("preprocess.hough"):
+            circulo = localizar_iris(imagem, segmentacao)
+    with instrumentation.etapa("preprocess.segmentacao"):
+        imagem = aplicar_segmentacao(imagem, circulo, recortar=segmentacao == "rapido")
+
+    mask = geometria.get("mascara") if geometria is not None else None
+    if mask is None or mask.shape != imagem.shape[:2]:
+        with instrumentation.etapa("preprocess.mascara_reflexos"):
+            mask = mascara_reflexos(imagem)
+    with instrumentation.etapa("preprocess.inpaint"):
+        imagem = remover_reflexos(imagem, mask)
+    imagem = redimensionar(imagem)
+    return imagem, {"circulo": circulo, "mascara": mask}
+
+def redimensionar(imagem):
+    """Última etapa do pipeline, compartilhada com o serving_export: resize para IMG_SIZE, ainda em uint8."""
+    with instrumentation.etapa("preprocess.resize"):
+        return cv2.resize(imagem, IMG_SIZE)
+
+def preprocessar_imagem_uint8(path, segmentacao="referencia"):
+    with instrumentation.etapa("preprocess.decode"):
+        imagem = cv2.imread(path)
     if imagem is None:
         raise ValueError(f"Não foi possível carregar {path}")
+    return preprocessar_array(imagem, segmentacao)[0]
 
-    imagem = segmentar_iris(imagem)
-    imagem = remover_reflexos(imagem)
-    imagem = cv2.resize(imagem, IMG_SIZE)
-    imagem = imagem / 255.0  # normalização
-    return imagem
+def preprocessar_imagem(path, segmentacao="referencia"):
+    return preprocessar_imagem_uint8(path, segmentacao) / 255.0  # normalização
 
-def carregar_dataset():
-    imagens, labels = [], []
+def parametros_deteccao(segmentacao="referencia"):
+    """Parâmetros que determinam a geometria (círculo e máscara de reflexos); chave do cache de geometria."""
+    parametros = {
+        "hough": HOUGH_PARAMS,
+        "segmentacao": segmentacao,
+        "limiar_reflexo": LIMIAR_REFLEXO,
+    }
+    if segmentacao == "rapido":
+        parametros.update(lado_max_piramide=LADO_MAX_PIRAMIDE, margem_refino=MARGEM_REFINO)
+    return parametros
 
-    for classe in os.listdir(RAW_DIR):
-        classe_path = os.path.join(RAW_DIR, classe)
+def parametros_preprocessamento(segmentacao="referencia"):
+    """
+    Parâmetros que influenciam a saída; mudar qualquer um invalida o que já
+    foi processado. Os limiares de qualidade ficam de fora: o manifesto guarda
+    as medidas de cada imagem e o filtro é reaplicado sobre elas.
+    """
+    return {
+        **parametros_deteccao(segmentacao),
+        "img_size": list(IMG_SIZE),
+        "raio_inpaint": RAIO_INPAINT,
+    }
+
+def abrir_cache_geometria(path=CACHE_GEOMETRIA_PATH):
+    return CacheGeometria(path)
+
+def listar_imagens(raw_dir=RAW_DIR):
+    """
+    Lista (path, classe) de todas as imagens em raw_dir/<classe>/.
+    A ordem é determinística (classes e arquivos ordenados por nome).
+    """
+    itens = []
+    for classe in sorted(os.listdir(raw_dir)):
+        classe_path = os.path.join(raw_dir, classe)
         if not os.path.isdir(classe_path):
             continue
-        for arquivo in os.listdir(classe_path):
-            if arquivo.lower().endswith(('.jpg', '.png', '.jpeg')):
-                path = os.path.join(classe_path, arquivo)
-                try:
-                    img = preprocessar_imagem(path)
-                    imagens.append(img)
-                    labels.append(classe)
-                except Exception as e:
-                    print(f"[ERRO] Falha ao processar {arquivo}: {e}")
-
-    imagens = np.array(imagens, dtype=np.float32)
-    labels = np.array(labels)
-
-    X_train, X_temp, y_train, y_temp = train_test_split(imagens, labels, test_size=0.3, stratify=labels, random_state=42)
-    X_val, X_test, y_val, y_test = train_test_split(X_temp, y_temp, test_size=0.5, stratify=y_temp, random_state=42)
+        for arquivo in sorted(os.listdir(classe_path)):
+            if arquivo.lower().endswith(EXTENSOES):
+                itens.append((os.path.join(classe_path, arquivo), classe))
+    return itens
+
+def _processar_arquivo(item, segmentacao="referencia", qualidade=None):
+    """
+    `item` é (path, hash do conteúdo, geometria conhecida compactada). O hash
+    só vem com o cache ligado; a geometria, quando a imagem já está nele.
+    Retorna (imagem, erro, geometria, qualidade). `geometria` é ("hit", hash)
+    quando veio do cache, ("nova", hash, circulo, mascara compactada) quando
+    foi calculada agora, ou None quando não há cache. Com `qualidade`
+    (limiares do quality_gate), a imagem é medida em miniatura antes da
+    segmentação e o quarto item é {"motivo", "medidas"}; reprovadas voltam
+    sem imagem.
+    """
+    path, conteudo_hash, conhecida = item
+    try:
+        with instrumentation.etapa("preprocess.decode"):
+            imagem = cv2.imread(path)
+        if imagem is None:
+            raise ValueError(f"Não foi possível carregar {path}")
+        avaliacao = None
+        if qualidade is not None:
+            with instrumentation.etapa("preprocess.qualidade"):
+                motivo, medidas = quality_gate.avaliar(imagem, qualidade)
+            avaliacao = {"motivo": motivo, "medidas": medidas}
+            if motivo is not None:
+                instrumentation.incrementar("preprocess.rejeitadas")
+                return None, None, None, avaliacao
+        if conteudo_hash is None:
+            return preprocessar_array(imagem, segmentacao)[0], None, None, avaliacao
+
+        if conhecida is not None:
+            conhecida = {"circulo": conhecida[0], "mascara": CacheGeometria.descompactar(conhecida[1])}
+        img, geometria = preprocessar_array(imagem, segmentacao, conhecida)
+        if conhecida is not None:
+            return img, None, ("hit", conteudo_hash), avaliacao
+        return (img, None, ("nova", conteudo_hash, geometria["circulo"], CacheGeometria.compactar(geometria["mascara"])),
+                avaliacao)
+    except Exception as e:
+        instrumentation.incrementar("preprocess.falhas")
+        return None, str(e), None, None
+
+def _inicializar_worker(instrumentacao_dir=None):
+    # Cada processo já ocupa um núcleo; evita que o OpenCV abra threads extras.
+    cv2.setNumThreads(1)
+    if instrumentacao_dir is not None:
+        instrumentation.exportar_ao_sair(instrumentacao_dir)
+
+def _itens_com_geometria(paths, cache, segmentacao, hashes=None, workers=None):
+    """
+    (path, hash, geometria compactada) de cada imagem. A consulta ao cache é
+    feita aqui, no processo principal, e cada worker recebe só as geometrias
+    do seu chunk, em vez de carregar o cache inteiro.
+    """
+    if cache is None:
+        return [(path, None, None) for path in paths]
+    if hashes is None:
+        with instrumentation.etapa("preprocess.hash"), ThreadPoolExecutor(max_workers=workers) as executor:
+            hashes = list(executor.map(manifest.hash_arquivo, paths))
+    parametros = parametros_deteccao(segmentacao)
+    return [(path, conteudo_hash, cache.obter_compactada(conteudo_hash, parametros))
+            for path, conteudo_hash in zip(paths, hashes)]
+
+def processar_imagens(paths, modo="serial", workers=None, chunksize=CHUNKSIZE_PADRAO, segmentacao="referencia",
+                      cache=None, qualidade=None, hashes=None):
+    """
+    Pré-processa `paths` e gera (imagem uint8, erro, avaliacao) na mesma ordem
+    da entrada, seja em modo serial ou paralelo (pool de processos com
+    distribuição em chunks). Com `cache` (CacheGeometria), imagens já
+    segmentadas pulam a detecção e as geometrias novas calculadas pelos
+    workers são gravadas no cache; `hashes` evita reler os arquivos quando o
+    hash do conteúdo já é conhecido (manifesto). Com `qualidade`, `avaliacao`
+    é o {"motivo", "medidas"} do filtro e as reprovadas vêm com imagem None.
+    """
+    if modo not in ("serial", "paralelo"):
+        raise ValueError(f"Modo de processamento inválido: {modo}")
+    itens = _itens_com_geometria(paths, cache, segmentacao, hashes, workers)
+    processar = partial(_processar_arquivo, segmentacao=segmentacao, qualidade=qualidade)
+    if modo == "serial":
+        yield from _registrar_geometrias(map(processar, itens), cache, segmentacao)
+        return
 
+    workers = workers or os.cpu_count() or 1
+    # Os tempos medidos nos workers são gravados por eles ao sair e somados aqui.
+    instrumentacao_dir = tempfile.mkdtemp(prefix="instrumentacao_") if instrumentation.ativo() else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_inicializar_worker,
+                                 initargs=(instrumentacao_dir,)) as executor:
+            yield from _registrar_geometrias(executor.map(processar, itens, chunksize=chunksize), cache, segmentacao)
+    finally:
+        if instrumentacao_dir is not None:
+            instrumentation.mesclar_diretorio(instrumentacao_dir)
+
+def _registrar_geometrias(resultados, cache, segmentacao):
+    parametros = parametros_deteccao(segmentacao)
+    for img, erro, geometria, avaliacao in resultados:
+        if cache is not None and geometria is not None and geometria[0] == "nova":
+            _, conteudo_hash, circulo, compactada = geometria
+            cache.gravar(conteudo_hash, parametros, circulo, compactada=compactada)
+        yield img, erro, avaliacao
+
+def salvar_relatorio(relatorio, nome="preprocess_report.json"):
     os.makedirs(PROCESSED_DIR, exist_ok=True)
-    np.savez_compressed(os.path.join(PROCESSED_DIR, "dataset_prepared.npz"),
-                        X_train=X_train, y_train=y_train,
-                        X_val=X_val, y_val=y_val,
-                        X_test=X_test, y_test=y_test)
+    destino = os.path.join(PROCESSED_DIR, nome)
+    with open(destino, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    return destino
+
+def dividir_splits(labels, seed=42, grupos=None):
+    """
+    Atribui train/val/test (70/15/15, estratificado) a cada posição de `labels`.
+    Com `grupos` (um id por posição), o sorteio é feito por grupo e todas as
+    posições de um grupo caem no mesmo split.
+    """
+    from sklearn.model_selection import train_test_split
+
+    if grupos is not None:
+        _, primeiros, grupo_de = np.unique(np.asarray(grupos), return_index=True, return_inverse=True)
+        splits = dividir_splits(np.asarray(labels)[primeiros], seed)[0][grupo_de]
+        return splits, tuple(np.flatnonzero(splits == split) for split in dataset_store.SPLITS)
+
+    indices = np.arange(len(labels))
+    idx_train, idx_temp = train_test_split(indices, test_size=0.3, stratify=labels, random_state=seed)
+    idx_val, idx_test = train_test_split(idx_temp, test_size=0.5, stratify=labels[idx_temp], random_state=seed)
+
+    splits = np.empty(len(labels), dtype=object)
+    splits[idx_train], splits[idx_val], splits[idx_test] = "train", "val", "test"
+    return splits, (idx_train, idx_val, idx_test)
+
+def filtrar_duplicatas(itens, politica="manter", limiar=dedup_index.LIMIAR_PADRAO, workers=None,
+                       indice_path=INDICE_DUPLICATAS_PATH, relatorio_path=None):
+    """
+    Aplica a política de quase-duplicatas (pHash) a `itens`: "pular" deixa
+    só o representante de cada grupo, então as cópias nem passam pela
+    segmentação; "agrupar" mantém todas e devolve {path: representante} para
+    que o grupo inteiro caia no mesmo split. Os grupos completos vão para
+    `relatorio_path` (padrão: duplicatas_report.json em PROCESSED_DIR).
+    Retorna (itens, representante, resumo).
+    """
+    if politica == "manter":
+        return itens, None, None
+    with instrumentation.etapa("preprocess.duplicatas"):
+        representante, grupos, contagens = dedup_index.detectar(itens, indice_path, limiar, workers)
+    resumo = {**dedup_index.resumir(itens, grupos, limiar, politica), "indice": contagens}
+    if politica == "pular":
+        itens = [(path, classe) for path, classe in itens if representante.get(path, path) == path]
+        resumo["puladas"] = resumo["redundantes"]
+        representante = None
+    if relatorio_path is None:
+        salvar_relatorio({**resumo, "membros": grupos}, "duplicatas_report.json")
+    else:
+        with open(relatorio_path, "w", encoding="utf-8") as f:
+            json.dump({**resumo, "membros": grupos}, f, indent=2, ensure_ascii=False)
+    return itens, representante, resumo
+
+def _resumo_duplicatas(resumo, duracao_s, processadas):
+    """Resumo para o preprocess_report, com o tempo estimado que as duplicatas puladas teriam custado."""
+    resumo = dict(resumo)
+    if resumo.get("puladas") and processadas:
+        resumo["segundos_evitados_estimados"] = round(resumo["puladas"] * duracao_s / processadas, 3)
+    return resumo
+
+def listar_itens(manifesto_split=None, indice=None):
+    """
+    (itens, splits_por_path): a listagem de RAW_DIR, as imagens legíveis do
+    índice de metadados, ou as de um manifesto do scripts/split_dataset.py
+    com o split já definido por ele.
+    """
+    if manifesto_split is None:
+        if indice is None:
+            return listar_imagens(), None
+        with IndiceMetadados(indice) as aberto:
+            return aberto.itens(), None
+    entradas = split_manifest.itens(manifesto_split)
+    return [(path, classe) for path, classe, _ in entradas], {path: split for path, _, split in entradas}
+
+def carregar_dataset(modo="serial", workers=None, chunksize=CHUNKSIZE_PADRAO, formato="shards",
+                     segmentacao="referencia", cache_geometria=True, manifesto_split=None, indice=None,
+                     duplicatas="manter", limiar_hamming=dedup_index.LIMIAR_PADRAO, qualidade=None):
+    itens, splits_manifesto = listar_itens(manifesto_split, indice)
+    itens, representante, resumo_duplicatas = filtrar_duplicatas(itens, duplicatas, limiar_hamming, workers)
+    cache = abrir_cache_geometria() if cache_geometria else None
+    falhas = []
+    rejeitadas = []
+    inicio = time.time()
+
+    if formato == "shards":
+        escritor = dataset_store.EscritorShards(SHARDS_DIR, IMG_SIZE[::-1] + (3,))
+        adicionar = escritor.adicionar
+    else:
+        imagens, labels_npz = [], []
+        def adicionar(img, classe):
+            imagens.append(img)
+            labels_npz.append(classe)
+
+    paths = [path for path, _ in itens]
+    processados = []
+    with instrumentation.etapa("preprocess.processar_imagens"):
+        resultados = processar_imagens(paths, modo, workers, chunksize, segmentacao, cache, qualidade)
+        for (path, classe), (img, erro, avaliacao) in zip(itens, resultados):
+            if erro is not None:
+                falhas.append({"arquivo": path, "classe": classe, "erro": erro})
+                continue
+            if img is None:
+                rejeitadas.append({"arquivo": path, "classe": classe, **avaliacao})
+                continue
+            adicionar(img, classe)
+            processados.append(path)
+        # Encerra o gerador (e o pool) já aqui: o zip para antes de esgotá-lo.
+        resultados.close()
+    if cache is not None:
+        cache.salvar()
+
+    labels = np.array(escritor.labels if formato == "shards" else labels_npz)
+    relatorio = {
+        "modo": modo,
+        "workers": (workers or os.cpu_count() or 1) if modo == "paralelo" else 1,
+        "chunksize": chunksize,
+        "formato": formato,
+        "segmentacao": segmentacao,
+        "total": len(itens),
+        "processadas": len(labels),
+        "falhas": falhas,
+        "duracao_s": round(time.time() - inicio, 3),
+    }
+    if resumo_duplicatas is not None:
+        relatorio["duplicatas"] = _resumo_duplicatas(resumo_duplicatas, relatorio["duracao_s"], len(itens))
+    if qualidade is not None:
+        relatorio["qualidade"] = quality_gate.resumir(rejeitadas, len(itens), qualidade)
+    destino_relatorio = salvar_relatorio(relatorio)
+    if falhas:
+        print(f"[AVISO] {len(falhas)} de {len(itens)} imagens falharam. Detalhes em {destino_relatorio}")
+    if rejeitadas:
+        print(f"{len(rejeitadas)} de {len(itens)} imagens reprovadas no filtro de qualidade. Detalhes em {destino_relatorio}")
+
+    if splits_manifesto is None:
+        grupos = [representante.get(path, path) for path in processados] if representante else None
+        splits, (idx_train, idx_val, idx_test) = dividir_splits(labels, grupos=grupos)
+    else:
+        falharam = {f["arquivo"] for f in falhas + rejeitadas}
+        splits = np.array([splits_manifesto[path] for path, _ in itens if path not in falharam], dtype=object)
+        idx_train, idx_val, idx_test = [np.flatnonzero(splits == split) for split in dataset_store.SPLITS]
+
+    if formato == "shards":
+        with instrumentation.etapa("preprocess.escrita"):
+            escritor.finalizar(splits)
+        instrumentation.salvar("preprocess")
+        print(f"✅ Dataset pré-processado e salvo em {SHARDS_DIR}")
+        return dataset_store.DatasetShards(SHARDS_DIR)
+
+    # Formato legado: um único .npz comprimido com os splits já normalizados.
+    with instrumentation.etapa("preprocess.escrita"):
+        imagens = dataset_store.normalizar(np.stack(imagens))
+        os.makedirs(PROCESSED_DIR, exist_ok=True)
+        np.savez_compressed(NPZ_PATH,
+                            X_train=imagens[idx_train], y_train=labels[idx_train],
+                            X_val=imagens[idx_val], y_val=labels[idx_val],
+                            X_test=imagens[idx_test], y_test=labels[idx_test])
+    instrumentation.salvar("preprocess")
+
+    print(f"✅ Dataset pré-processado e salvo em {NPZ_PATH}")
+    return ((imagens[idx_train], labels[idx_train]),
+            (imagens[idx_val], labels[idx_val]),
+            (imagens[idx_test], labels[idx_test]))
+
+def carregar_dataset_incremental(modo="serial", workers=None, chunksize=CHUNKSIZE_PADRAO,
+                                 segmentacao="referencia", cache_geometria=True, manifesto_split=None,
+                                 indice=None, duplicatas="manter", limiar_hamming=dedup_index.LIMIAR_PADRAO,
+                                 qualidade=None):
+    """
+    Processa apenas imagens novas ou alteradas (ou com parâmetros diferentes),
+    guardando cada saída uint8 em cache_imagens/ e registrando-a no manifesto.
+    Os shards são então remontados a partir do cache, sem refazer a segmentação.
+    Na primeira execução os splits saem do mesmo sorteio estratificado do
+    carregar_dataset; depois, só as imagens novas são colocadas, por classe
+    (Manifesto.atribuir_splits). Com `manifesto_split`, o split de cada
+    imagem vem dele; com duplicatas="agrupar", cada quase-duplicata herda o
+    do representante.
+    As medidas do filtro de qualidade de cada imagem ficam no manifesto, com
+    o filtro ligado ou não: mudar os limiares de `qualidade` só os reaplica
+    às medidas guardadas, sem decodificar nada. Imagens reprovadas continuam
+    registradas (sem saída) e só são segmentadas se passarem a ser aceitas.
+    """
+    inicio = time.time()
+    itens, splits_manifesto = listar_itens(manifesto_split, indice)
+    itens, representante, resumo_duplicatas = filtrar_duplicatas(itens, duplicatas, limiar_hamming, workers)
+    registro = manifest.Manifesto(MANIFEST_PATH)
+    params_hash = manifest.hash_parametros(parametros_preprocessamento(segmentacao))
+
+    def motivo_rejeicao(entrada):
+        if qualidade is None or entrada.get("medidas") is None:
+            return None
+        return quality_gate.classificar(entrada["medidas"], qualidade)
+
+    def reprocessar(entrada):
+        # Sem medidas (manifesto de antes do filtro) ou reprovada antes e aceita agora.
+        if entrada.get("medidas") is None:
+            return qualidade is not None or entrada["saida"] is None
+        return entrada["saida"] is None and motivo_rejeicao(entrada) is None
+
+    with instrumentation.etapa("preprocess.planejar"):
+        pendentes, removidos = registro.planejar(itens, params_hash, CACHE_IMAGENS_DIR, workers, reprocessar)
+    registro.remover(removidos, CACHE_IMAGENS_DIR)
+
+    falhas = []
+    paths = [path for path, _ in pendentes]
+    cache = abrir_cache_geometria() if cache_geometria else None
+    with instrumentation.etapa("preprocess.processar_imagens"):
+        # Com o filtro desligado as imagens só são medidas, para ele poder ser ligado depois sem decodificá-las.
+        resultados = processar_imagens(paths, modo, workers, chunksize, segmentacao, cache,
+                                       qualidade or quality_gate.LIMIARES_ABERTOS,
+                                       hashes=[entrada["hash"] for _, entrada in pendentes])
+        for (path, entrada), (img, erro, avaliacao) in zip(pendentes, resultados):
+            if erro is not None:
+                falhas.append({"arquivo": path, "classe": entrada["classe"], "erro": erro})
+                registro.entradas.pop(path, None)
+                continue
+            entrada["medidas"] = avaliacao["medidas"]
+            registro.registrar(path, entrada, img, CACHE_IMAGENS_DIR)
+        resultados.close()
+
+    rejeitadas = []
+    aceitas = []
+    for path, _ in itens:
+        entrada = registro.entradas.get(path)
+        if entrada is None:
+            continue
+        motivo = motivo_rejeicao(entrada)
+        if motivo is not None:
+            rejeitadas.append({"arquivo": path, "classe": entrada["classe"], "motivo": motivo,
+                               "medidas": entrada["medidas"]})
+        elif entrada["saida"] is not None:
+            aceitas.append(path)
+    processadas = sum(1 for path, _ in pendentes
+                      if path in registro.entradas and registro.entradas[path]["saida"] is not None)
+    if not splits_manifesto:
+        grupos = [representante.get(path, path) for path in aceitas] if representante else None
+        registro.atribuir_splits(aceitas, lambda labels: dividir_splits(labels, grupos=grupos)[0])
+    registro.salvar()
+    if cache is not None:
+        cache.salvar()
+    orfaos = registro.limpar_orfaos(CACHE_IMAGENS_DIR)
+
+    with instrumentation.etapa("preprocess.escrita"), \
+            dataset_store.EscritorShards(SHARDS_DIR, IMG_SIZE[::-1] + (3,)) as escritor:
+        splits = []
+        for path in aceitas:
+            entrada = registro.entradas[path]
+            escritor.adicionar(np.load(os.path.join(CACHE_IMAGENS_DIR, entrada["saida"])), entrada["classe"])
+            if splits_manifesto:
+                splits.append(splits_manifesto[path])
+            else:
+                # Um representante reprovado no filtro não tem split; a cópia usa o seu.
+                grupo = registro.entradas.get((representante or {}).get(path, path), entrada)
+                splits.append(grupo.get("split") or entrada["split"])
+        escritor.finalizar(np.array(splits))
+
+    relatorio = {
+        "modo": modo,
+        "incremental": True,
+        "segmentacao": segmentacao,
+        "parametros": params_hash,
+        "total": len(itens),
+        "reutilizadas": len(itens) - len(pendentes),
+        "processadas": processadas,
+        "removidas": len(removidos),
+        "saidas_obsoletas_apagadas": orfaos,
+        "falhas": falhas,
+        "duracao_s": round(time.time() - inicio, 3),
+    }
+    if resumo_duplicatas is not None:
+        relatorio["duplicatas"] = _resumo_duplicatas(resumo_duplicatas, relatorio["duracao_s"], len(pendentes))
+    if qualidade is not None:
+        relatorio["qualidade"] = quality_gate.resumir(rejeitadas, len(itens) - len(falhas), qualidade)
+    destino_relatorio = salvar_relatorio(relatorio)
+    instrumentation.salvar("preprocess")
+    if falhas:
+        print(f"[AVISO] {len(falhas)} de {len(pendentes)} imagens falharam. Detalhes em {destino_relatorio}")
+    if rejeitadas:
+        print(f"{len(rejeitadas)} de {len(itens) - len(falhas)} imagens reprovadas no filtro de qualidade. "
+              f"Detalhes em {destino_relatorio}")
+    print(f"✅ {relatorio['processadas']} imagens processadas, {relatorio['reutilizadas']} reutilizadas, "
+          f"{len(removidos)} removidas. Dataset salvo em {SHARDS_DIR}")
+    return dataset_store.DatasetShards(SHARDS_DIR)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pré-processar imagens de íris e gerar o dataset.")
+    parser.add_argument("--modo", choices=["serial", "paralelo"], default="serial",
+                        help="Executar o pré-processamento em um processo ou em um pool de processos")
+    parser.add_argument("--workers", type=int, help="Número de processos no modo paralelo (padrão: núcleos da CPU)")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE_PADRAO,
+                        help="Quantidade de imagens enviadas a cada worker por vez")
+    parser.add_argument("--formato", choices=["shards", "npz"], default="shards",
+                        help="Shards uint8 com memmap (padrão) ou o .npz legado")
+    parser.add_argument("--sem-cache-geometria", dest="cache_geometria", action="store_false",
+                        help="Não ler nem gravar o cache de geometria de segmentação")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Processar só imagens novas/alteradas com base no manifesto (sempre grava shards)")
+    parser.add_argument("--segmentacao", choices=MODOS_SEGMENTACAO, default="referencia",
+                        help="Detecção da íris em resolução cheia (referencia) ou multirresolução com recorte (rapido)")
+    parser.add_argument("--manifesto-split", dest="manifesto_split",
+                        help="Usar as imagens e os splits de um split_manifest.json em vez de data/raw")
+    parser.add_argument("--indice",
+                        help="Listar as imagens pelo índice SQLite do generate_metadata em vez de data/raw")
+    parser.add_argument("--duplicatas", choices=dedup_index.POLITICAS, default="manter",
+                        help="Quase-duplicatas (pHash): processar todas, pular as cópias ou agrupá-las no mesmo split")
+    parser.add_argument("--limiar-hamming", dest="limiar_hamming", type=int, default=dedup_index.LIMIAR_PADRAO,
+                        help="Bits diferentes (de 64) até os quais duas imagens são quase-duplicatas")
+    parser.add_argument("--filtro-qualidade", dest="filtro_qualidade", action="store_true",
+                        help="Reprovar, antes da segmentação, imagens desfocadas, mal expostas ou com muito reflexo")
+    limiares = quality_gate.LIMIARES_PADRAO
+    parser.add_argument("--nitidez-min", dest="nitidez_min", type=float, default=limiares["nitidez_min"],
+                        help="Variância mínima do Laplaciano na miniatura")
+    parser.add_argument("--brilho-min", dest="brilho_min", type=float, default=limiares["brilho_min"],
+                        help="Brilho médio mínimo (0-255)")
+    parser.add_argument("--brilho-max", dest="brilho_max", type=float, default=limiares["brilho_max"],
+                        help="Brilho médio máximo (0-255)")
+    parser.add_argument("--fracao-escura-max", dest="fracao_escura_max", type=float,
+                        default=limiares["fracao_escura_max"], help="Fração máxima de pixels pretos")
+    parser.add_argument("--reflexo-max", dest="reflexo_max", type=float, default=limiares["reflexo_max"],
+                        help="Fração máxima de pixels de reflexo")
+    parser.add_argument("--verificar-segmentacao", dest="verificar_segmentacao", type=int, metavar="N",
+                        help="Comparar os dois modos de segmentação em uma amostra de N imagens e sair")
+    parser.add_argument("--tolerancia", type=float, default=0.1,
+                        help="Tolerância relativa ao raio usada em --verificar-segmentacao")
+    return parser.parse_args()
 
-    print(f"✅ Dataset pré-processado e salvo em {PROCESSED_DIR}/dataset_prepared.npz")
-    return (X_train, y_train), (X_val, y_val), (X_test, y_test)
+def limiares_qualidade(args):
+    """Limiares do filtro de qualidade vindos da linha de comando, ou None com o filtro desligado."""
+    if not args.filtro_qualidade:
+        return None
+    return {chave: getattr(args, chave) for chave in quality_gate.LIMIARES_PADRAO}
 
 if __name__ == "__main__":
-    carregar_dataset()
\ No newline at end of file
+    args = parse_args()
+    if args.verificar_segmentacao:
+        paths = [path for path, _ in listar_itens(args.manifesto_split, args.indice)[0]]
+        amostra = random.Random(42).sample(paths, min(args.verificar_segmentacao, len(paths)))
+        relatorio = comparar_segmentacao(amostra, args.tolerancia)
+        destino = salvar_relatorio(relatorio, "segmentation_check.json")
+        print(f"Concordância entre modos: {relatorio['concordancia']:.1%} "
+              f"({len(relatorio['divergencias'])} divergências). Detalhes em {destino}")
+        raise SystemExit(0 if not relatorio["divergencias"] else 1)
+    if args.incremental:
+        carregar_dataset_incremental(modo=args.modo, workers=args.workers, chunksize=args.chunksize,
+                                     segmentacao=args.segmentacao, cache_geometria=args.cache_geometria,
+                                     manifesto_split=args.manifesto_split, indice=args.indice,
+                                     duplicatas=args.duplicatas, limiar_hamming=args.limiar_hamming,
+                                     qualidade=limiares_qualidade(args))
+    else:
+        carregar_dataset(modo=args.modo, workers=args.workers, chunksize=args.chunksize, formato=args.formato,
+                         segmentacao=args.segmentacao, cache_geometria=args.cache_geometria,
+                         manifesto_split=args.manifesto_split, indice=args.indice,
+                         duplicatas=args.duplicatas, limiar_hamming=args.limiar_hamming,
+                         qualidade=limiares_qualidade(args))
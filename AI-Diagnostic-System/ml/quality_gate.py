@@ -0,0 +1,82 @@
+import cv2
+import numpy as np
+
+LADO_MINIATURA = 256  # maior lado da miniatura em que a qualidade é medida
+LIMIAR_ESCURO = 16     # nível de cinza até o qual um pixel conta como preto
+LIMIAR_REFLEXO = 240   # o mesmo do preprocess: pixels acima disso são reflexo
+
+LIMIARES_PADRAO = {
+    "nitidez_min": 20.0,        # variância do Laplaciano na miniatura
+    "brilho_min": 35.0,         # média de cinza (0-255)
+    "brilho_max": 220.0,
+    "fracao_escura_max": 0.85,  # fração de pixels pretos
+    "reflexo_max": 0.12,        # fração de pixels de reflexo
+}
+MOTIVOS = ("subexposta", "superexposta", "reflexo", "desfocada")
+# Limiares que nunca reprovam: a imagem só é medida (o incremental guarda as medidas no manifesto).
+LIMIARES_ABERTOS = {
+    "nitidez_min": 0.0,
+    "brilho_min": 0.0,
+    "brilho_max": 255.0,
+    "fracao_escura_max": 1.0,
+    "reflexo_max": 1.0,
+}
+
+
+def miniatura(imagem, lado=LADO_MINIATURA):
+    """Versão em cinza com o maior lado limitado a `lado` (INTER_AREA; imagens menores não são ampliadas)."""
+    if imagem.ndim == 3:
+        imagem = cv2.cvtColor(imagem, cv2.COLOR_BGR2GRAY)
+    escala = lado / max(imagem.shape[:2])
+    if escala >= 1:
+        return imagem
+    tamanho = (max(1, round(imagem.shape[1] * escala)), max(1, round(imagem.shape[0] * escala)))
+    return cv2.resize(imagem, tamanho, interpolation=cv2.INTER_AREA)
+
+
+def medir(imagem):
+    """Nitidez (variância do Laplaciano), brilho médio e frações de pixels pretos e de reflexo."""
+    gray = miniatura(imagem)
+    histograma = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    total = histograma.sum()
+    return {
+        "nitidez": round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 2),
+        "brilho": round(float(np.dot(histograma, np.arange(256)) / total), 2),
+        "fracao_escura": round(float(histograma[:LIMIAR_ESCURO + 1].sum() / total), 4),
+        "fracao_reflexo": round(float(histograma[LIMIAR_REFLEXO + 1:].sum() / total), 4),
+    }
+
+
+def classificar(medidas, limiares=None):
+    """
+    Motivo da reprovação (um dos MOTIVOS) para as `medidas` de medir, ou None
+    se a imagem é aceita. A exposição vem antes da nitidez, já que um quadro
+    quase preto ou estourado também tem pouca variância de Laplaciano.
+    """
+    limiares = {**LIMIARES_PADRAO, **(limiares or {})}
+    if medidas["brilho"] < limiares["brilho_min"] or medidas["fracao_escura"] > limiares["fracao_escura_max"]:
+        return "subexposta"
+    if medidas["brilho"] > limiares["brilho_max"]:
+        return "superexposta"
+    if medidas["fracao_reflexo"] > limiares["reflexo_max"]:
+        return "reflexo"
+    if medidas["nitidez"] < limiares["nitidez_min"]:
+        return "desfocada"
+    return None
+
+
+def avaliar(imagem, limiares=None):
+    """(motivo, medidas): `motivo` é None para imagens aceitas ou um dos MOTIVOS."""
+    medidas = medir(imagem)
+    return classificar(medidas, limiares), medidas
+
+
+def resumir(rejeitadas, avaliadas, limiares=None):
+    """Resumo por motivo para o relatório da execução."""
+    return {
+        "limiares": {**LIMIARES_PADRAO, **(limiares or {})},
+        "avaliadas": avaliadas,
+        "rejeitadas": len(rejeitadas),
+        "por_motivo": {motivo: sum(1 for r in rejeitadas if r["motivo"] == motivo) for motivo in MOTIVOS},
+        "imagens": rejeitadas,
+    }
@@ -1,27 +1,106 @@
 import os
+import sys
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import numpy as np
 import cv2
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import split_manifest
+from dataset_store import DatasetShards, EscritorContiguo
+from geometry_cache import CacheGeometria
+from manifest import hash_arquivo
+from metadata_index import listar_arquivos as listar_raw
+from preprocess import CACHE_GEOMETRIA_PATH, aplicar_segmentacao, dividir_splits, localizar_iris, parametros_deteccao
+
 DATASET_DIR = "ml/datasets/raw"
 OUTPUT_DIR = "ml/datasets/numpy"
-
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+RELATORIO_FILE = "convert_report.json"
 
 IMG_SIZE = (224, 224)
 
-def convert():
-    for file in os.listdir(DATASET_DIR):
-        if not file.lower().endswith((".png", ".jpg", ".jpeg")):
-            continue
+def recortar_iris(img, img_path, cache, parametros, lock):
+    """Recorta a íris usando a geometria em cache; detecta (e guarda) só quando falta."""
+    conteudo_hash = hash_arquivo(img_path)
+    with lock:
+        geometria = cache.obter(conteudo_hash, parametros)
+    if geometria is None:
+        circulo = localizar_iris(img, parametros["segmentacao"])
+        with lock:
+            cache.gravar(conteudo_hash, parametros, circulo)
+    else:
+        circulo = geometria["circulo"]
+    return aplicar_segmentacao(img, circulo, recortar=True)
+
+def listar_arquivos(manifesto=None, split=None):
+    """(path, classe, split ou None) das imagens de DATASET_DIR ou de um manifesto de split."""
+    if manifesto:
+        return split_manifest.itens(manifesto, split)
+    return [(path, classe, None) for path, classe in listar_raw(DATASET_DIR)]
+
+def convert(recortar=False, manifesto=None, split=None, workers=None):
+    """
+    Decodifica as imagens em paralelo direto para um único arquivo uint8
+    pré-alocado em OUTPUT_DIR, no formato de shards do dataset_store (um shard
+    só, com arquivos.json de nome/classe/split/offset). Qualquer subconjunto
+    contíguo é lido sem cópia com DatasetShards(OUTPUT_DIR).fatia(inicio, fim).
+    Arquivos ilegíveis vão para o convert_report.json em vez de abortar.
+    """
+    itens = listar_arquivos(manifesto, split)
+    if not itens:
+        raise SystemExit(f"[ERRO] Nenhuma imagem encontrada em {manifesto or DATASET_DIR}")
+    cache = CacheGeometria(CACHE_GEOMETRIA_PATH) if recortar else None
+    parametros = parametros_deteccao()
+    lock = threading.Lock()
+    escritor = EscritorContiguo(OUTPUT_DIR, IMG_SIZE[::-1] + (3,), len(itens))
+
+    def converter(posicao):
+        img_path, classe, _ = itens[posicao]
+        try:
+            img = cv2.imread(img_path)
+            if img is None:
+                raise ValueError("cv2.imread não conseguiu decodificar o arquivo")
+            if recortar:
+                img = recortar_iris(img, img_path, cache, parametros, lock)
+            escritor.gravar(posicao, cv2.resize(img, IMG_SIZE), classe, os.path.basename(img_path))
+            return None
+        except Exception as e:
+            return {"arquivo": img_path, "classe": classe, "erro": str(e)}
 
-        img_path = os.path.join(DATASET_DIR, file)
-        img = cv2.imread(img_path)
-        img = cv2.resize(img, IMG_SIZE)
-        img = img.astype("float32") / 255.0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        falhas = [f for f in executor.map(converter, range(len(itens))) if f is not None]
+    if cache is not None:
+        cache.salvar()
 
-        np.save(os.path.join(OUTPUT_DIR, file.replace(".jpg", ".npy").replace(".png", ".npy")), img)
+    gravadas = escritor.posicoes_gravadas()
+    if not gravadas:
+        raise SystemExit(f"[ERRO] Nenhuma das {len(itens)} imagens pôde ser convertida")
+    if manifesto:
+        splits = [itens[i][2] for i in gravadas]
+    else:
+        splits = dividir_splits(np.array([itens[i][1] for i in gravadas]))[0]
+    index = escritor.finalizar(splits)
 
-    print(f"Conversão concluída → {OUTPUT_DIR}")
+    relatorio = {"total": len(itens), "convertidas": len(gravadas), "falhas": falhas,
+                 "bytes": os.path.getsize(os.path.join(OUTPUT_DIR, index["shards"][0]))}
+    with open(os.path.join(OUTPUT_DIR, RELATORIO_FILE), "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    if falhas:
+        print(f"[AVISO] {len(falhas)} de {len(itens)} imagens ilegíveis. Detalhes em "
+              f"{os.path.join(OUTPUT_DIR, RELATORIO_FILE)}")
+    print(f"Conversão concluída → {OUTPUT_DIR} ({len(gravadas)} imagens, {relatorio['bytes'] / 1e6:.1f} MB)")
+    return DatasetShards(OUTPUT_DIR)
 
 if __name__ == "__main__":
-    convert()
+    parser = argparse.ArgumentParser(description="Converter imagens em um único array uint8 memory-mapped.")
+    parser.add_argument("--recortar-iris", dest="recortar", action="store_true",
+                        help="Recortar a íris usando o cache de geometria do preprocess")
+    parser.add_argument("--manifesto", help="split_manifest.json do split_dataset, em vez de ler DATASET_DIR")
+    parser.add_argument("--split", choices=["train", "val", "test"], help="Converter só um split do manifesto")
+    parser.add_argument("--workers", type=int, help="Threads de decodificação")
+    args = parser.parse_args()
+    convert(recortar=args.recortar, manifesto=args.manifesto, split=args.split, workers=args.workers)
@@ -1,30 +1,74 @@
 import os
+import sys
 import json
-from PIL import Image
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import split_manifest
+from geometry_cache import CacheGeometria
+from metadata_index import IndiceMetadados, listar_arquivos
+from preprocess import CACHE_GEOMETRIA_PATH, parametros_deteccao
 
 DATASET_DIR = "ml/datasets/raw"
+INDEX_FILE = "ml/datasets/metadata.sqlite"
 OUTPUT_FILE = "ml/datasets/metadata.json"
 
-def generate_metadata():
-    metadata = []
+def exportar_json(indice, destino=OUTPUT_FILE):
+    """Grava o metadata.json no formato antigo (uma entrada por imagem legível)."""
+    metadata = [
+        {
+            "file": os.path.basename(linha["path"]),
+            "classe": linha["classe"],
+            "width": linha["largura"],
+            "height": linha["altura"],
+            "mode": linha["modo"],
+            "iris": [linha["iris_x"], linha["iris_y"], linha["iris_r"]] if linha["iris_r"] is not None else None,
+        }
+        for linha in indice.consultar("erro IS NULL")
+    ]
+    with open(destino, "w") as f:
+        json.dump(metadata, f, indent=4)
+    return destino
+
+def generate_metadata(manifesto=None, indice_path=INDEX_FILE, workers=None, json_legado=False):
+    """
+    Atualiza o índice SQLite de metadados com as imagens de DATASET_DIR (ou
+    do manifesto de split). Só arquivos novos ou alterados são relidos.
+    """
+    if manifesto:
+        itens = [(path, classe) for path, classe, _ in split_manifest.itens(manifesto)]
+    else:
+        itens = listar_arquivos(DATASET_DIR)
 
-    for img_name in os.listdir(DATASET_DIR):
-        if img_name.lower().endswith((".png", ".jpg", ".jpeg")):
-            img_path = os.path.join(DATASET_DIR, img_name)
-            with Image.open(img_path) as img:
-                width, height = img.size
+    cache = CacheGeometria(CACHE_GEOMETRIA_PATH)
+    parametros = parametros_deteccao()
 
-            metadata.append({
-                "file": img_name,
-                "width": width,
-                "height": height,
-                "mode": img.mode
-            })
+    def geometria(conteudo_hash):
+        # Geometria da íris já calculada pelo preprocess, quando existir no cache.
+        encontrada = cache.obter(conteudo_hash, parametros)
+        return encontrada["circulo"] if encontrada else None
 
-    with open(OUTPUT_FILE, "w") as f:
-        json.dump(metadata, f, indent=4)
+    with IndiceMetadados(indice_path) as indice:
+        resultado = indice.atualizar(itens, workers)
+        if len(cache):
+            resultado["geometrias_preenchidas"] = indice.preencher_geometria(geometria)
+        if json_legado:
+            exportar_json(indice)
+        for classe, r in indice.resumo().items():
+            print(f" - {classe or '(sem classe)'}: {r['imagens']} imagens, {r['falhas']} ilegíveis")
 
-    print(f"Metadados gerados com sucesso → {OUTPUT_FILE}")
+    print(f"{resultado['lidas']} lidas, {resultado['inalteradas']} inalteradas, "
+          f"{resultado['removidas']} removidas, {resultado['falhas']} ilegíveis")
+    print(f"Metadados gerados com sucesso → {indice_path}")
+    return resultado
 
 if __name__ == "__main__":
-    generate_metadata()
+    parser = argparse.ArgumentParser(description="Gerar os metadados das imagens brutas.")
+    parser.add_argument("--manifesto", help="split_manifest.json do split_dataset, em vez de ler DATASET_DIR")
+    parser.add_argument("--indice", default=INDEX_FILE, help="Arquivo SQLite do índice de metadados")
+    parser.add_argument("--workers", type=int, help="Threads usadas para ler os cabeçalhos")
+    parser.add_argument("--json", dest="json_legado", action="store_true",
+                        help=f"Também exportar {OUTPUT_FILE} no formato antigo")
+    args = parser.parse_args()
+    generate_metadata(args.manifesto, args.indice, args.workers, args.json_legado)
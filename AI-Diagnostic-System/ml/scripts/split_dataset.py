@@ -1,42 +1,80 @@
 import os
-import shutil
-import random
+import sys
+import argparse
+from pathlib import Path
 
-DATASET_DIR = "ml/datasets/raw"
-OUTPUT_DIR = "ml/datasets/splitted"
-
-SPLIT_RATIOS = {
-    "train": 0.7,
-    "val": 0.15,
-    "test": 0.15
-}
+import numpy as np
 
-def create_dirs():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    for split in SPLIT_RATIOS.keys():
-        os.makedirs(os.path.join(OUTPUT_DIR, split), exist_ok=True)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import dedup_index
+import split_manifest
+from metadata_index import IndiceMetadados, listar_arquivos
+from preprocess import dividir_splits, filtrar_duplicatas
 
-def split_dataset():
-    create_dirs()
-
-    images = [f for f in os.listdir(DATASET_DIR) if f.lower().endswith((".png", ".jpg", ".jpeg"))]
-    random.shuffle(images)
+DATASET_DIR = "ml/datasets/raw"
+OUTPUT_DIR = "ml/datasets/splitted"
+DUPLICATAS_FILE = "ml/datasets/duplicatas.sqlite"
+RELATORIO_DUPLICATAS = "duplicatas_report.json"
+SEED = 42
 
-    total = len(images)
-    train_end = int(SPLIT_RATIOS["train"] * total)
-    val_end = train_end + int(SPLIT_RATIOS["val"] * total)
+def listar(origem, indice=None):
+    """
+    Imagens de origem/<classe>/ (soltas na raiz ficam com classe vazia) ou,
+    com `indice`, as imagens legíveis do índice de metadados.
+    """
+    if indice:
+        with IndiceMetadados(indice) as aberto:
+            return aberto.itens()
+    return listar_arquivos(origem)
 
-    splits = {
-        "train": images[:train_end],
-        "val": images[train_end:val_end],
-        "test": images[val_end:]
-    }
+def split_dataset(origem=DATASET_DIR, destino=OUTPUT_DIR, modo="manifesto", seed=SEED, workers=None, indice=None,
+                  duplicatas="manter", limiar_hamming=dedup_index.LIMIAR_PADRAO):
+    """
+    Divide as imagens em train/val/test (70/15/15) estratificado por classe,
+    reprodutível pelo seed. Sempre grava destino/split_manifest.json; nos
+    modos hardlink/symlink/copia também monta destino/<split>/<classe>/.
+    Quase-duplicatas podem ficar de fora ("pular") ou cair sempre no mesmo
+    split ("agrupar"), sem vazar entre treino e teste.
+    """
+    itens = listar(origem, indice)
+    if not itens:
+        raise SystemExit(f"[ERRO] Nenhuma imagem encontrada em {origem}")
+    os.makedirs(destino, exist_ok=True)
+    itens, representante, resumo = filtrar_duplicatas(itens, duplicatas, limiar_hamming, workers, DUPLICATAS_FILE,
+                                                      os.path.join(destino, RELATORIO_DUPLICATAS))
+    if resumo is not None:
+        print(f"{resumo['grupos']} grupos de quase-duplicatas ({resumo['redundantes']} cópias, "
+              f"{'puladas' if duplicatas == 'pular' else 'agrupadas'})")
+    labels = np.array([classe for _, classe in itens])
+    grupos = [representante.get(path, path) for path, _ in itens] if representante else None
+    splits, _ = dividir_splits(labels, seed=seed, grupos=grupos)
 
-    for split, files in splits.items():
-        for img in files:
-            shutil.copy(os.path.join(DATASET_DIR, img), os.path.join(OUTPUT_DIR, split, img))
+    caminho = os.path.join(destino, split_manifest.NOME_PADRAO)
+    dados = split_manifest.gravar(caminho, itens, splits, origem, seed)
+    for grupo, n in dados["contagens"].items():
+        print(f" - {grupo or '(sem classe)'}: {n}")
+    print(f"Manifesto de split gravado → {caminho}")
 
-    print(f"Dataset dividido com sucesso → {OUTPUT_DIR}")
+    if modo != "manifesto":
+        resultado = split_manifest.materializar(caminho, destino, modo, workers)
+        if resultado["copias_por_fallback"]:
+            print(f"[AVISO] {resultado['copias_por_fallback']} arquivos copiados: hardlink indisponível no destino")
+        print(f"Dataset dividido com sucesso ({modo}) → {destino}")
+    return caminho
 
 if __name__ == "__main__":
-    split_dataset()
+    parser = argparse.ArgumentParser(description="Dividir as imagens brutas em train/val/test.")
+    parser.add_argument("--origem", default=DATASET_DIR, help="Pasta das imagens, com uma subpasta por classe")
+    parser.add_argument("--destino", default=OUTPUT_DIR, help="Pasta do manifesto e da árvore de splits")
+    parser.add_argument("--modo", choices=split_manifest.MODOS, default="manifesto",
+                        help="Só o manifesto (padrão), ou também a árvore por hardlink, symlink ou cópia")
+    parser.add_argument("--seed", type=int, default=SEED, help="Seed da divisão estratificada")
+    parser.add_argument("--workers", type=int, help="Threads usadas para criar os links/cópias")
+    parser.add_argument("--indice", help="Índice SQLite do generate_metadata de onde listar as imagens legíveis")
+    parser.add_argument("--duplicatas", choices=dedup_index.POLITICAS, default="manter",
+                        help="Quase-duplicatas (pHash): manter todas, pular as cópias ou agrupá-las no mesmo split")
+    parser.add_argument("--limiar-hamming", dest="limiar_hamming", type=int, default=dedup_index.LIMIAR_PADRAO,
+                        help="Bits diferentes (de 64) até os quais duas imagens são quase-duplicatas")
+    args = parser.parse_args()
+    split_dataset(args.origem, args.destino, args.modo, args.seed, args.workers, args.indice,
+                  args.duplicatas, args.limiar_hamming)
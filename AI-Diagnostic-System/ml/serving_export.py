@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+SavedModel com o pré-processamento de serving dentro do grafo.
+
+Além do endpoint `serve` de sempre (float32 já normalizado), o modelo
+exportado ganha:
+
+    serve_bytes(imagens)         tf.string [N], JPEG/PNG codificados
+    serve_uint8(imagens)         uint8 [N, H, W, 3] em BGR, como o cv2 lê
+    preprocessar_bytes(imagens)  só o pré-processamento, para clientes e paridade
+
+Decode, conversão para BGR (a ordem de canais do treino), resize bilinear
+para 224x224, arredondamento para uint8 e /255 rodam no grafo, sobre o lote
+inteiro. A segmentação da íris (Hough + inpaint) não tem equivalente no
+grafo e continua no Python: estas assinaturas reproduzem a etapa de
+preprocess.preprocessar_array a partir do resize.
+
+Executado direto, verifica a paridade de um SavedModel com o caminho Python:
+
+    python ml/serving_export.py --saved-model models/.../saved_model --imagens data/raw
+"""
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import dataset_store
+import preprocess
+
+ROOT = Path(__file__).resolve().parents[1]
+RAW_DIR = ROOT / "data" / "raw"
+IMG_SIZE = preprocess.IMG_SIZE  # (largura, altura)
+EXTENSOES = (".jpg", ".jpeg", ".png")
+AMOSTRAS_PARIDADE = 32
+TOLERANCIA_PIXEL = 2 / 255       # diferença máxima por pixel (decoders e resize diferem no arredondamento)
+TOLERANCIA_PROBABILIDADE = 0.02  # diferença máxima nas probabilidades
+
+
+def _bgr_para_lote(imagens):
+    """uint8/float [N, H, W, 3] em BGR -> float32 [N, 224, 224, 3] em [0, 1], como o treino."""
+    import tensorflow as tf
+
+    redimensionadas = tf.image.resize(tf.cast(imagens, tf.float32), IMG_SIZE[::-1], method="bilinear")
+    # O dataset é gravado em uint8 depois do cv2.resize; o arredondamento reproduz isso.
+    return tf.clip_by_value(tf.round(redimensionadas), 0.0, 255.0) / 255.0
+
+
+def _decodificar_bgr(dados):
+    import tensorflow as tf
+
+    # O DCT padrão do decode_jpeg é o rápido; o "accurate" dá os mesmos pixels que o cv2.imdecode.
+    rgb = tf.cond(tf.io.is_jpeg(dados),
+                  lambda: tf.io.decode_jpeg(dados, channels=3, dct_method="INTEGER_ACCURATE"),
+                  lambda: tf.io.decode_image(dados, channels=3, expand_animations=False))
+    bgr = tf.reverse(rgb, axis=[-1])
+    # Cada imagem tem o seu tamanho: o resize entra aqui para o lote sair retangular.
+    return tf.image.resize(tf.cast(bgr, tf.float32), IMG_SIZE[::-1], method="bilinear")
+
+
+def preprocessar_bytes_tf(imagens):
+    """tf.string [N] -> float32 [N, 224, 224, 3] normalizado, todo em ops do TF."""
+    import tensorflow as tf
+
+    lote = tf.map_fn(_decodificar_bgr, imagens, fn_output_signature=tf.TensorSpec((*IMG_SIZE[::-1], 3), tf.float32))
+    return tf.clip_by_value(tf.round(lote), 0.0, 255.0) / 255.0
+
+
+def exportar(model, destino):
+    """
+    Exporta `model` (o de inferência, sem aumento de dados) em `destino` com
+    os endpoints `serve`, `serve_bytes`, `serve_uint8` e `preprocessar_bytes`.
+    `serve` continua sendo o `serving_default`, usado pelo TFLite e pelo
+    RegistroModelos.
+    """
+    import tensorflow as tf
+    from tensorflow import keras
+
+    arquivo = keras.export.ExportArchive()
+    arquivo.track(model)
+    arquivo.add_endpoint("serve", model.__call__,
+                         [tf.TensorSpec((None, *model.input_shape[1:]), tf.float32)])
+    arquivo.add_endpoint("serve_bytes", lambda imagens: model(preprocessar_bytes_tf(imagens)),
+                         [tf.TensorSpec((None,), tf.string)])
+    arquivo.add_endpoint("serve_uint8", lambda imagens: model(_bgr_para_lote(imagens)),
+                         [tf.TensorSpec((None, None, None, 3), tf.uint8)])
+    arquivo.add_endpoint("preprocessar_bytes", preprocessar_bytes_tf, [tf.TensorSpec((None,), tf.string)])
+    arquivo.write_out(str(destino))
+    return Path(destino)
+
+
+def preprocessar_python(dados):
+    """
+    O caminho de referência: cv2.imdecode (BGR) seguido das mesmas etapas do
+    preprocess a partir do resize (preprocess.redimensionar e
+    dataset_store.normalizar).
+    """
+    imagem = cv2.imdecode(np.frombuffer(dados, np.uint8), cv2.IMREAD_COLOR)
+    if imagem is None:
+        raise ValueError("Arquivo não é uma imagem válida")
+    return dataset_store.normalizar(preprocess.redimensionar(imagem))
+
+
+def listar_amostra(origem=None, amostras=AMOSTRAS_PARIDADE, seed=42):
+    paths = sorted(p for p in Path(origem or RAW_DIR).rglob("*") if p.suffix.lower() in EXTENSOES)
+    rng = np.random.default_rng(seed)
+    return [paths[i] for i in sorted(rng.permutation(len(paths))[:amostras])]
+
+
+def verificar_paridade(saved_model_dir, paths, tolerancia_pixel=TOLERANCIA_PIXEL,
+                       tolerancia_probabilidade=TOLERANCIA_PROBABILIDADE):
+    """
+    Compara, nas imagens de `paths`, o pré-processamento e as probabilidades
+    do grafo (`preprocessar_bytes`/`serve_bytes`, num único lote) com o
+    caminho Python (`preprocessar_python` + `serve`). Arquivos que o cv2 não
+    decodifica ficam de fora (e derrubariam o lote inteiro no grafo).
+    """
+    import tensorflow as tf
+
+    carregado = tf.saved_model.load(str(saved_model_dir))
+    validos, dados, referencia, ignoradas = [], [], [], []
+    for p in paths:
+        conteudo = Path(p).read_bytes()
+        try:
+            referencia.append(preprocessar_python(conteudo))
+        except ValueError:
+            ignoradas.append(str(p))
+            continue
+        validos.append(p)
+        dados.append(conteudo)
+    if not validos:
+        raise ValueError("Nenhuma imagem decodificável para verificar a paridade")
+    paths, referencia = validos, np.stack(referencia)
+    lote = tf.constant(dados)
+    no_grafo = carregado.preprocessar_bytes(lote).numpy()
+    probs_grafo = carregado.serve_bytes(lote).numpy()
+    probs_python = carregado.serve(tf.constant(referencia)).numpy()
+
+    dif_pixel = np.abs(no_grafo - referencia).reshape(len(paths), -1).max(axis=1)
+    dif_prob = np.abs(probs_grafo - probs_python).max(axis=1)
+    divergencias = [
+        {"arquivo": str(p), "dif_pixel_max": float(dp), "dif_probabilidade_max": float(dq)}
+        for p, dp, dq in zip(paths, dif_pixel, dif_prob)
+        if dp > tolerancia_pixel or dq > tolerancia_probabilidade
+    ]
+    return {
+        "avaliadas": len(paths),
+        "ignoradas": ignoradas,
+        "tolerancia_pixel": tolerancia_pixel,
+        "tolerancia_probabilidade": tolerancia_probabilidade,
+        "dif_pixel_max": float(dif_pixel.max()),
+        "dif_pixel_media": float(np.abs(no_grafo - referencia).mean()),
+        "dif_probabilidade_max": float(dif_prob.max()),
+        "concordancia_classe": float(np.mean(probs_grafo.argmax(1) == probs_python.argmax(1))),
+        "divergencias": divergencias,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Verificar a paridade das assinaturas de serving com o pré-processamento em Python.")
+    parser.add_argument("--saved-model", dest="saved_model", required=True, help="Diretório do SavedModel")
+    parser.add_argument("--imagens", default=str(RAW_DIR), help="Diretório com as imagens de teste")
+    parser.add_argument("--amostras", type=int, default=AMOSTRAS_PARIDADE)
+    parser.add_argument("--tolerancia-pixel", dest="tolerancia_pixel", type=float, default=TOLERANCIA_PIXEL)
+    parser.add_argument("--tolerancia-probabilidade", dest="tolerancia_probabilidade", type=float,
+                        default=TOLERANCIA_PROBABILIDADE)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    paths = listar_amostra(args.imagens, args.amostras)
+    if not paths:
+        print(f"[ERRO] Nenhuma imagem encontrada em {args.imagens}")
+        sys.exit(1)
+    relatorio = verificar_paridade(args.saved_model, paths, args.tolerancia_pixel, args.tolerancia_probabilidade)
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    sys.exit(0 if not relatorio["divergencias"] else 1)
@@ -0,0 +1,104 @@
+import os
+import json
+import errno
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+VERSAO_MANIFESTO_SPLIT = 1
+NOME_PADRAO = "split_manifest.json"
+MODOS = ("manifesto", "hardlink", "symlink", "copia")
+
+
+def _base(path):
+    return os.path.dirname(os.path.abspath(path))
+
+
+def gravar(path, itens, splits, origem, seed):
+    """
+    Grava o manifesto de split: para cada (path, classe) de `itens`, o split
+    correspondente em `splits`. Os caminhos ficam relativos à pasta do
+    manifesto, então a árvore inteira pode ser movida sem invalidá-lo.
+    """
+    base = _base(path)
+    entradas = [
+        {"arquivo": os.path.relpath(arquivo, base), "classe": classe, "split": str(split)}
+        for (arquivo, classe), split in zip(itens, splits)
+    ]
+    contagens = Counter((e["split"], e["classe"]) for e in entradas)
+    dados = {
+        "versao": VERSAO_MANIFESTO_SPLIT,
+        "seed": seed,
+        "origem": os.path.relpath(origem, base),
+        "contagens": {f"{split}/{classe}": n for (split, classe), n in sorted(contagens.items())},
+        "entradas": entradas,
+    }
+    os.makedirs(base, exist_ok=True)
+    temporario = path + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False)
+    os.replace(temporario, path)
+    return dados
+
+
+def carregar(path):
+    with open(path, encoding="utf-8") as f:
+        dados = json.load(f)
+    if dados.get("versao") != VERSAO_MANIFESTO_SPLIT:
+        raise ValueError(f"Versão de manifesto de split não suportada em {path}: {dados.get('versao')}")
+    return dados
+
+
+def itens(path, split=None):
+    """
+    Lista (path, classe, split) das imagens do manifesto, com os caminhos
+    resolvidos a partir da pasta dele. Com `split`, só as entradas daquele split.
+    """
+    base = _base(path)
+    return [
+        (os.path.normpath(os.path.join(base, e["arquivo"])), e["classe"], e["split"])
+        for e in carregar(path)["entradas"]
+        if split is None or e["split"] == split
+    ]
+
+
+def _vincular(origem, destino, modo):
+    """Cria `destino` a partir de `origem`. Retorna True se precisou cair para cópia."""
+    if os.path.lexists(destino):
+        os.remove(destino)
+    if modo == "symlink":
+        os.symlink(os.path.abspath(origem), destino)
+        return False
+    if modo == "hardlink":
+        try:
+            os.link(origem, destino)
+            return False
+        except OSError as e:
+            # Outro sistema de arquivos ou FS sem suporte a hardlink.
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+    shutil.copy2(origem, destino)
+    return modo != "copia"
+
+
+def materializar(path, destino, modo="hardlink", workers=None):
+    """
+    Monta destino/<split>/<classe>/<arquivo> a partir do manifesto, com
+    hardlinks, symlinks ou cópias feitos em paralelo. As pastas de split
+    existentes em `destino` são recriadas. Retorna as contagens.
+    """
+    if modo not in MODOS[1:]:
+        raise ValueError(f"Modo de materialização inválido: {modo}")
+    entradas = itens(path)
+    for split in {split for _, _, split in entradas}:
+        shutil.rmtree(os.path.join(destino, split), ignore_errors=True)
+
+    tarefas = []
+    for arquivo, classe, split in entradas:
+        pasta = os.path.join(destino, split, classe) if classe else os.path.join(destino, split)
+        os.makedirs(pasta, exist_ok=True)
+        tarefas.append((arquivo, os.path.join(pasta, os.path.basename(arquivo))))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        copias = sum(executor.map(lambda t: _vincular(t[0], t[1], modo), tarefas))
+    return {"arquivos": len(tarefas), "copias_por_fallback": copias}
@@ -0,0 +1,60 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+pytest.importorskip("mlflow")
+
+import mlflow_tracking  # noqa: E402
+
+
+class ClienteFalso:
+    """Guarda os lotes recebidos; o primeiro log_batch espera `liberar`, para a fila acumular."""
+
+    def __init__(self, atraso_s=0.0):
+        self.lotes = []
+        self.liberar = threading.Event()
+        self.atraso_s = atraso_s
+
+    def log_batch(self, run_id, metrics=(), params=(), tags=()):
+        self.liberar.wait()
+        time.sleep(self.atraso_s)
+        self.lotes.append((len(metrics), len(params), len(tags)))
+
+
+def test_lotes_respeitam_os_limites_do_log_batch():
+    from mlflow.utils import validation
+
+    cliente = ClienteFalso()
+    registro = mlflow_tracking.LoggerAssincrono("run", intervalo_s=0.01, client=cliente)
+    # Um param a cada 20 métricas: sem o limite conjunto, um lote sairia com 1000 métricas + 50 params.
+    for i in range(2400):
+        registro.log_metric("loss", i, step=i)
+        if i % 20 == 0:
+            registro.log_param(f"p{i}", i)
+    registro.set_tag("fase", "teste")
+    cliente.liberar.set()
+    registro.fechar()
+
+    assert registro.erros == 0
+    assert sum(map(sum, cliente.lotes)) == 2400 + 120 + 1
+    for metricas, params, tags in cliente.lotes:
+        assert metricas <= validation.MAX_METRICS_PER_BATCH
+        assert params + tags <= validation.MAX_PARAMS_TAGS_PER_BATCH
+        assert metricas + params + tags <= validation.MAX_ENTITIES_PER_BATCH
+
+
+def test_flush_espera_o_envio_do_ultimo_lote():
+    cliente = ClienteFalso(atraso_s=0.2)
+    registro = mlflow_tracking.LoggerAssincrono("run", intervalo_s=0.01, client=cliente)
+    registro.log_metrics({"a": 1.0, "b": 2.0})
+    assert not registro.flush(timeout=0.05)
+    cliente.liberar.set()
+
+    assert registro.flush()
+    assert sum(map(sum, cliente.lotes)) == 2
+    registro.fechar()
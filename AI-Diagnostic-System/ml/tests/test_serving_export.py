@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import dataset_store  # noqa: E402
+import preprocess  # noqa: E402
+import serving_export  # noqa: E402
+
+tf = pytest.importorskip("tensorflow")
+
+
+def _imagens(quantidade=4, seed=0):
+    """Imagens BGR sintéticas de tamanhos variados: gradientes suaves com um pouco de ruído."""
+    rng = np.random.default_rng(seed)
+    imagens = []
+    for i in range(quantidade):
+        altura, largura = 240 + 40 * i, 320 - 30 * i
+        yy, xx = np.mgrid[0:altura, 0:largura]
+        base = np.stack([xx * 255 / largura, yy * 255 / altura, (xx + yy) * 127 / (altura + largura)], axis=-1)
+        imagens.append(np.clip(base + rng.normal(0, 4, base.shape), 0, 255).astype(np.uint8))
+    return imagens
+
+
+@pytest.fixture(scope="module")
+def exportado(tmp_path_factory):
+    keras = tf.keras
+    entrada = keras.Input((*preprocess.IMG_SIZE[::-1], 3))
+    saida = keras.layers.Dense(3, activation="softmax")(keras.layers.GlobalAveragePooling2D()(entrada))
+    destino = tmp_path_factory.mktemp("serving") / "saved_model"
+    serving_export.exportar(keras.Model(entrada, saida), destino)
+    return destino
+
+
+@pytest.mark.parametrize("extensao", [".png", ".jpg"])
+def test_preprocessar_bytes_reproduz_o_preprocess(exportado, extensao):
+    dados = [cv2.imencode(extensao, imagem)[1].tobytes() for imagem in _imagens()]
+    referencia = np.stack([
+        dataset_store.normalizar(preprocess.redimensionar(cv2.imdecode(np.frombuffer(d, np.uint8), cv2.IMREAD_COLOR)))
+        for d in dados
+    ])
+
+    no_grafo = tf.saved_model.load(str(exportado)).preprocessar_bytes(tf.constant(dados)).numpy()
+
+    assert no_grafo.shape == referencia.shape
+    assert np.abs(no_grafo - referencia).max() <= serving_export.TOLERANCIA_PIXEL
+
+
+def test_verificar_paridade_sem_divergencias(exportado, tmp_path):
+    for i, imagem in enumerate(_imagens()):
+        cv2.imwrite(str(tmp_path / f"img_{i}.jpg"), imagem)
+    (tmp_path / "quebrada.jpg").write_bytes(b"nao e imagem")
+
+    relatorio = serving_export.verificar_paridade(exportado, serving_export.listar_amostra(tmp_path))
+
+    assert relatorio["avaliadas"] == 4
+    assert relatorio["ignoradas"] == [str(tmp_path / "quebrada.jpg")]
+    assert relatorio["divergencias"] == []
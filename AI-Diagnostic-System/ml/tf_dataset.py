@@ -0,0 +1,98 @@
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import dataset_store
+
+AUTOTUNE = tf.data.AUTOTUNE
+SHUFFLE_BUFFER_PADRAO = 1024
+
+
+def _leitor(X):
+    """Retorna (função índice -> imagem, dtype) sem materializar o split inteiro."""
+    if isinstance(X, dataset_store.SplitShards):
+        return (lambda i: X.lote(i, i + 1, normalizado=False)[0]), np.uint8
+    return (lambda i: X[i]), X.dtype
+
+
+def _normalizar(imagens, labels):
+    if imagens.dtype == tf.uint8:
+        imagens = tf.cast(imagens, tf.float32) / 255.0
+    return imagens, labels
+
+
+def construir_dataset(
+    X,
+    y,
+    batch_size,
+    shuffle_buffer=None,
+    cache=None,
+    num_parallel_calls=AUTOTUNE,
+    seed=None,
+    num_shards=1,
+    indice_shard=0,
+    repetir=False,
+):
+    """
+    Monta um tf.data.Dataset que lê as imagens sob demanda a partir de X
+    (SplitShards com memmap ou ndarray), sem copiá-las para um tensor constante.
+
+    - shuffle_buffer: tamanho do buffer de embaralhamento (None desativa).
+    - cache: None desativa, "" faz cache em memória e um caminho faz cache em disco.
+      O cache guarda as imagens ainda em uint8, antes do embaralhamento.
+    - num_shards/indice_shard: lê só a fatia `indice_shard` dos índices (um
+      worker do treino distribuído), antes de qualquer leitura de imagem.
+    - repetir: repete o dataset indefinidamente (o fit define os passos por época).
+    """
+    ler, dtype = _leitor(X)
+    img_shape = tuple(X.shape[1:])
+
+    def carregar(indice, label):
+        imagem = tf.numpy_function(lambda i: np.asarray(ler(int(i)), dtype=dtype), [indice], tf.as_dtype(dtype))
+        imagem.set_shape(img_shape)
+        return imagem, label
+
+    ds = tf.data.Dataset.from_tensor_slices((np.arange(len(X), dtype=np.int64), np.asarray(y)))
+    if num_shards > 1:
+        ds = ds.shard(num_shards, indice_shard)
+    ds = ds.map(carregar, num_parallel_calls=num_parallel_calls)
+    if cache is not None:
+        ds = ds.cache(cache)
+    if shuffle_buffer:
+        ds = ds.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    if repetir:
+        ds = ds.repeat()
+    ds = ds.batch(batch_size)
+    ds = ds.map(_normalizar, num_parallel_calls=num_parallel_calls)
+
+    options = tf.data.Options()
+    options.deterministic = not shuffle_buffer
+    return ds.with_options(options).prefetch(AUTOTUNE)
+
+
+def medir_throughput(ds, passos=None):
+    """Percorre `ds` (até `passos` lotes) e retorna imagens por segundo."""
+    total = 0
+    inicio = time.perf_counter()
+    for i, (imagens, _) in enumerate(ds):
+        total += int(imagens.shape[0])
+        if passos is not None and i + 1 >= passos:
+            break
+    duracao = time.perf_counter() - inicio
+    return total / duracao if duracao > 0 else 0.0
+
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """Mede imagens/s de cada época de treino e guarda em `historico`."""
+
+    def __init__(self, num_imagens):
+        super().__init__()
+        self.num_imagens = num_imagens
+        self.historico = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._inicio = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.historico.append(self.num_imagens / (time.perf_counter() - self._inicio))
@@ -5,42 +5,42 @@ import time
 import json
 import argparse
 from pathlib import Path
-import matplotlib.pyplot as plt
 
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
-from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import classification_report, confusion_matrix
-import mlflow
-import mlflow.keras
+
+import dataset_store
+import distillation
+import instrumentation
+import mlflow_tracking
 
 ROOT = Path(__file__).resolve().parents[1]
 PROCESSED_PATH = ROOT / "data" / "processed" / "dataset_prepared.npz"
+SHARDS_PATH = ROOT / "data" / "processed" / "dataset_shards"
 MODELS_DIR = ROOT / "models"
+INSTRUMENTACAO_DIR = ROOT / "data" / "instrumentacao"
+EMBEDDINGS_DIR = ROOT / "data" / "embeddings"
 DEFAULT_EPOCHS = 50 
 BATCH_SIZE = 32
 IMG_SHAPE = (224, 224, 3)
 RANDOM_SEED = 42
 LEARNING_RATE = 1e-4 
+DROPOUT = 0.7
+UNIDADES_DENSAS = 128
 
-tf.random.set_seed(RANDOM_SEED)
 np.random.seed(RANDOM_SEED)
 
-def carregar_dataset(npz_path: Path):
-    if not npz_path.exists():
-        raise FileNotFoundError(f"Arquivo de dataset não encontrado: {npz_path}")
-    data = np.load(npz_path, allow_pickle=True)
-    X_train = data["X_train"]
-    y_train = data["y_train"]
-    X_val = data["X_val"]
-    y_val = data["y_val"]
-    X_test = data["X_test"]
-    y_test = data["y_test"]
-    return (X_train, y_train), (X_val, y_val), (X_test, y_test)
+def carregar_dataset(origem: Path):
+    """Aceita tanto o diretório de shards uint8 quanto o .npz legado."""
+    return dataset_store.carregar_splits(origem)
+
+
+def origem_dataset_padrao() -> Path:
+    return SHARDS_PATH if dataset_store.eh_dataset_shards(SHARDS_PATH) else PROCESSED_PATH
 
 
 def codificar_labels(y_train, y_val, y_test):
+    from sklearn.preprocessing import LabelEncoder
+
     le = LabelEncoder()
     le.fit(y_train)
     y_train_enc = le.transform(y_train)
@@ -49,19 +49,32 @@ def codificar_labels(y_train, y_val, y_test):
     num_classes = len(le.classes_)
     return y_train_enc, y_val_enc, y_test_enc, num_classes, le
 
-def construir_modelo_avancado(input_shape, num_classes, base_model_trainable=False):
-    data_augmentation = keras.Sequential([
-        layers.RandomFlip("horizontal"),
-        layers.RandomRotation(0.1),
-        layers.RandomZoom(0.2),
-        layers.RandomContrast(0.1), 
+def aumento_dados(seed=None):
+    from tensorflow import keras
+    from tensorflow.keras import layers
+
+    return keras.Sequential([
+        layers.RandomFlip("horizontal", seed=seed),
+        layers.RandomRotation(0.1, seed=seed),
+        layers.RandomZoom(0.2, seed=seed),
+        layers.RandomContrast(0.1, seed=seed),
     ], name="data_augmentation")
+
+def construir_modelo_avancado(input_shape, num_classes, base_model_trainable=False, dropout=DROPOUT,
+                              unidades_densas=UNIDADES_DENSAS, learning_rate=LEARNING_RATE):
+    import tensorflow as tf
+    from tensorflow import keras
+    from tensorflow.keras import layers, models
+    from tensorflow.keras.applications import MobileNetV3Large
+
+    data_augmentation = aumento_dados()
     
     base_model = MobileNetV3Large(
         input_shape=input_shape,
         include_top=False, 
         weights="imagenet",
-        pooling="avg" 
+        pooling="avg",
+        name="backbone",
     )
     base_model.trainable = base_model_trainable 
 
@@ -70,20 +83,63 @@ def construir_modelo_avancado(input_shape, num_classes, base_model_trainable=Fal
     x = tf.keras.applications.mobilenet_v3.preprocess_input(x) 
     x = base_model(x, training=False) 
 
-    x = layers.Dropout(0.7)(x) 
-    x = layers.Dense(128, activation="relu", kernel_regularizer=keras.regularizers.l2(0.01))(x) 
+    x = layers.Dropout(dropout, name="head_dropout")(x) 
+    x = layers.Dense(unidades_densas, activation="relu", kernel_regularizer=keras.regularizers.l2(0.01), name="head_dense")(x) 
     out = layers.Dense(num_classes, activation="softmax", name="output_layer")(x)
 
     model = models.Model(inputs=inp, outputs=out, name="iris_mobilenet_tl")
     
     model.compile(
-        optimizer=keras.optimizers.Adam(learning_rate=LEARNING_RATE), 
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate), 
         loss="sparse_categorical_crossentropy",
         metrics=["accuracy"],
     )
     return model
 
+def modelo_inferencia(model):
+    """
+    Reconstrói o modelo sem a camada de data augmentation (identidade na
+    inferência), compartilhando os pesos. O SavedModel exportado fica sem o
+    estado dos geradores aleatórios, o que também permite convertê-lo para TFLite.
+    """
+    from tensorflow.keras import layers, models
+
+    inp = layers.Input(shape=model.input_shape[1:], name="input_layer")
+    x = inp
+    for layer in model.layers[1:]:
+        if layer.name != "data_augmentation":
+            x = layer(x)
+            # Modelos aninhados carregados de um .keras devolvem a saída como lista.
+            x = x[0] if isinstance(x, (list, tuple)) else x
+    return models.Model(inputs=inp, outputs=x, name=model.name)
+
+def verificar_serving(model_save_path, registro):
+    """Paridade das assinaturas com pré-processamento no grafo contra o caminho Python, em imagens de data/raw."""
+    import mlflow
+    import serving_export
+
+    paths = serving_export.listar_amostra()
+    if not paths:
+        print(f"Aviso: sem imagens em {serving_export.RAW_DIR}; paridade do serving não verificada.")
+        return None
+    with instrumentation.etapa("train.paridade_serving"):
+        paridade = serving_export.verificar_paridade(model_save_path, paths)
+    registro.log_metrics({
+        "serving_dif_pixel_max": paridade["dif_pixel_max"],
+        "serving_dif_probabilidade_max": paridade["dif_probabilidade_max"],
+        "serving_concordancia_classe": paridade["concordancia_classe"],
+    })
+    mlflow.log_dict(paridade, "serving_paridade.json")
+    if paridade["divergencias"]:
+        print(f"Aviso: {len(paridade['divergencias'])} de {paridade['avaliadas']} imagens divergem entre o "
+              "pré-processamento no grafo e o Python; veja serving_paridade.json.")
+    return paridade
+
 def log_confusion_matrix_plot(y_true_enc, y_pred, label_names):
+    import matplotlib.pyplot as plt
+    import mlflow
+    from sklearn.metrics import confusion_matrix
+
     fig, ax = plt.subplots(figsize=(10, 10))
     cm = confusion_matrix(y_true_enc, y_pred)
     im = ax.imshow(cm, interpolation='nearest', cmap=plt.cm.Blues)
@@ -109,35 +165,220 @@ def log_confusion_matrix_plot(y_true_enc, y_pred, label_names):
     mlflow.log_figure(fig, "confusion_matrix.png")
     plt.close(fig) 
 
+def medir_ganho_throughput(origem, ds_train, y_train_enc, batch_size, shuffle_buffer, passos=50):
+    """
+    Compara o throughput de entrada do caminho em memória (arrays completos,
+    como o model.fit recebia antes) com o pipeline tf.data. Retorna as métricas.
+    """
+    import tensorflow as tf
+    import tf_dataset
+
+    X_mem, _ = dataset_store.abrir_split(origem, "train")
+    if isinstance(X_mem, dataset_store.SplitShards):
+        X_mem = X_mem.carregar()
+    ds_memoria = tf.data.Dataset.from_tensor_slices((X_mem, y_train_enc)).batch(batch_size)
+    throughput_memoria = tf_dataset.medir_throughput(ds_memoria, passos)
+    del ds_memoria, X_mem
+
+    if ds_train is None:
+        X_lazy, _ = dataset_store.abrir_split(origem, "train")
+        ds_train = tf_dataset.construir_dataset(X_lazy, y_train_enc, batch_size,
+                                                shuffle_buffer=shuffle_buffer, seed=RANDOM_SEED)
+    throughput_tfdata = tf_dataset.medir_throughput(ds_train, passos)
+
+    metricas = {"throughput_memoria_img_s": throughput_memoria, "throughput_tfdata_img_s": throughput_tfdata}
+    if throughput_memoria > 0:
+        metricas["ganho_throughput"] = throughput_tfdata / throughput_memoria
+    return metricas
+
+def preparar_embeddings(model, origem, splits_X, splits_y, batch_size, visoes, cache_dir):
+    """
+    Modo de cache de embeddings: o backbone congelado roda uma vez por split
+    (mais `visoes` aumentos fixos no treino) e as features ficam em disco,
+    indexadas pelos pesos do backbone e pela versão do dataset. Retorna a
+    cabeça compilada, que compartilha os pesos com `model`, os dados de
+    fit/teste já em features e o cache usado.
+    """
+    from tensorflow import keras
+    import embedding_cache
+
+    extrator, cabeca = embedding_cache.dividir_modelo(model)
+    cache = embedding_cache.CacheEmbeddings(cache_dir, embedding_cache.hash_pesos(model.get_layer("backbone")),
+                                            embedding_cache.versao_dataset(origem), visoes, RANDOM_SEED)
+    features = {}
+    for split, X in zip(dataset_store.SPLITS, splits_X):
+        aumentos = [aumento_dados(RANDOM_SEED + v) for v in range(1, visoes + 1)] if split == "train" else ()
+        features[split], calculado = cache.obter(split, X, extrator, batch_size, aumentos)
+        print(f"Embeddings de {split}: {'calculados' if calculado else 'lidos do cache'} ({cache.chave})")
+
+    y_train, y_val, y_test = splits_y
+    treino = np.asarray(features["train"])
+    cabeca.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=LEARNING_RATE),
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    dados_fit = dict(x=treino.reshape(-1, treino.shape[-1]), y=np.tile(y_train, treino.shape[0]),
+                     validation_data=(np.asarray(features["val"][0]), y_val), batch_size=batch_size)
+    dados_teste = dict(x=np.asarray(features["test"][0]), y=y_test)
+    return cabeca, dados_fit, dados_teste, cache
+
+def callbacks_parada():
+    from tensorflow.keras import callbacks
+
+    early_stop = callbacks.EarlyStopping(monitor="val_loss", patience=6, restore_best_weights=True)
+    reduce_lr = callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=3)
+    return [early_stop, reduce_lr]
+
+def dados_distribuidos(estrategia, contexto, treino, validacao, batch_size, shuffle_buffer):
+    """
+    Argumentos de distributed.ajustar. Cada worker lê só a sua fatia do
+    treino. `batch_size` é por réplica: o lote global cresce com o número de
+    réplicas do cluster, e os passos por época cobrem o split de treino uma
+    vez com esse lote (iguais em todos os workers, mesmo com fatias desiguais).
+    """
+    import tf_dataset
+
+    X_train, y_train = treino
+    batch_size_global = batch_size * estrategia.num_replicas_in_sync
+    return dict(
+        chefe=contexto["chefe"],
+        dataset=tf_dataset.construir_dataset(X_train, y_train, batch_size, shuffle_buffer=shuffle_buffer,
+                                             seed=RANDOM_SEED, num_shards=contexto["num_workers"],
+                                             indice_shard=contexto["posicao"], repetir=True),
+        passos_por_epoca=max(1, len(X_train) // batch_size_global),
+        batch_size_global=batch_size_global,
+        validacao=tf_dataset.construir_dataset(*validacao, batch_size),
+    )
+
+def treinar_worker(estrategia, contexto, treino, validacao, num_classes, epochs, batch_size, shuffle_buffer):
+    """
+    Worker não-chefe do treino distribuído: participa dos passos de treino e
+    das decisões de parada, mas não grava checkpoints nem fala com o MLflow.
+    """
+    import distributed
+
+    model = construir_modelo_avancado(IMG_SHAPE, num_classes)
+    dados_fit = dados_distribuidos(estrategia, contexto, treino, validacao, batch_size, shuffle_buffer)
+    historico = distributed.ajustar(model, estrategia, **dados_fit, epochs=epochs,
+                                    callbacks=callbacks_parada(), verbose=False)
+    distributed.encerrar(estrategia)
+    return {"tarefa": f"{contexto['tipo']}:{contexto['indice']}", "epocas": len(historico["loss"])}
+
 def treinar(args):
-    (X_train, y_train), (X_val, y_val), (X_test, y_test) = carregar_dataset(PROCESSED_PATH)
+    import tensorflow as tf
+    import mlflow
+    import mlflow.keras
+    from tensorflow.keras import callbacks, models
+    from sklearn.metrics import classification_report
+
+    import export_tflite
+    import serving_export
+    import tf_dataset
+
+    if args.professor:
+        if args.distribuido or args.cache_embeddings:
+            raise ValueError("--professor não pode ser combinado com --distribuido ou --cache-embeddings")
+        return distillation.treinar_aluno(args)
+
+    tf.random.set_seed(RANDOM_SEED)
+    contexto = estrategia = None
+    if args.distribuido:
+        import distributed
+
+        if args.cache_embeddings:
+            raise ValueError("--distribuido não pode ser combinado com --cache-embeddings")
+        contexto = distributed.configurar_cluster(args.cluster, args.indice_tarefa)
+        # A estratégia precisa existir antes de qualquer operação do TensorFlow.
+        estrategia = distributed.criar_estrategia()
+    shuffle_buffer = args.shuffle_buffer or tf_dataset.SHUFFLE_BUFFER_PADRAO
+    origem = Path(args.dataset) if args.dataset else origem_dataset_padrao()
+    with instrumentation.etapa("train.carregar_dados"):
+        if args.pipeline == "tfdata" or args.cache_embeddings or args.distribuido:
+            # Cada split é aberto de forma lazy; as imagens são lidas lote a lote pelo tf.data.
+            (X_train, y_train), (X_val, y_val), (X_test, y_test) = [
+                dataset_store.abrir_split(origem, split) for split in dataset_store.SPLITS
+            ]
+        else:
+            (X_train, y_train), (X_val, y_val), (X_test, y_test) = carregar_dataset(origem)
     y_train_enc, y_val_enc, y_test_enc, num_classes, label_encoder = codificar_labels(y_train, y_val, y_test)
     label_names = label_encoder.classes_
 
     epochs = args.epochs or DEFAULT_EPOCHS
     batch_size = args.batch_size or BATCH_SIZE
+    if contexto is not None and not contexto["chefe"]:
+        return treinar_worker(estrategia, contexto, (X_train, y_train_enc), (X_val, y_val_enc),
+                              num_classes, epochs, batch_size, shuffle_buffer)
 
     mlflow_tracking_uri = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000")
-    mlflow.set_tracking_uri(mlflow_tracking_uri)
-    mlflow.set_experiment(args.experiment_name or "iris_diagnostic_tl_experiment") 
+    mlflow_tracking.init_mlflow(mlflow_tracking_uri, args.experiment_name or "iris_diagnostic_tl_experiment")
 
     run_name = f"run_tl_{int(time.time())}"
     with mlflow.start_run(run_name=run_name) as run:
         run_id = run.info.run_id
-
-        mlflow.log_param("epochs", epochs)
-        mlflow.log_param("batch_size", batch_size)
-        mlflow.log_param("input_shape", IMG_SHAPE)
-        mlflow.log_param("num_classes", num_classes)
-        mlflow.log_param("model_name", "iris_cnn")
-
-        model = construir_modelo(IMG_SHAPE, num_classes)
+        # Métricas, params e uploads vão por uma fila em background; o treino não espera o servidor.
+        registro = mlflow_tracking.LoggerAssincrono(run_id)
+
+        registro.log_params({
+            "epochs": epochs,
+            "batch_size": batch_size,
+            "input_shape": IMG_SHAPE,
+            "num_classes": num_classes,
+            "model_name": "iris_cnn",
+            "pipeline": args.pipeline,
+        })
+
+        if args.distribuido:
+            ds_test = tf_dataset.construir_dataset(X_test, y_test_enc, batch_size)
+            dados_fit = dados_distribuidos(estrategia, contexto, (X_train, y_train_enc), (X_val, y_val_enc),
+                                           batch_size, shuffle_buffer)
+            dados_teste = dict(x=ds_test)
+            registro.log_params({"num_workers": contexto["num_workers"],
+                                 "batch_size_global": dados_fit["batch_size_global"],
+                                 "shuffle_buffer": shuffle_buffer})
+        elif args.cache_embeddings:
+            pass  # os dados de fit/teste viram features depois que o modelo é construído
+        elif args.pipeline == "tfdata":
+            cache_train = cache_val = None
+            if args.cache is not None:
+                cache_train = f"{args.cache}_train" if args.cache else ""
+                cache_val = f"{args.cache}_val" if args.cache else ""
+            ds_train = tf_dataset.construir_dataset(X_train, y_train_enc, batch_size,
+                                                    shuffle_buffer=shuffle_buffer,
+                                                    cache=cache_train, seed=RANDOM_SEED)
+            ds_val = tf_dataset.construir_dataset(X_val, y_val_enc, batch_size, cache=cache_val)
+            ds_test = tf_dataset.construir_dataset(X_test, y_test_enc, batch_size)
+            dados_fit = dict(x=ds_train, validation_data=ds_val)
+            dados_teste = dict(x=ds_test)
+            registro.log_params({"shuffle_buffer": shuffle_buffer, "cache": args.cache})
+        else:
+            dados_fit = dict(x=X_train, y=y_train_enc, validation_data=(X_val, y_val_enc), batch_size=batch_size)
+            dados_teste = dict(x=X_test, y=y_test_enc)
+
+        if args.comparar_throughput:
+            usa_tfdata = args.pipeline == "tfdata" and not (args.cache_embeddings or args.distribuido)
+            registro.log_metrics(medir_ganho_throughput(origem, ds_train if usa_tfdata else None,
+                                                        y_train_enc, batch_size, shuffle_buffer))
+
+        with instrumentation.etapa("train.construir_modelo"):
+            model = construir_modelo_avancado(IMG_SHAPE, num_classes)
         model.summary(print_fn=lambda s: mlflow.log_text(s + "\\n", "model_summary.txt"))
 
-        early_stop = callbacks.EarlyStopping(monitor="val_loss", patience=6, restore_best_weights=True)
-        reduce_lr = callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=3)
+        modelo_treino = model
+        imagens_por_epoca = len(X_train)
+        if args.distribuido:
+            imagens_por_epoca = dados_fit["passos_por_epoca"] * dados_fit["batch_size_global"]
+        if args.cache_embeddings:
+            with instrumentation.etapa("train.embeddings"):
+                modelo_treino, dados_fit, dados_teste, cache = preparar_embeddings(
+                    model, origem, (X_train, X_val, X_test), (y_train_enc, y_val_enc, y_test_enc), batch_size,
+                    args.visoes_aumentadas, args.cache_dir or EMBEDDINGS_DIR)
+            imagens_por_epoca = len(dados_fit["y"])
+            registro.log_params({"cache_embeddings": cache.chave, "visoes_aumentadas": args.visoes_aumentadas})
+
+        early_stop, reduce_lr = callbacks_parada()
         timestamp = int(time.time())
-        checkpoint_path = MODELS_DIR / f"iris_model_checkpoint_{timestamp}.h5"
+        checkpoint_path = MODELS_DIR / f"iris_model_checkpoint_{timestamp}.keras"
         MODELS_DIR.mkdir(parents=True, exist_ok=True)
         model_checkpoint = callbacks.ModelCheckpoint(
             str(checkpoint_path),
@@ -148,25 +389,34 @@ def treinar(args):
         )
 
         print("\nIniciando treinamento com Transfer Learning...")
-        history = model.fit(
-            X_train, y_train_enc,
-            validation_data=(X_val, y_val_enc),
-            epochs=epochs,
-            batch_size=batch_size,
-            callbacks=[early_stop, reduce_lr, model_checkpoint],
-            verbose=2,
-        )
+        throughput = tf_dataset.ThroughputCallback(imagens_por_epoca)
+        callbacks_fit = [early_stop, reduce_lr, model_checkpoint, throughput, mlflow_tracking.callback_keras(registro)]
+        if args.cache_embeddings:
+            # O ModelCheckpoint salvaria só a cabeça; o modelo completo é salvo depois do fit.
+            callbacks_fit.remove(model_checkpoint)
+        with instrumentation.etapa("train.fit"):
+            if args.distribuido:
+                history = distributed.ajustar(model, estrategia, **dados_fit, epochs=epochs, callbacks=callbacks_fit)
+            else:
+                history = modelo_treino.fit(
+                    **dados_fit,
+                    epochs=epochs,
+                    callbacks=callbacks_fit,
+                    verbose=2,
+                )
+        if args.cache_embeddings:
+            model.save(str(checkpoint_path))
         print("Fase 1 de Treinamento concluída (Fine-tuning apenas do Head).")
 
-        for key, values in history.history.items():
-            for epoch_idx, v in enumerate(values):
-                mlflow.log_metric(f"{key}", v, step=epoch_idx)
+        for epoch_idx, v in enumerate(throughput.historico):
+            registro.log_metric("epoch_throughput_img_s", v, step=epoch_idx)
 
-        test_loss, test_acc = model.evaluate(X_test, y_test_enc, verbose=0)
-        mlflow.log_metric("test_loss", float(test_loss))
-        mlflow.log_metric("test_accuracy", float(test_acc))
+        with instrumentation.etapa("train.evaluate"):
+            test_loss, test_acc = modelo_treino.evaluate(**dados_teste, verbose=0)
+        registro.log_metrics({"test_loss": float(test_loss), "test_accuracy": float(test_acc)})
 
-        y_pred_probs = model.predict(X_test)
+        with instrumentation.etapa("train.predict"):
+            y_pred_probs = modelo_treino.predict(dados_teste["x"])
         y_pred = np.argmax(y_pred_probs, axis=1)
 
         report = classification_report(y_test_enc, y_pred, target_names=label_names, output_dict=True)
@@ -178,6 +428,8 @@ def treinar(args):
         final_model_dir = MODELS_DIR / f"iris_model_final_{timestamp}"
         final_model_dir.mkdir(parents=True, exist_ok=True)
         model_save_path = final_model_dir / "saved_model"
+        with open(final_model_dir / "label_classes.json", "w", encoding="utf-8") as f:
+            json.dump(label_names.tolist(), f)
         
         try:
             model = models.load_model(str(checkpoint_path)) 
@@ -185,10 +437,34 @@ def treinar(args):
         except Exception as e:
             print(f"Aviso: Não foi possível carregar o checkpoint. Usando o modelo final treinado. Erro: {e}")
 
-        model.save(model_save_path, include_optimizer=False)
-        mlflow.keras.log_model(keras_model=model, artifact_path=f"models/iris_model_tl_{timestamp}")
-
-        mlflow.log_artifact(str(model_save_path), artifact_path="saved_models")
+        with instrumentation.etapa("train.salvar"):
+            if args.exportar_serving:
+                serving_export.exportar(modelo_inferencia(model), model_save_path)
+            else:
+                modelo_inferencia(model).export(str(model_save_path))
+        if args.exportar_serving:
+            verificar_serving(model_save_path, registro)
+        with instrumentation.etapa("train.mlflow_log"):
+            # O upload do SavedModel segue em background enquanto o TFLite é gerado.
+            registro.log_artifacts(str(model_save_path), artifact_path="saved_models")
+            mlflow.keras.log_model(model, artifact_path=f"models/iris_model_tl_{timestamp}")
+
+        if args.exportar_tflite:
+            with instrumentation.etapa("train.exportar_tflite"):
+                variantes = export_tflite.exportar_variantes(model_save_path, origem_dataset=origem)
+            for variante, caminho in variantes.items():
+                registro.log_artifact(str(caminho), artifact_path="tflite")
+                registro.log_metric(f"tflite_{variante}_mb", caminho.stat().st_size / 1e6)
+
+        if instrumentation.ativo():
+            registro.log_metrics(instrumentation.metricas_planas())
+        for caminho in instrumentation.salvar(f"train_{timestamp}", str(INSTRUMENTACAO_DIR)):
+            registro.log_artifact(caminho, artifact_path="instrumentacao")
+        registro.fechar()
+        if estrategia is not None:
+            distributed.encerrar(estrategia)
+        if registro.erros:
+            print(f"Aviso: {registro.erros} envio(s) ao MLflow falharam; veja o log.")
 
         print("✅ Treinamento robusto concluído.")
         print(f"Run ID: {run_id}")
@@ -207,6 +483,44 @@ def parse_args():
     parser.add_argument("--epochs", type=int, help="Número de épocas de treinamento")
     parser.add_argument("--batch-size", dest="batch_size", type=int, help="Tamanho do batch")
     parser.add_argument("--experiment-name", type=str, help="Nome do experimento MLflow")
+    parser.add_argument("--dataset", type=str,
+                        help="Diretório de shards ou arquivo .npz (padrão: data/processed/dataset_shards, senão o .npz)")
+    parser.add_argument("--pipeline", choices=["memoria", "tfdata"], default="memoria",
+                        help="Passar arrays completos ao model.fit ou usar o pipeline tf.data em streaming")
+    parser.add_argument("--shuffle-buffer", dest="shuffle_buffer", type=int, default=None,
+                        help="Tamanho do buffer de embaralhamento do tf.data (padrão: 1024)")
+    parser.add_argument("--cache", type=str, default=None,
+                        help="Cache do tf.data: '' para memória ou um prefixo de arquivo para cache em disco")
+    parser.add_argument("--comparar-throughput", dest="comparar_throughput", action="store_true",
+                        help="Medir e logar no MLflow o ganho de throughput do tf.data sobre o caminho em memória")
+    parser.add_argument("--cache-embeddings", dest="cache_embeddings", action="store_true",
+                        help="Treinar só a cabeça sobre features do backbone calculadas uma vez e guardadas em disco")
+    parser.add_argument("--visoes-aumentadas", dest="visoes_aumentadas", type=int, default=2,
+                        help="Visões aumentadas fixas por imagem de treino no cache de embeddings")
+    parser.add_argument("--cache-dir", dest="cache_dir", type=str,
+                        help="Diretório do cache de embeddings (padrão: data/embeddings)")
+    parser.add_argument("--exportar-tflite", dest="exportar_tflite", action="store_true",
+                        help="Gerar as variantes TFLite (dinâmica, float16 e int8) do modelo final e logá-las no MLflow")
+    parser.add_argument("--exportar-serving", dest="exportar_serving", action="store_true",
+                        help="Incluir no SavedModel as assinaturas serve_bytes/serve_uint8, com decode, BGR, resize e "
+                             "normalização no grafo, e verificar a paridade com o pré-processamento em Python")
+    parser.add_argument("--distribuido", action="store_true",
+                        help="Treino data-parallel multi-worker (cluster do TF_CONFIG ou de --cluster/--indice-tarefa); "
+                             "--batch-size passa a ser por réplica")
+    parser.add_argument("--cluster", type=str,
+                        help="Workers do treino distribuído como host:porta,host:porta,... (no lugar do TF_CONFIG)")
+    parser.add_argument("--indice-tarefa", dest="indice_tarefa", type=int,
+                        help="Índice deste processo na lista de --cluster (o 0 é o chefe)")
+    parser.add_argument("--professor", type=str,
+                        help="SavedModel de um modelo treinado: treina um aluno menor por destilação de conhecimento")
+    parser.add_argument("--aluno", choices=distillation.ALUNOS, default=distillation.ALUNOS[0],
+                        help="Arquitetura do aluno na destilação")
+    parser.add_argument("--temperatura-destilacao", dest="temperatura_destilacao", type=float,
+                        default=distillation.TEMPERATURA_PADRAO,
+                        help="Temperatura que suaviza as probabilidades do professor e do aluno")
+    parser.add_argument("--alfa-destilacao", dest="alfa_destilacao", type=float,
+                        default=distillation.ALFA_PADRAO,
+                        help="Peso da entropia cruzada com o rótulo verdadeiro (o resto vai para o termo do professor)")
     return parser.parse_args()
 
 